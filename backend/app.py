@@ -1,27 +1,81 @@
-import feedparser
 import requests
 import datetime
+import logging
 import os
-import sqlite3 # Importar SQLite
-from dateutil import parser as date_parser
-from flask import Flask, jsonify, request, send_from_directory
+import time
+from flask import Flask, abort, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename # Para asegurar nombres de archivo
 from dotenv import load_dotenv
-load_dotenv()
+load_dotenv() # Antes de importar los módulos propios: leen su configuración del entorno al importarse
+import logs # Logging estructurado (texto o JSON)
+import metrics # Métricas en formato Prometheus (/metrics)
+import db # Conexiones SQLite por hilo, WAL y group commit
+import http_client # Pool HTTP compartido, reintentos y circuit breaker por servicio externo
+import news_sources # Descarga concurrente de feeds RSS y GNews
+import news_store # Agregador de noticias en segundo plano + almacenamiento en SQLite
+import dedupe # Agrupamiento de noticias casi duplicadas (MinHash + LSH)
+import relevance # Clasificador de relevancia precompilado
+import cache # Caché en memoria con TTL, LRU y single-flight
+import flood_reports # Consultas por zona (R*Tree), fecha y paginación de reportes
+import geocoding # Caché persistente y limitador de tasa para Nominatim
+import smn_alerts # Alertas del SMN filtradas por región (haversine vectorizado)
+import images # Imágenes de reportes: guardado por hash y miniaturas en segundo plano
+import static_assets # Frontend en memoria, precomprimido y con ETag
+import events # Canal SSE de reportes nuevos y cambios en las alertas del SMN
+import bulk_ingest # Carga masiva de reportes (NDJSON/CSV) en stream
+import clusters # Clusters y mapa de calor de reportes por tile y zoom
+import risk # Motor de predicción de riesgo por celda (/api/predictions)
+import search # Búsqueda de texto completo (FTS5) en reportes y noticias
+import subscriptions # Suscripciones por zona: índice en grilla y cola de avisos
+import export # Exportación de reportes en stream (GeoJSON, NDJSON, CSV)
+import weather_archive # Histórico del clima por estación, guardado por columnas
+
+logs.setup()
+log = logging.getLogger('app')
 
 # --- Configuración de la Aplicación Flask ---
 app = Flask(__name__)
 CORS(app)
 
+# --- Métricas por ruta ---
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # La plantilla de la ruta (no la URL) como etiqueta, para no crear una serie por cada id o archivo
+        route = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return app.response_class(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/upstreams')
+def get_upstreams():
+    """Estado del circuit breaker de cada servicio externo en este proceso (closed, half_open u open)."""
+    return jsonify(http_client.breaker_states())
+
+def upstream_unavailable(e, message):
+    """503 con Retry-After cuando el circuito de la fuente está abierto y no hay datos guardados para servir."""
+    response = jsonify({"error": message, "source": e.source})
+    response.headers['Retry-After'] = str(max(1, round(e.retry_in)))
+    return response, 503
+
 # --- Configuración de la Base de Datos SQLite ---
-DATABASE = 'flood_data.db'
+# Ruta configurable con DATABASE_PATH; conexiones, WAL y PRAGMAs en db.py
+DATABASE = db.DATABASE
 
 # --- Directorio para guardar imágenes de reportes ---
-UPLOAD_FOLDER = 'uploads'
+# Configurable con UPLOAD_FOLDER; images.py crea el directorio y el de miniaturas
+UPLOAD_FOLDER = images.UPLOAD_FOLDER
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'} # Extensiones permitidas para imágenes
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 # NUEVAS RUTAS PARA SERVIR EL FRONTEND (index.html y otros archivos estáticos)
@@ -32,28 +86,31 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # os.path.abspath(os.path.join(..., '../frontend')) sube un nivel y entra en 'frontend'
 FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../frontend'))
 
+# Los archivos se cargan en memoria al iniciar (precomprimidos, con ETag).
+# Con STATIC_WATCH=1 (o con el servidor de desarrollo) se recargan al modificarse.
+frontend_assets = static_assets.StaticAssets(FRONTEND_DIR, watch=os.getenv('STATIC_WATCH', '0') == '1')
+
 @app.route('/')
 def serve_index():
-    print(f"Sirviendo index.html desde: {FRONTEND_DIR}")
-    return send_from_directory(FRONTEND_DIR, 'index.html')
+    return serve_static('index.html')
 
 # Esta ruta es para servir otros archivos estáticos del frontend como CSS, JS personalizados, etc.
 # Si solo tienes index.html y scripts/styles de CDN, esta ruta puede ser menos crítica,
 # pero es buena práctica para cualquier otro archivo en 'frontend/'.
 @app.route('/<path:filename>')
 def serve_static(filename):
-    print(f"Sirviendo archivo estático: {filename} desde: {FRONTEND_DIR}")
-    return send_from_directory(FRONTEND_DIR, filename)
+    response = frontend_assets.response(filename, request)
+    if response is None:
+        abort(404)
+    return response
 
 # ---------------------------------------------------------------------
 # FIN DE LAS RUTAS PARA SERVIR EL FRONTEND
 
 # --- Funciones Auxiliares para la Base de Datos ---
 def get_db_connection():
-    """Establece conexión con la base de datos SQLite."""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row # Permite acceder a las columnas por nombre
-    return conn
+    """Devuelve la conexión SQLite del hilo actual (se reutiliza; `close()` la libera para la próxima petición)."""
+    return db.get_connection()
 
 def init_db():
     """Inicializa la base de datos creando las tablas si no existen."""
@@ -85,6 +142,33 @@ def init_db():
             received_at TEXT NOT NULL
         )
     ''')
+
+    # Índice espacial (R*Tree) y por fecha de los reportes, sincronizado por triggers
+    flood_reports.create_spatial_index(cursor)
+    # Contador de versión de flood_reports (para los ETag de /api/flood-zones)
+    flood_reports.create_change_tracking(cursor)
+
+    # Tablas del agregador de noticias (artículos indexados por link)
+    news_store.create_tables(cursor)
+    # Huellas MinHash e índice LSH para agrupar noticias casi duplicadas
+    dedupe.create_tables(cursor)
+
+    # Caché de geocodificación y estado del limitador de tasa
+    geocoding.create_tables(cursor)
+
+    # Eventos para el canal SSE y estado del vigía de alertas del SMN
+    events.create_tables(cursor)
+    smn_alerts.create_tables(cursor)
+    # Resultados del motor de riesgo y sus entradas (lluvia, nivel de ríos)
+    risk.create_tables(cursor)
+    # Índices de texto completo de reportes y noticias (después de crear sus tablas)
+    search.create_tables(cursor)
+    # Suscripciones por zona, su versión (para rearmar el índice en memoria) y la cola de entregas de avisos
+    subscriptions.create_tables(cursor)
+    # Histórico del clima en bloques por estación, métrica y día
+    weather_archive.create_tables(cursor)
+    # Turnos de las tareas periódicas que corre un solo worker (vigía del SMN, muestreo del clima)
+    db.create_tables(cursor)
     conn.commit()
     conn.close()
 
@@ -118,127 +202,164 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def image_urls(image_filename):
+    """URLs completas de la miniatura (image_url) y del original (image_full_url)."""
+    if not image_filename:
+        return {"image_url": None, "image_full_url": None}
+    base = request.host_url.rstrip('/') + '/api/uploads/'
+    return {"image_url": base + 'thumbs/' + image_filename, "image_full_url": base + image_filename}
+
+def report_to_dict(row):
+    """Convierte una fila de flood_reports en dict, con las URLs completas de la imagen."""
+    report = dict(row)
+    report.update(image_urls(report['image_filename']))
+    return report
+
 # --- Rutas de la API ---
 @app.route('/api/flood-zones', methods=['GET'])
 def get_flood_zones():
-    """Devuelve las zonas de inundación (frecuentes de mock_db y reportadas de SQLite)."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, lat, lng, address, description, water_level, image_filename, timestamp FROM flood_reports ORDER BY timestamp DESC")
-    reported_zones_rows = cursor.fetchall()
-    conn.close()
+    """
+    Devuelve las zonas de inundación (frecuentes de mock_db y reportadas de SQLite).
+    Parámetros opcionales:
+      - bbox=oeste,sur,este,norte: solo reportes dentro de la zona visible del mapa
+      - since / until: ventana de tiempo (fechas ISO, `until` excluido)
+      - limit: reportes por página (por defecto 1000, máximo 5000)
+      - cursor: valor de `next_cursor` de la respuesta anterior, para la página siguiente
+      - since_id: modo incremental, solo los reportes con id mayor (el `high_water` de la respuesta anterior)
+    Todas las respuestas llevan un ETag derivado de la marca de agua de la tabla:
+    si el cliente manda If-None-Match y nada cambió, se responde 304 sin leer los reportes.
+    """
+    try:
+        bbox = flood_reports.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        limit = int(request.args.get('limit', flood_reports.FLOOD_ZONES_DEFAULT_LIMIT))
+        if limit <= 0:
+            raise ValueError("limit debe ser mayor que cero")
+        limit = min(limit, flood_reports.FLOOD_ZONES_MAX_LIMIT)
+        cursor_param = request.args.get('cursor')
+        if cursor_param:
+            flood_reports.decode_cursor(cursor_param)
+        since_id = int(request.args['since_id']) if request.args.get('since_id') else None
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
 
-    reported_zones = []
-    for row in reported_zones_rows:
-        report = dict(row)
-        if report['image_filename']:
-            # Construir la URL completa para la imagen
-            report['image_url'] = request.host_url.rstrip('/') + '/api/uploads/' + report['image_filename']
+    conn = get_db_connection()
+    try:
+        high_water = flood_reports.get_high_water(conn)
+        etag = flood_reports.make_etag(high_water, sorted(request.args.items(multi=True)), request.host_url)
+        if request.if_none_match.contains(etag):
+            not_modified = app.response_class(status=304)
+            not_modified.set_etag(etag)
+            not_modified.headers['Cache-Control'] = 'no-cache'
+            return not_modified
+
+        if since_id is not None:
+            # --- Modo incremental: solo lo nuevo desde el último id que vio el cliente ---
+            rows, has_more = flood_reports.query_reports_since(conn, since_id, bbox=bbox, limit=limit)
+            reported_zones = [report_to_dict(row) for row in rows]
+            new_high_water = reported_zones[-1]['id'] if has_more else max(high_water[0], since_id, *(r['id'] for r in reported_zones))
+            rta = jsonify({
+                "reported": reported_zones,
+                "high_water": new_high_water,
+                "has_more": has_more
+            })
         else:
-            report['image_url'] = None
-        reported_zones.append(report)
-
-    rta = jsonify({
-        "frequent": mock_db_data["frequent_flood_zones"],
-        "reported": reported_zones
-    })
+            reported_zones_rows, next_cursor = flood_reports.query_reports(
+                conn,
+                bbox=bbox,
+                since=request.args.get('since'),
+                until=request.args.get('until'),
+                limit=limit,
+                cursor=cursor_param,
+            )
+            rta = jsonify({
+                "frequent": mock_db_data["frequent_flood_zones"],
+                "reported": [report_to_dict(row) for row in reported_zones_rows],
+                "next_cursor": next_cursor,
+                "high_water": high_water[0]
+            })
+    finally:
+        conn.close()
 
-    print('====================')
-    print(rta)
-    print('====================')
+    rta.set_etag(etag)
+    # El navegador guarda la respuesta pero la revalida siempre (If-None-Match → 304 si no cambió)
+    rta.headers['Cache-Control'] = 'no-cache'
+    return rta
 
+def cluster_response(etag_variant, build):
+    """Respuesta de clusters con ETag por marca de agua: 304 si el cliente ya tiene la versión actual."""
+    conn = get_db_connection()
+    try:
+        high_water = flood_reports.get_high_water(conn)
+        etag = flood_reports.make_etag(high_water, 'clusters', etag_variant)
+        if request.if_none_match.contains(etag):
+            rta = app.response_class(status=304)
+        else:
+            clusters.index.refresh(conn, high_water)
+            rta = jsonify(build())
+    finally:
+        conn.close()
+    rta.set_etag(etag)
+    rta.headers['Cache-Control'] = 'no-cache'
     return rta
 
-@app.route('/api/news', methods=['GET'])
-def get_news():
-    """Devuelve noticias combinadas de RSS locales + API externa, con filtrado de relevancia."""
+@app.route('/api/flood-zones/clusters', methods=['GET'])
+def get_flood_zone_clusters():
+    """
+    Reportes agrupados para el zoom actual del mapa, con tamaño de respuesta acotado.
+    Parámetros:
+      - bbox=oeste,sur,este,norte (obligatorio) y zoom (0 a CLUSTER_MAX_ZOOM)
+      - format=clusters (por defecto: lat, lng, count, max_water_level e id si es un solo reporte)
+        o heatmap ([lat, lng, cantidad] por cluster)
+    Si el bbox abarca demasiados tiles se usa un zoom menor; el usado se devuelve en "zoom".
+    """
+    try:
+        if not request.args.get('bbox'):
+            raise ValueError("falta bbox")
+        bbox = flood_reports.parse_bbox(request.args['bbox'])
+        zoom = int(request.args.get('zoom', '12'))
+        clusters.parse_tile(zoom, 0, 0)
+        fmt = request.args.get('format', 'clusters')
+        if fmt not in ('clusters', 'heatmap'):
+            raise ValueError("format debe ser clusters o heatmap")
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+
+    def build():
+        used_zoom, result = clusters.clusters_for_bbox(bbox, zoom)
+        if fmt == 'heatmap':
+            return {"zoom": used_zoom, "points": clusters.heatmap(result)}
+        return {"zoom": used_zoom, "clusters": result}
+
+    return cluster_response((bbox, zoom, fmt), build)
+
+@app.route('/api/flood-zones/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_flood_zone_tile(z, x, y):
+    """Clusters de un tile z/x/y (esquema de Google Maps/OpenStreetMap)."""
+    try:
+        clusters.parse_tile(z, x, y)
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+    return cluster_response((z, x, y), lambda: {"zoom": z, "x": x, "y": y, "clusters": clusters.tile(z, x, y)})
+
+def collect_news():
+    """Pipeline de noticias: descarga RSS locales + API externa y aplica el filtrado de relevancia.
+    Lo ejecuta el agregador en segundo plano (news_store.py), no las peticiones HTTP."""
     news_items = []
 
-    # --- 1️⃣ Configuración de Palabras Clave para Filtrado (UNIFICADAS) ---
-    # Palabras clave que indican ALTA relevancia para inundaciones
-    keywords_highly_relevant = [
-        "inundación", "desborde", "crecida", "alerta hídrica", "evacuación",
-        "riesgo de inundación", "riada", "temporal", "anegamientos", "caos vehicular",
-        "corte de luz por tormenta", "arroyo", "río", "aluvión"
-    ]
-    # Palabras clave que indican una relevancia MEDIA y que necesitan contexto
-    keywords_medium_relevance = [
-        "lluvia fuerte", "tormenta", "pronóstico", "precipitaciones",
-        "defensa civil", "protección civil", "emergencia climática",
-        "barrio afectado", "vías anegadas", "rescate", "damnificados",
-        "suministro de agua", "infraestructura", "obra hídrica", "lluvia",
-        "anegado", "calles inundadas", "viviendas afectadas",
-        "clima extremo", "granizo", "alerta amarilla", "alerta naranja"
-    ]
-    # Palabras clave a EXCLUIR (si aparecen, la noticia es probablemente irrelevante para tu tema)
-    keywords_to_exclude = [
-        "fútbol", "deporte", "política", "elecciones", "economía", "bolsa",
-        "dólar", "mercado", "inflación", "justicia", "celebridad", "espectáculos",
-        "incendio", "sequía", "pandemia", "vacuna", "salud", "crimen", "seguridad",
-        "noticias internacionales", "turismo", "gastronomía"
-    ]
-    # Nombres de lugares, ríos o zonas específicas de Argentina/Buenos Aires
-    local_keywords = [
-        "ríachuelo", "plata", "conurbano", "buenos aires", "laplata", "capital federal",
-        "tigre", "quilmes", "san fernando", "vicente lópez", "san isidro", "morón",
-        "merlo", "luján", "chascomús", "salado", "la plata", "buenos aires", "caba", "zona sur", "conurbano", "tigre", "quilmes",
-        "avellaneda", "lanús", "brown", "lomas", "ezeiza", "morón", "berazategui",
-        "san isidro", "merlo", "luján", "capital federal", "argentina", # Añadir "argentina" aquí es importante para la API externa
-        "bernal", "solano", "temperley", "adrogue", "claypole", "longchamps", "glew", # Puedes añadir más localidades específicas
-        "burzaco", "ezeiza", "canning", "cañuelas", "brandsen", "ensenda", "berisso",
-        "quilmes", "berazategui", "florencio varela", "solano", "san francisco solano",
-        "malvinas argentinas", "moreno", "general rodríguez", "pilar", "escobar",
-        "san miguel", "jose c. paz", "hurlingham", "ituzaingó", "moron", "merlo",
-        "la matanza", "gregorio de laferrere", "gonzález catán", "virrey del pino",
-        "lomas de zamora", "lanús", "avellaneda", "wilde", "sarandí", "domínico",
-        "monte grande", "esteban echeverría", "almirante brown", "rafael calzada",
-        "marmol", "lavallol", "tristán suárez", "alejandro korn", "san vicente",
-        "presidente perón", "guernica", "mar del plata", "rosario", "córdoba", "mendoza", # Otras ciudades importantes de Argentina
-        "santa fe", "corrientes", "chaco", "formosa", "entre ríos" # Provincias del litoral con riesgo de inundaciones
-    ]
-
-    # --- Función Auxiliar para Filtrado (ahora más robusta y general) ---
-    def is_relevant_article(title, summary, source_name="", link=""):
-        # Combine all text fields that can contain keywords
-        text = (title + " " + summary + " " + source_name + " " + link).lower()
-
-        # Un artículo es relevante si contiene una palabra clave de alta relevancia
-        is_highly_relevant = any(keyword in text for keyword in keywords_highly_relevant)
-
-        # Un artículo es de relevancia media si contiene una palabra clave media Y un término local
-        # Es crucial que las noticias de "lluvia fuerte" estén asociadas a Argentina/localidad.
-        is_medium_and_local = any(keyword in text for keyword in keywords_medium_relevance) and \
-                              any(loc_kw in text for loc_kw in local_keywords)
-
-        # Un artículo es excluido si contiene cualquier palabra clave de exclusión
-        is_excluded = any(keyword in text for keyword in keywords_to_exclude)
-
-        # La lógica de inclusión: (altamente relevante O (media relevancia Y local)) Y NO excluida
-        return (is_highly_relevant or is_medium_and_local) and not is_excluded
-
-    # --- 2️⃣ Procesamiento de Feeds RSS Locales ---
-    # He actualizado algunas URLs con las que tienen más probabilidad de ser feeds RSS válidos.
-    # Aún así, debes verificar cada una manualmente.
-    local_rss_feeds = [
-        {'name': 'Clarín Lo Último', 'url': 'https://www.clarin.com/rss/lo-ultimo/'},
-        {'name': 'Infobae Lo Último', 'url': 'https://www.infobae.com/feeds/rss/'},
-        {'name': 'La Nación Lo Último', 'url': 'https://www.lanacion.com.ar/arc/outboundfeeds/rss/'},
-        {'name': 'Página 12 Sociedad', 'url': 'https://www.pagina12.com.ar/rss/secciones/sociedad/notas'},
-        {'name': 'Ámbito Municipios', 'url': 'https://www.ambito.com/rss/pages/municipios.xml'},
-        {'name': 'TN Últimas Noticias', 'url': 'https://tn.com.ar/feeds/ultimas-noticias.xml'},
-        {'name': 'Diario Crónica Sociedad', 'url': 'https://www.diariocronica.com.ar/rss/sociedad'},
-        {'name': 'La Voz Córdoba Lo Último', 'url': 'https://www.lavoz.com.ar/feeds/ultimas-noticias.xml'},
-        # Quité los que eran claramente páginas web, Facebook, o URLs que no funcionaban como RSS.
-        # Es CRUCIAL que verifiques que estas URLs de RSS son VÁLIDAS.
-    ]
+    # --- 1️⃣ Descarga concurrente de todas las fuentes (RSS locales + GNews) ---
+    # Las fuentes se bajan en paralelo con timeout y GET condicional (ver news_sources.py).
+    # Una fuente lenta o caída no bloquea la respuesta: simplemente no aporta noticias.
+    USE_GNEWS = True
+    source_results, _ = news_sources.fetch_all_sources(use_gnews=USE_GNEWS)
 
-    for feed_info in local_rss_feeds:
-        try:
-            parsed_feed = feedparser.parse(feed_info['url'])
-            if not parsed_feed.entries:
-                print(f"Advertencia: No se encontraron entradas en el feed RSS de {feed_info['name']} ({feed_info['url']}). Puede que la URL no sea válida o esté vacía.")
+    for result in source_results:
+        if result['kind'] == 'rss':
+            feed_info = result['source']
+            if not result['entries']:
+                log.warning("Feed RSS sin entradas: puede que la URL no sea válida o esté vacía",
+                            extra={'source': feed_info['name'], 'url': feed_info['url']})
 
-            for entry in parsed_feed.entries:
+            for entry in result['entries']:
                 title = entry.title if hasattr(entry, 'title') else 'Sin título'
                 link = entry.link if hasattr(entry, 'link') else '#'
                 published_date_str = entry.published if hasattr(entry, 'published') else entry.updated if hasattr(entry, 'updated') else None
@@ -259,147 +380,312 @@ def get_news():
                             image_url = enc.href
                             break
 
-                # --- Aplicar Filtrado de Relevancia para RSS con la función unificada ---
-                if is_relevant_article(title, summary, feed_info['name'], link):
+                # --- Aplicar Filtrado de Relevancia para RSS (clasificador precompilado de relevance.py) ---
+                if relevance.is_relevant_article(title, summary, feed_info['name'], link):
                     news_items.append({
                         'title': title,
                         'source': feed_info['name'],
                         'date': published_date_str,
+                        # feedparser ya trae la fecha interpretada en UTC; se usa esa si está
+                        'published_at': news_store.to_epoch(published_date_str, entry.get('published_parsed') or entry.get('updated_parsed')),
                         'summary': summary,
                         'link': link,
                         'imageUrl': image_url
                     })
-        except Exception as e:
-            print(f"Error al obtener y parsear RSS de {feed_info['name']} ({feed_info['url']}): {e}")
 
-    # 3️⃣ API externa: GNews
-    USE_GNEWS = True
-    if USE_GNEWS:
-        try:
-            GNEWS_API_KEY = os.getenv('GNEWS_API_KEY')
-            if not GNEWS_API_KEY:
-                print("Error: La variable de entorno GNEWS_API_KEY no está configurada.")
-                # Puedes lanzar una excepción o simplemente saltar esta parte
-                # return jsonify({'error': 'GNEWS_API_KEY no configurada'}), 500
-            
-            # Aquí la clave: 'country=ar' ya está bien.
-            # Puedes probar con más artículos si quieres para ver si encuentras más relevantes.
-            # Aumentar 'max' y luego filtrar más agresivamente podría ser útil.
-            gnews_url = f'https://gnews.io/api/v4/search?q=inundaciones&lang=es&country=ar&max=10&apikey={GNEWS_API_KEY}'
-            
-            response = requests.get(gnews_url)
-            response.raise_for_status()
-            gnews_data = response.json()
-
-            # --- Aplicar Filtrado de Relevancia para GNews con la función unificada ---
-            gnews_filtered_articles_count = 0
-            for article in gnews_data.get('articles', []):
+        # 2️⃣ API externa: GNews
+        elif result['kind'] == 'gnews':
+            # --- Aplicar Filtrado de Relevancia para GNews (clasificador precompilado de relevance.py) ---
+            for article in result['entries']:
                 title = article.get('title', 'Sin título')
                 description = article.get('description', '')
                 source_name = article.get('source', {}).get('name', 'GNews Source')
                 link = article.get('url', '#')
 
-                if is_relevant_article(title, description, source_name, link):
+                if relevance.is_relevant_article(title, description, source_name, link):
                     news_items.append({
                         'title': title,
                         'source': source_name,
                         'date': article.get('publishedAt'),
+                        'published_at': news_store.to_epoch(article.get('publishedAt')),
                         'summary': description,
                         'link': link,
                         'imageUrl': article.get('image', '')
                     })
-                    gnews_filtered_articles_count += 1
-                    # Si quieres limitar el número de noticias de GNews que agregas, hazlo aquí
-                    # if gnews_filtered_articles_count >= 5: # Por ejemplo, si solo quieres 5 de GNews
-                    #     break
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error de red o HTTP al obtener datos de GNews: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Respuesta de GNews: {e.response.text}")
-        except Exception as e:
-            print(f"Error inesperado al obtener datos de GNews: {e}")
-    
-    # Ordenamos por fecha descendente
-    def get_date(n):
-        try:
-            return date_parser.parse(n['date'])
-        except (TypeError, ValueError): # Manejar si 'date' es None o no parseable
-            return datetime.datetime.min
-    
-    news_items.sort(key=get_date, reverse=True)
-    return jsonify(news_items)
 
-@app.route('/api/weather', methods=['GET'])
-def get_weather():
-    """Devuelve el pronóstico del tiempo actual usando OpenWeatherMap."""
-    OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')  
-    lat = request.args.get('lat', '-34.8090')  # Almirante Brown por defecto
-    lon = request.args.get('lon', '-58.4060')
+    # Las fechas ya quedaron en epoch UTC (published_at): el orden lo arma news_store por fuente
+    return news_items
 
+@app.route('/api/news', methods=['GET'])
+def get_news():
+    """
+    Devuelve las noticias ya agregadas y filtradas (las actualiza un hilo de fondo), de la más nueva a la más vieja.
+    Parámetros opcionales:
+      - limit: artículos por página (por defecto 20, máximo 100)
+      - before: valor del header X-Next-Cursor de la respuesta anterior, para la página siguiente
+    """
+    try:
+        limit = int(request.args.get('limit', news_store.NEWS_PAGE_SIZE))
+        if limit <= 0:
+            raise ValueError("limit debe ser mayor que cero")
+        limit = min(limit, news_store.NEWS_MAX_PAGE_SIZE)
+        before = news_store.decode_cursor(request.args['before']) if request.args.get('before') else None
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+
+    news_store.ensure_started(collect_news, get_db_connection)
+    conn = get_db_connection()
     try:
-        url = f'https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric&lang=es'
-        response = requests.get(url)
+        news_items, next_cursor, refreshed_at = news_store.get_page(conn, limit, before)
+    finally:
+        conn.close()
+
+    response = jsonify(news_items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if refreshed_at:
+        # "Al día de": momento de la última actualización del agregador
+        response.headers['X-News-As-Of'] = refreshed_at
+        response.last_modified = datetime.datetime.fromisoformat(refreshed_at).astimezone(datetime.timezone.utc)
+    return response
+
+@app.route('/api/news/sources', methods=['GET'])
+def get_news_sources_status():
+    """Devuelve tiempos y fallos por fuente de la última descarga de noticias."""
+    return jsonify(news_sources.last_fetch_report)
+
+@app.route('/api/search', methods=['GET'])
+def search_text():
+    """
+    Búsqueda de texto completo en los reportes (dirección y descripción) y en las noticias guardadas.
+    Parámetros:
+      - q (obligatorio): palabras a buscar, todas obligatorias; cada una también
+        en singular y plural ("calle" encuentra "calles") y "entre comillas" para una frase exacta. Sin importar tildes.
+      - type: reports, news o reports,news (por defecto ambos)
+      - bbox=oeste,sur,este,norte: solo reportes dentro de la zona
+      - since / until: ventana de tiempo (fechas ISO, `until` excluido)
+      - source: solo noticias de esa fuente
+      - limit: resultados por tipo (por defecto 20, máximo 100)
+    Cada resultado trae "score" (BM25, mayor es mejor) y "snippet": fragmento con los términos
+    encontrados entre <mark>, ya escapado para insertarlo como HTML.
+    """
+    try:
+        terms = search.parse_query(request.args.get('q'))
+        kinds = set((request.args.get('type') or 'reports,news').split(','))
+        if not kinds or not kinds <= {'reports', 'news'}:
+            raise ValueError("type debe ser reports, news o reports,news")
+        bbox = flood_reports.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        limit = int(request.args.get('limit', search.SEARCH_DEFAULT_LIMIT))
+        if limit <= 0:
+            raise ValueError("limit debe ser mayor que cero")
+        limit = min(limit, search.SEARCH_MAX_LIMIT)
+        since, until = request.args.get('since'), request.args.get('until')
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+
+    conn = get_db_connection()
+    try:
+        if not search.available(conn):
+            return jsonify({"error": "La búsqueda no está disponible (SQLite sin FTS5)."}), 503
+        result = {"query": search.match_expression(terms)}
+        if 'reports' in kinds:
+            result["reports"] = [
+                dict(report_to_dict(row), score=round(score, 4), snippet=snippet)
+                for row, score, snippet in search.search_reports(conn, terms, bbox=bbox, since=since, until=until, limit=limit)
+            ]
+        if 'news' in kinds:
+            result["news"] = search.search_news(conn, terms, since=since, until=until,
+                                                source=request.args.get('source'), limit=limit)
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+    finally:
+        conn.close()
+    return jsonify(result)
+
+# --- Caché del clima ---
+# El clima no cambia de forma apreciable en pocos km ni en pocos minutos: las coordenadas se
+# redondean a una grilla de WEATHER_GRID_DEG grados (0.05° ≈ 5 km) y cada celda se guarda
+# WEATHER_CACHE_TTL segundos. Si OpenWeatherMap falla se sirve el último valor de la celda.
+WEATHER_GRID_DEG = float(os.getenv('WEATHER_GRID_DEG', '0.05'))
+WEATHER_TIMEOUT = float(os.getenv('WEATHER_TIMEOUT', '5'))
+OPENWEATHER_URL = os.getenv('OPENWEATHER_URL', 'https://api.openweathermap.org/data/2.5/weather')
+weather_cache = cache.SingleFlightCache(
+    'weather',
+    ttl=int(os.getenv('WEATHER_CACHE_TTL', '600')),
+    max_entries=int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '512')),
+    stale_ttl=int(os.getenv('WEATHER_STALE_TTL', '3600')),
+)
+
+def snap_to_grid(value, step):
+    """Redondea una coordenada al centro de celda más cercano de la grilla."""
+    return round(round(value / step) * step, 6)
+
+def fetch_current_weather(lat, lon):
+    """Respuesta cruda de OpenWeatherMap para un punto (la usan la caché y el histórico del clima)."""
+    OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
+    params = {'lat': lat, 'lon': lon, 'appid': OPENWEATHER_API_KEY, 'units': 'metric', 'lang': 'es'}
+    with metrics.upstream_call('OpenWeatherMap'):
+        response = http_client.get(OPENWEATHER_URL, source='OpenWeatherMap', params=params, timeout=WEATHER_TIMEOUT)
         response.raise_for_status()
         data = response.json()
 
-        weather_data = {
-            "location": f"{data['name']}, {data['sys']['country']}",
-            "temperature": data['main']['temp'],
-            "description": data['weather'][0]['description'],
-            "feels_like": data['main']['feels_like'],
-            "humidity": data['main']['humidity'],
-            "wind_speed": data['wind']['speed'],
-            "pressure": data['main']['pressure'],
-            "iconUrl": f"https://openweathermap.org/img/wn/{data['weather'][0]['icon']}@2x.png",
-            "last_updated": datetime.datetime.now().isoformat()
-        }   
+    # La lluvia de la última hora alimenta el motor de riesgo (OpenWeatherMap omite "rain" si no llueve)
+    try:
+        risk.record_rainfall(lat, lon, data.get('rain', {}).get('1h', 0.0))
+    except Exception as e:  # El clima se sirve igual
+        log.warning("No se pudo guardar la lluvia para el motor de riesgo", extra={'error': str(e)})
+    return data
+
+def fetch_weather(lat, lon):
+    """Consulta OpenWeatherMap para una celda de la grilla."""
+    data = fetch_current_weather(lat, lon)
+    return {
+        "location": f"{data['name']}, {data['sys']['country']}",
+        "temperature": data['main']['temp'],
+        "description": data['weather'][0]['description'],
+        "feels_like": data['main']['feels_like'],
+        "humidity": data['main']['humidity'],
+        "wind_speed": data['wind']['speed'],
+        "pressure": data['main']['pressure'],
+        "iconUrl": f"https://openweathermap.org/img/wn/{data['weather'][0]['icon']}@2x.png",
+        "last_updated": datetime.datetime.now().isoformat()
+    }
+
+@app.route('/api/weather', methods=['GET'])
+def get_weather():
+    """Devuelve el pronóstico del tiempo actual usando OpenWeatherMap (cacheado por celda de grilla)."""
+    try:
+        lat = float(request.args.get('lat', '-34.8090'))  # Almirante Brown por defecto
+        lon = float(request.args.get('lon', '-58.4060'))
+    except ValueError:
+        return jsonify({"error": "Parámetros 'lat' y 'lon' inválidos"}), 400
+
+    cell = (snap_to_grid(lat, WEATHER_GRID_DEG), snap_to_grid(lon, WEATHER_GRID_DEG))
+    try:
+        weather_data = weather_cache.get_or_load(cell, lambda: fetch_weather(*cell))
         return jsonify(weather_data)
+    except http_client.CircuitOpenError as e:
+        return upstream_unavailable(e, "OpenWeatherMap no responde; se reintenta en unos segundos.")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+MAX_EPOCH = 253402300799  # 9999-12-31T23:59:59Z: cualquier valor mayor no entra en un INTEGER de SQLite ni tiene sentido
+
+def parse_epoch(value):
+    """Epoch (segundos) o fecha ISO; las fechas sin zona horaria se toman en hora argentina."""
+    epoch = int(value) if value.strip().isdigit() else news_store.to_epoch(value)
+    if epoch is None or not 0 <= epoch <= MAX_EPOCH:
+        raise ValueError(f"fecha inválida: {value}")
+    return epoch
+
+@app.route('/api/weather/history', methods=['GET'])
+def get_weather_history():
+    """
+    Serie histórica de una estación, reducida a min/max/promedio por intervalo.
+    Parámetros:
+      - station: id de la estación (ver /api/weather/stations)
+      - metric: temperature, humidity, pressure, wind_speed o rain_1h (por defecto temperature)
+      - since / until: fechas ISO o epoch (por defecto, los últimos 7 días; `until` excluido)
+      - points: cantidad aproximada de intervalos (por defecto 500, máximo 5000)
+      - bucket: largo de cada intervalo en segundos (en lugar de points)
+    """
+    station = request.args.get('station', smn_alerts.SMN_DEFAULT_REGION)
+    if station not in weather_archive.STATIONS:
+        return jsonify({"error": f"Estación desconocida: {station}"}), 404
+    try:
+        until = parse_epoch(request.args['until']) if request.args.get('until') else int(time.time()) + 1
+        since = parse_epoch(request.args['since']) if request.args.get('since') else until - 7 * 86400
+        points = min(int(request.args.get('points', weather_archive.WEATHER_HISTORY_POINTS)),
+                     weather_archive.WEATHER_HISTORY_MAX_POINTS)
+        bucket = int(request.args['bucket']) if request.args.get('bucket') else None
+        if points <= 0 or (bucket is not None and bucket <= 0):
+            raise ValueError("points y bucket deben ser mayores que cero")
+        if bucket is not None and bucket > MAX_EPOCH:
+            raise ValueError(f"bucket no puede superar {MAX_EPOCH} segundos")
+        if bucket is not None and (until - since) // bucket > weather_archive.WEATHER_HISTORY_MAX_POINTS:
+            raise ValueError(f"el rango no puede tener más de {weather_archive.WEATHER_HISTORY_MAX_POINTS} intervalos")
+        conn = get_db_connection()
+        try:
+            series = weather_archive.history(conn, station, request.args.get('metric', 'temperature'),
+                                             since, until, points=points, bucket_seconds=bucket)
+        finally:
+            conn.close()
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+    return jsonify(series)
+
+@app.route('/api/weather/stations', methods=['GET'])
+def get_weather_stations():
+    """Estaciones del histórico del clima y cuántas lecturas hay guardadas de cada una."""
+    conn = get_db_connection()
+    try:
+        return jsonify(weather_archive.stations(conn))
+    finally:
+        conn.close()
+
+@app.route('/api/weather/cache-stats', methods=['GET'])
+def get_weather_cache_stats():
+    """Devuelve los contadores de aciertos/fallos de la caché del clima."""
+    return jsonify(weather_cache.stats())
+
 @app.route('/api/predictions', methods=['GET'])
 def get_predictions():
-    """Devuelve predicciones de riesgo de inundación (datos mock para Almirante Brown)."""
-    predictions_data = [
-        {
-            "id": 1,
-            "location_name": "Almirante Brown (Adrogué)",
-            "latitude": -34.7937, # Coordenadas más específicas para Adrogué/Brown
-            "longitude": -58.3917,
-            "prediction_time": (datetime.datetime.now() + datetime.timedelta(hours=6)).isoformat(),
-            "risk_level": "Medio",
-            "probability": 0.55,
-            "expected_rainfall_mm_24h": 45,
-            "river_level_change_cm_24h": 8,
-            "recommended_action": "Mantenerse informado, limpiar desagües y asegurar objetos en patios."
-        },
-        {
-            "id": 2,
-            "location_name": "Almirante Brown (Burzaco)",
-            "latitude": -34.8090, # Coordenadas para Burzaco
-            "longitude": -58.4060,
-            "prediction_time": (datetime.datetime.now() + datetime.timedelta(hours=12)).isoformat(),
-            "risk_level": "Bajo",
-            "probability": 0.15,
-            "expected_rainfall_mm_24h": 10,
-            "river_level_change_cm_24h": 0,
-            "recommended_action": "Condiciones normales, sin riesgo inminente en la zona."
-        },
-        {
-            "id": 3,
-            "location_name": "Almirante Brown (Longchamps)",
-            "latitude": -34.8569, # Coordenadas para Longchamps
-            "longitude": -58.4093,
-            "prediction_time": (datetime.datetime.now() + datetime.timedelta(hours=24)).isoformat(),
-            "risk_level": "Alto",
-            "probability": 0.70,
-            "expected_rainfall_mm_24h": 90,
-            "river_level_change_cm_24h": 30,
-            "recommended_action": "Evitar transitar por calles anegadas. Preparar kit de emergencia familiar."
-        }
-    ]
-    return jsonify(predictions_data)
+    """
+    Devuelve las celdas con mayor riesgo de inundación según el motor de riesgo (risk.py).
+    Parámetros opcionales:
+      - lat, lon y radius_km (por defecto 3): solo celdas alrededor de un punto
+      - bbox=oeste,sur,este,norte: solo celdas dentro de la zona
+      - min_level: Bajo, Medio o Alto (por defecto Bajo)
+      - limit: cantidad de celdas (por defecto 10, máximo 500)
+    """
+    try:
+        center = None
+        radius_km = None
+        if request.args.get('lat') or request.args.get('lon'):
+            center = (float(request.args['lat']), float(request.args['lon']))
+            radius_km = float(request.args.get('radius_km', '3'))
+        bbox = flood_reports.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        min_probability = {level: threshold for threshold, level, _ in risk.RISK_LEVELS}[request.args.get('min_level', 'Bajo')]
+        limit = min(int(request.args.get('limit', '10')), 500)
+        if limit <= 0:
+            raise ValueError("limit debe ser mayor que cero")
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+
+    risk.ensure_started()
+    conn = get_db_connection()
+    try:
+        predictions_data, computed_at = risk.predictions(conn, bbox=bbox, center=center, radius_km=radius_km,
+                                                         min_probability=min_probability, limit=limit)
+    finally:
+        conn.close()
+    response = jsonify(predictions_data)
+    if computed_at:
+        response.headers['X-Risk-Computed-At'] = computed_at
+    return response
+
+@app.route('/api/river-levels', methods=['POST'])
+def add_river_levels():
+    """
+    Registra lecturas de nivel de río (entrada del motor de riesgo). Cuerpo JSON:
+    una lectura o una lista, cada una con station, lat, lng, level_cm y opcionalmente
+    observed_at (epoch). Usa el mismo token que la carga masiva de reportes.
+    """
+    if not bulk_ingest.authorized(request.headers.get('Authorization')):
+        return jsonify({"error": "Token de carga inválido o ausente."}), 401
+    readings = request.get_json(silent=True)
+    if isinstance(readings, dict):
+        readings = [readings]
+    if not isinstance(readings, list) or not readings:
+        return jsonify({"error": "Se espera una lectura o una lista de lecturas en JSON"}), 400
+    conn = get_db_connection()
+    try:
+        count = risk.record_river_levels(conn, readings)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Lectura inválida: {e}"}), 400
+    finally:
+        conn.close()
+    return jsonify({"inserted": count}), 201
 
 @app.route('/api/early-warnings', methods=['GET'])
 def get_early_warnings():
@@ -409,90 +695,151 @@ def get_early_warnings():
 @app.route('/api/smn_alerts', methods=['GET'])
 def get_smn_alerts():
     """
-    Obtiene y parsea las alertas a corto plazo del SMN (GeoRSS)
-    y filtra por proximidad a Almirante Brown.
+    Obtiene las alertas a corto plazo del SMN (GeoRSS) y las filtra por región.
+
+    Parámetros (opcionales):
+      region           id de una región configurada, o varios separados por coma
+                       (por defecto SMN_DEFAULT_REGION)
+      lat, lon         filtra alrededor de un punto cualquiera en lugar de una región
+      radius_km        radio para lat/lon (por defecto SMN_DEFAULT_RADIUS_KM)
     """
-    SMN_ALERT_RSS_URL = "https://ssl.smn.gob.ar/feeds/avisocorto_GeoRSS.xml"
-    
-    # Coordenadas de Almirante Brown para filtrar alertas relevantes
-    ALMIRANTE_BROWN_LAT = -34.8090
-    ALMIRANTE_BROWN_LON = -58.4060
-    
-    # Un radio de búsqueda (en grados decimales, aprox 1 grado = 111km)
-    # 0.5 grados = ~55km, debería cubrir Almirante Brown y alrededores.
-    SEARCH_RADIUS_DEG = 0.5 
+    try:
+        if request.args.get('lat') is not None or request.args.get('lon') is not None:
+            lat = float(request.args['lat'])
+            lon = float(request.args['lon'])
+            radius_km = float(request.args.get('radius_km', smn_alerts.SMN_DEFAULT_RADIUS_KM))
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180 and radius_km > 0):
+                raise ValueError("fuera de rango")
+            regions = [smn_alerts.Region('custom', 'Punto consultado', lat=lat, lon=lon, radius_km=radius_km)]
+        else:
+            region_ids = request.args.get('region', smn_alerts.SMN_DEFAULT_REGION).split(',')
+            unknown = [r for r in region_ids if r not in smn_alerts.REGIONS]
+            if unknown:
+                return jsonify({"error": f"Región desconocida: {', '.join(unknown)}",
+                                "regions": sorted(smn_alerts.REGIONS)}), 404
+            regions = [smn_alerts.REGIONS[r] for r in region_ids]
+    except (KeyError, ValueError):
+        return jsonify({"error": "Parámetros inválidos: se espera 'region' o 'lat' y 'lon' numéricos (y 'radius_km' positivo)"}), 400
 
     try:
-        feed = feedparser.parse(SMN_ALERT_RSS_URL)
-        alerts = []
-
-        if feed.bozo: # bozo=1 significa que hubo un error al parsear el feed
-            print(f"Error al parsear el feed RSS del SMN: {feed.bozo_exception}")
-            # Puedes retornar un error o una lista vacía, dependiendo de tu manejo de errores
-            return jsonify({"error": "No se pudieron obtener las alertas del SMN en este momento.", "details": str(feed.bozo_exception)}), 500
-
-        for entry in feed.entries:
-            alert_data = {
-                "title": entry.title if hasattr(entry, 'title') else "Sin título",
-                "link": entry.link if hasattr(entry, 'link') else "#",
-                "summary": entry.summary if hasattr(entry, 'summary') else "Sin descripción",
-                "published": entry.published_parsed if hasattr(entry, 'published_parsed') else None,
-                "location_name": "Desconocida", # Asumimos hasta que encontremos GeoRSS
-                "latitude": None,
-                "longitude": None,
-                "alert_level": "Sin especificar" # Podrías extraerlo del título/sumario si es consistente
-            }
-
-            # Intentar extraer GeoRSS (geometría)
-            # GeoRSS puede estar en entry.georss_point o entry.where.features[0].geometry.coordinates
-            if hasattr(entry, 'georss_point'):
-                try:
-                    lat_str, lon_str = entry.georss_point.split(' ')
-                    alert_data["latitude"] = float(lat_str)
-                    alert_data["longitude"] = float(lon_str)
-                    alert_data["location_name"] = "Coordenadas específicas"
-                except (ValueError, AttributeError):
-                    pass # Si no se puede parsear, sigue sin coordenadas
-
-            # Otra forma de buscar GeoRSS (para el feed avisocorto_GeoRSS.xml)
-            # El feed avisocorto_GeoRSS.xml tiene la ubicación en 'georss_featuretypetag' o 'georss_where'
-            if hasattr(entry, 'gegeorss_featuretypetag') and entry.gegeorss_featuretypetag.startswith('P_'):
-                 alert_data["location_name"] = entry.gegeorss_featuretypetag.replace('P_', '').replace('_', ' ').title()
-
-            # Para el feed avisocorto_GeoRSS.xml, la lat/lon suelen estar en georss_where/gml_point
-            if hasattr(entry, 'georss_where') and hasattr(entry.georss_where, 'gml_point') and hasattr(entry.georss_where.gml_point, 'gml_pos'):
-                try:
-                    coords_str = entry.georss_where.gml_point.gml_pos
-                    lat_lon = coords_str.split(' ')
-                    alert_data["latitude"] = float(lat_lon[0])
-                    alert_data["longitude"] = float(lat_lon[1])
-                except (ValueError, AttributeError, IndexError):
-                    pass
-
-            # Filtra alertas por proximidad a Almirante Brown
-            if alert_data["latitude"] is not None and alert_data["longitude"] is not None:
-                distance_lat = abs(alert_data["latitude"] - ALMIRANTE_BROWN_LAT)
-                distance_lon = abs(alert_data["longitude"] - ALMIRANTE_BROWN_LON)
-                
-                # Un filtro simple por "caja" alrededor de Almirante Brown
-                # Esto es una simplificación, un cálculo de distancia más preciso es haversine
-                if distance_lat <= SEARCH_RADIUS_DEG and distance_lon <= SEARCH_RADIUS_DEG:
-                    alerts.append(alert_data)
-            else:
-                # Si no tiene coordenadas, puedes intentar filtrar por texto en el título/sumario
-                # Esto es menos preciso pero puede ser útil si "Almirante Brown" aparece.
-                if "Almirante Brown" in alert_data["title"] or "Almirante Brown" in alert_data["summary"]:
-                     alerts.append(alert_data)
-
-
-        return jsonify(alerts)
+        return jsonify(smn_alerts.alerts_for(regions))
+    except smn_alerts.FeedError as e:
+        log.warning("Error al parsear el feed RSS del SMN", extra={'error': str(e)})
+        return jsonify({"error": "No se pudieron obtener las alertas del SMN en este momento.", "details": str(e)}), 500
+    except http_client.CircuitOpenError as e:
+        return upstream_unavailable(e, "El Servicio Meteorológico Nacional no responde; se reintenta en unos segundos.")
     except requests.exceptions.RequestException as e:
-        print(f"Error de red al obtener el feed RSS del SMN: {e}")
+        log.warning("Error de red al obtener el feed RSS del SMN", extra={'error': str(e)})
         return jsonify({"error": "Error de conexión al Servicio Meteorológico Nacional."}), 500
     except Exception as e:
-        print(f"Error inesperado al procesar alertas del SMN: {e}")
+        log.exception("Error inesperado al procesar alertas del SMN")
         return jsonify({"error": f"Error interno del servidor al procesar alertas: {str(e)}"}), 500
 
+@app.route('/api/smn_alerts/regions', methods=['GET'])
+def get_smn_regions():
+    """Lista las regiones configuradas para filtrar las alertas del SMN."""
+    return jsonify([region.to_dict() for region in smn_alerts.REGIONS.values()])
+
+@app.route('/api/smn_alerts/cache-stats', methods=['GET'])
+def get_smn_cache_stats():
+    """Devuelve los contadores de la caché del feed del SMN."""
+    return jsonify(smn_alerts.cache_stats())
+
+
+@app.route('/api/events', methods=['GET'])
+def get_events():
+    """
+    Canal Server-Sent Events: reportes nuevos (evento "flood_report") y alertas del
+    SMN nuevas o modificadas ("smn_alert"). Al reconectarse, el navegador manda
+    Last-Event-ID y recibe lo que se perdió.
+
+    Parámetros (opcionales):
+      types            tipos de evento separados por coma (por defecto todos)
+      last_event_id    igual que el header Last-Event-ID, para clientes que no lo envían
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    types = request.args.get('types')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+        types = set(types.split(',')) if types else None
+        if types and not types <= set(events.EVENT_TYPES):
+            raise ValueError("tipo desconocido")
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos: Last-Event-ID debe ser un entero y 'types' uno de "
+                                 + ', '.join(events.EVENT_TYPES)}), 400
+
+    try:
+        stream = events.hub.stream(last_event_id, types)
+    except events.TooManyClients:
+        response = jsonify({"error": "Demasiadas conexiones abiertas; reintente en unos segundos."})
+        response.headers['Retry-After'] = '10'
+        return response, 503
+    response = app.response_class(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Que nginx no acumule el stream
+    return response
+
+# --- Suscripciones a avisos por zona ---
+def subscription_token():
+    return request.headers.get('X-Subscription-Token') or request.args.get('token')
+
+@app.route('/api/subscriptions', methods=['POST'])
+def create_subscription():
+    """
+    Registra una suscripción a los reportes y alertas del SMN de una zona. JSON:
+      name                     nombre (vecino, escuela, hospital...)
+      lat, lng, radius_km      círculo (radio en km, por defecto 1)
+      polygon                  o bien un polígono: [[lat, lng], ...]
+      events                   ["flood_report", "smn_alert"] (por defecto ambos)
+      channel, target          canal de entrega ("file" o "webhook" con la URL en target)
+    La respuesta trae un token que se pide para consultarla o borrarla; no se vuelve a mostrar.
+    Con SUBSCRIPTIONS_WEBHOOK_TOKEN definido, el canal "webhook" exige "Authorization: Bearer <token>".
+    """
+    spec = request.get_json(silent=True)
+    if (isinstance(spec, dict) and spec.get('channel', subscriptions.SUBSCRIPTIONS_DEFAULT_CHANNEL) == 'webhook'
+            and not subscriptions.webhook_authorized(request.headers.get('Authorization'))):
+        return jsonify({"error": "Token para crear webhooks inválido o ausente."}), 401
+    conn = get_db_connection()
+    try:
+        subscription, token = subscriptions.create(conn, spec)
+    except subscriptions.InvalidSubscription as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+    finally:
+        conn.close()
+    return jsonify({"subscription": subscription, "token": token}), 201
+
+@app.route('/api/subscriptions/<int:subscription_id>', methods=['GET'])
+def get_subscription(subscription_id):
+    """Suscripción y cantidad de entregas por estado. Requiere el token (header X-Subscription-Token o ?token=)."""
+    conn = get_db_connection()
+    try:
+        subscription = subscriptions.get(conn, subscription_id, subscription_token())
+    finally:
+        conn.close()
+    if subscription is None:
+        return jsonify({"error": "Suscripción inexistente o token incorrecto"}), 404
+    return jsonify(subscription)
+
+@app.route('/api/subscriptions/<int:subscription_id>', methods=['DELETE'])
+def delete_subscription(subscription_id):
+    """Borra la suscripción y sus avisos pendientes. Requiere el token."""
+    conn = get_db_connection()
+    try:
+        deleted = subscriptions.delete(conn, subscription_id, subscription_token())
+    finally:
+        conn.close()
+    if not deleted:
+        return jsonify({"error": "Suscripción inexistente o token incorrecto"}), 404
+    return '', 204
+
+@app.route('/api/subscriptions/stats', methods=['GET'])
+def subscription_stats():
+    """Cantidad de suscripciones, entregas por estado y eventos pendientes de cruzar."""
+    conn = get_db_connection()
+    try:
+        return jsonify(subscriptions.stats(conn))
+    finally:
+        conn.close()
 
 @app.route('/api/flood-reports', methods=['POST'])
 def add_flood_report():
@@ -522,28 +869,35 @@ def add_flood_report():
         if 'image' in request.files:
             image_file = request.files['image']
             if image_file.filename != '' and allowed_file(image_file.filename):
-                filename = secure_filename(image_file.filename)
-                # Para evitar colisiones de nombres, se podría añadir un timestamp o UUID
-                unique_filename = f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                image_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                image_file.save(image_path)
-                image_filename = unique_filename
-                print(f"Imagen guardada: {image_filename}")
+                # Se guarda por bloques con el hash del contenido como nombre (fotos repetidas no se duplican)
+                try:
+                    image_filename = images.save_upload(image_file.stream)
+                except images.InvalidImage as e:
+                    return jsonify({"message": str(e)}), 400
+                except images.ImageTooLarge as e:
+                    return jsonify({"message": str(e)}), 413
+                images.schedule_thumbnail(image_filename) # La miniatura se genera fuera de la petición
+                log.info("Imagen guardada", extra={'image': image_filename})
             elif image_file.filename != '':
                 # Archivo presente pero no permitido
                 return jsonify({"message": "Tipo de archivo de imagen no permitido."}), 400
 
-        conn = get_db_connection() # La conexión se establece aquí
-        cursor = conn.cursor()
-
         # Usar la tabla 'flood_reports' y las coordenadas recibidas
-        cursor.execute('''
+        insert_sql = '''
             INSERT INTO flood_reports (address, description, lat, lng, water_level, image_filename, timestamp)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (address, description, lat, lng, water_level, image_filename, datetime.datetime.now().isoformat()))
-        conn.commit()
-        report_id = cursor.lastrowid # Obtener el ID del reporte insertado
-        conn.close()
+        '''
+        insert_params = (address, description, lat, lng, water_level, image_filename, datetime.datetime.now().isoformat())
+        if db.DB_GROUP_COMMIT:
+            # Se confirma junto con las otras inserciones concurrentes en una sola transacción
+            report_id = db.group_commit(insert_sql, insert_params)
+        else:
+            conn = get_db_connection() # La conexión se establece aquí
+            with metrics.sqlite_query('flood_reports.insert'):
+                cursor = conn.cursor()
+                cursor.execute(insert_sql, insert_params)
+                conn.commit()
+            report_id = cursor.lastrowid # Obtener el ID del reporte insertado
 
         new_report_data = {
             "id": report_id,
@@ -555,25 +909,104 @@ def add_flood_report():
             "image_filename": image_filename,
             "timestamp": datetime.datetime.now().isoformat()
         }
-        if image_filename: # Construir URL si la imagen fue guardada
-            new_report_data['image_url'] = request.host_url.rstrip('/') + '/api/uploads/' + image_filename
+        if image_filename: # Construir URLs si la imagen fue guardada
+            new_report_data.update(image_urls(image_filename))
 
 
-        print(f"Nuevo reporte guardado en DB: ID {report_id}, Dirección: {address}, Lat: {lat}, Lng: {lng}")
+        log.info("Nuevo reporte guardado", extra={'report_id': report_id, 'address': address, 'lat': lat, 'lng': lng})
+        try:
+            events.publish('flood_report', new_report_data) # Aviso en vivo a los clientes conectados a /api/events
+        except Exception as e: # El reporte ya quedó guardado: no se informa como error al usuario
+            log.warning("No se pudo publicar el evento del reporte", extra={'report_id': report_id, 'error': str(e)})
         return jsonify({"message": "Reporte recibido y guardado con éxito.", "report": new_report_data}), 201
 
     except Exception as e:
-        print(f"Error al añadir reporte de inundación: {e}")
+        log.exception("Error al añadir reporte de inundación")
         return jsonify({"error": str(e)}), 500
     finally:
         # Este bloque se ejecuta SIEMPRE, haya o no un error en el try
         if conn: # Solo cierra la conexión si fue establecida (no es None)
             conn.close()
 
+@app.route('/api/flood-reports/bulk', methods=['POST'])
+def bulk_add_flood_reports():
+    """
+    Carga masiva de reportes. El cuerpo es NDJSON (Content-Type application/x-ndjson)
+    o CSV con encabezado (text/csv), con los campos address, description, lat, lng y
+    opcionalmente water_level y timestamp (ISO 8601). Se procesa en stream.
+
+    Parámetros (opcionales):
+      format           'ndjson' o 'csv' si el Content-Type no lo indica
+      dry_run          1 para solo validar, sin insertar
+
+    Devuelve cuántas filas se insertaron y rechazadas, el rango de ids y los errores por línea.
+    """
+    if not bulk_ingest.authorized(request.headers.get('Authorization')):
+        return jsonify({"error": "Token de carga masiva inválido o ausente."}), 401
+    fmt = bulk_ingest.detect_format(request.args.get('format'), request.mimetype)
+    if fmt is None:
+        return jsonify({"error": "Formato no soportado: use NDJSON (application/x-ndjson) o CSV (text/csv)"}), 415
+
+    result = bulk_ingest.ingest(request.stream, fmt, dry_run=request.args.get('dry_run') == '1')
+    return jsonify(result), 400 if 'aborted' in result else 200
+
+@app.route('/api/flood-reports/export', methods=['GET'])
+def export_flood_reports():
+    """
+    Exporta los reportes en stream, para herramientas GIS. Parámetros (opcionales):
+      format             'geojson' (FeatureCollection, por defecto), 'ndjson' o 'csv'
+      bbox               oeste,sur,este,norte
+      since / until      ventana de tiempo (fechas ISO, `until` excluido)
+      water_level        niveles separados por coma (bajo, medio, alto)
+      min_water_level    nivel mínimo (p. ej. 'medio' incluye medio y alto)
+      gzip               0 para no comprimir aunque el cliente acepte gzip
+    """
+    fmt = request.args.get('format', 'geojson')
+    try:
+        if fmt not in export.FORMATS:
+            raise ValueError("format debe ser uno de: " + ', '.join(export.FORMATS))
+        bbox = flood_reports.parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        water_levels = export.parse_water_levels(request.args.get('water_level'), request.args.get('min_water_level'))
+    except ValueError as e:
+        return jsonify({"error": f"Parámetros inválidos: {e}"}), 400
+
+    compress = request.args.get('gzip') != '0' and request.accept_encodings['gzip'] > 0
+    mimetype, extension = export.FORMATS[fmt]
+    body = export.stream(fmt, bbox=bbox, since=request.args.get('since'), until=request.args.get('until'),
+                         water_levels=water_levels, base_url=request.host_url, compress=compress)
+    response = app.response_class(body, content_type=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="reportes-{datetime.date.today().isoformat()}.{extension}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['X-Accel-Buffering'] = 'no' # Que nginx no acumule el stream
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def immutable_if_hashed(response, filename):
+    """Los archivos nombrados por su hash nunca cambian: el navegador puede guardarlos sin revalidar."""
+    if images.is_content_addressed(filename):
+        response.headers['Cache-Control'] = f'public, max-age={images.IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
 @app.route('/api/uploads/<filename>')
 def uploaded_file(filename):
     """Sirve los archivos de imagen subidos."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=86400)
+    return immutable_if_hashed(response, filename)
+
+@app.route('/api/uploads/thumbs/<filename>')
+def uploaded_thumbnail(filename):
+    """
+    Sirve la miniatura de una imagen subida. Si todavía no existe (o no hay Pillow)
+    se encola y mientras tanto se sirve el original con caché corta.
+    """
+    filename = secure_filename(filename)
+    thumbnail = images.thumbnail_path(filename)
+    if thumbnail:
+        response = send_from_directory(images.THUMBNAIL_FOLDER, thumbnail, max_age=86400)
+        return immutable_if_hashed(response, filename)
+    images.schedule_thumbnail(filename)
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=60)
 
 @app.route('/api/contact', methods=['POST'])
 def handle_contact_form():
@@ -593,20 +1026,21 @@ def handle_contact_form():
             return jsonify({"message": "Nombre, email y mensaje son campos requeridos."}), 400
 
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO contacts (name, email, subject, message, received_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, email, subject, message, datetime.datetime.now().isoformat()))
-        conn.commit()
+        with metrics.sqlite_query('contacts.insert'):
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO contacts (name, email, subject, message, received_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (name, email, subject, message, datetime.datetime.now().isoformat()))
+            conn.commit()
         contact_id = cursor.lastrowid
         # conn.close() # ¡Esta línea se mueve al bloque finally!)
 
-        print(f"Mensaje de contacto guardado en DB: ID {contact_id} de {name} ({email})")
+        log.info("Mensaje de contacto guardado", extra={'contact_id': contact_id})
         return jsonify({"message": "Mensaje recibido y guardado con éxito."}), 201
     except Exception as e:
         # Captura cualquier error que ocurra durante el procesamiento
-        print(f"Error al manejar el formulario de contacto: {e}")
+        log.exception("Error al manejar el formulario de contacto")
         return jsonify({"error": f"Error interno del servidor: {str(e)}"}), 500
     finally:
         # ¡Este bloque se ejecuta SIEMPRE!
@@ -619,32 +1053,63 @@ def geocode():
     if not address:
         return jsonify({"error": "Falta el parámetro 'address'"}), 400
 
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": address,
-        "format": "json",
-        "limit": 1
-    }
-    headers = {
-        "User-Agent": "AlertaInundaciones.IA (klini@ejemplo.com)"  # Personaliza esto
-    }
+    try:
+        result = geocoding.geocode(address)
+    except geocoding.RateLimited:
+        # Demasiadas direcciones nuevas a la vez: el cliente puede reintentar en un momento
+        response = jsonify({"error": "Servicio de geocodificación ocupado, intentá de nuevo en unos segundos"})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+    except http_client.CircuitOpenError as e:
+        return upstream_unavailable(e, "El servicio de geocodificación no responde; intentá de nuevo en unos segundos")
+    except requests.RequestException as e:
+        log.warning("Error al consultar Nominatim", extra={'error': str(e)})
+        return jsonify({"error": "Error al hacer la solicitud al servicio de geocodificación"}), 500
 
-    response = requests.get(url, params=params, headers=headers)
+    if result:
+        return jsonify(result)
+    return jsonify({"error": "No se encontraron resultados para esa dirección"}), 404
 
-    if response.status_code == 200:
-        data = response.json()
-        if data:
-            return jsonify({
-                "latitude": data[0]["lat"],
-                "longitude": data[0]["lon"]
-            })
-        else:
-            return jsonify({"error": "No se encontraron resultados para esa dirección"}), 404
-    else:
-        return jsonify({"error": "Error al hacer la solicitud al servicio de geocodificación"}), 500
-    
+@app.route('/geocode/batch', methods=['POST'])
+def geocode_batch():
+    """
+    Geocodifica varias direcciones sin bloquear: las que están en caché se devuelven
+    ya resueltas y las demás se encolan (status 'pending'); el cliente vuelve a
+    consultar más tarde para obtenerlas.
+    """
+    data = request.get_json(silent=True) or {}
+    addresses = data.get('addresses')
+    if not isinstance(addresses, list) or not all(isinstance(a, str) and a.strip() for a in addresses):
+        return jsonify({"error": "Se espera un JSON con 'addresses': lista de direcciones"}), 400
+    if len(addresses) > geocoding.GEOCODE_BATCH_MAX:
+        return jsonify({"error": f"Máximo {geocoding.GEOCODE_BATCH_MAX} direcciones por consulta"}), 400
+
+    results = geocoding.geocode_batch(addresses)
+    pending = sum(1 for r in results if r["status"] in ("pending", "queue_full"))
+    return jsonify({"results": results, "pending": pending}), 202 if pending else 200
+
+@app.route('/geocode/cache-stats', methods=['GET'])
+def geocode_cache_stats():
+    """Devuelve el estado de la caché de geocodificación y de la cola pendiente."""
+    return jsonify(geocoding.stats())
+
+
+# Asegura que la base de datos y las tablas estén creadas al iniciar
+# (también cuando la app se importa desde gunicorn en lugar de ejecutarse directamente)
+init_db()
+
+def start_background_workers():
+    """
+    Arranca los hilos de fondo del proceso: el cruce y envío de avisos de suscripciones
+    (con el vigía del SMN) y el muestreo del clima. Se llama una vez por worker desde
+    gunicorn (post_worker_init en gunicorn.conf.py) o al ejecutar la app directamente;
+    las tareas que consultan servicios externos se turnan entre workers con db.claim_slot.
+    """
+    subscriptions.ensure_started()
+    weather_archive.ensure_started(fetch_current_weather)
 
 # --- Ejecución de la Aplicación ---
 if __name__ == '__main__':
-    init_db() # Asegura que la base de datos y las tablas estén creadas al iniciar
+    frontend_assets.start_watching() # Modo desarrollo: recarga el frontend al editarlo
+    start_background_workers()
     app.run(debug=True, host='0.0.0.0', port=5000)
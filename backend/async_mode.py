@@ -0,0 +1,42 @@
+"""
+Modo asíncrono: gunicorn con workers gevent (SERVER_MODE=async, ver gunicorn.conf.py).
+
+gevent parchea sockets, hilos, colas y locks al arrancar cada worker, así que el
+mismo código de la app se vuelve cooperativo: mientras una petición espera a
+OpenWeatherMap, Nominatim o el SMN, el worker sigue atendiendo otras. Acá están
+los pocos ajustes que el resto del backend necesita en ese modo; sin gevent
+todas las funciones se comportan como el código sincrónico de siempre.
+"""
+import threading
+
+try:
+    from gevent import monkey
+except ImportError:  # gevent es opcional: solo hace falta para SERVER_MODE=async
+    monkey = None
+
+
+def active():
+    """True si el proceso corre con los hilos parcheados por gevent."""
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def thread_local():
+    """
+    Un threading.local por hilo real del sistema. Con gevent, threading.local pasa a
+    ser por greenlet (uno por petición); db.py usa ese para la conexión de cada
+    greenlet, tomada de un pool para no abrir una conexión nueva en cada petición.
+    """
+    if active():
+        return monkey.get_original('threading', 'local')()
+    return threading.local()
+
+
+def offload(func, *args):
+    """
+    Ejecuta trabajo de CPU en un hilo real del pool de gevent y espera el resultado
+    sin frenar al resto de los greenlets. Sin gevent, llama a la función directamente.
+    """
+    if active():
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
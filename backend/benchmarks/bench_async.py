@@ -0,0 +1,67 @@
+"""
+Modo sync (gunicorn gthread) contra modo async (gunicorn gevent) con carga mixta.
+
+Con los servicios externos falsos lentos (OpenWeatherMap a --weather-latency ms),
+muchos clientes piden el clima de celdas nuevas (cada petición espera al
+servicio) mientras unos pocos piden rutas livianas que solo leen SQLite o
+memoria. Se mide si las rutas livianas siguen respondiendo rápido y cuántas
+peticiones lentas por segundo se completan con los mismos workers.
+
+Uso (desde backend/; necesita gunicorn y gevent):
+    python -m benchmarks.bench_async [--workers 2 --threads 8] [--slow-clients 64 --fast-clients 8]
+                                     [--weather-latency 500] [--duration 15] [--reports 20000]
+"""
+import argparse
+import shutil
+import tempfile
+from argparse import Namespace
+
+from benchmarks import fake_upstreams, loadtest
+
+FAST_SCENARIOS = ('flood_zones_delta', 'index', 'smn_alerts')
+
+
+def run_mode(mode, args):
+    workdir = tempfile.mkdtemp(prefix=f'bench_async_{mode}_')
+    upstreams = fake_upstreams.FakeUpstreams(latency_ms=20, jitter_ms=5,
+                                             overrides={'weather': {'latency_ms': args.weather_latency}}).start()
+    process = None
+    try:
+        env = loadtest.prepare_app_env(upstreams, workdir, args.reports)
+        server_args = Namespace(server='gunicorn', mode=mode, workers=args.workers, threads=args.threads, port=args.port)
+        process, base = loadtest.start_app(server_args, workdir, env)
+        state = loadtest.prepare_state(base)
+        mix = {'weather_cold': args.slow_clients}
+        for name in FAST_SCENARIOS:
+            mix[name] = max(1, args.fast_clients // len(FAST_SCENARIOS))
+        return loadtest.run_mix(mix, base, state, args.duration)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        upstreams.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='hilos por worker en modo sync')
+    parser.add_argument('--slow-clients', type=int, default=64, help='clientes pidiendo el clima de celdas nuevas')
+    parser.add_argument('--fast-clients', type=int, default=6, help='clientes en rutas livianas (repartidos)')
+    parser.add_argument('--weather-latency', type=float, default=500, help='latencia del OpenWeatherMap falso (ms)')
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--reports', type=int, default=20_000)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+    if not shutil.which('gunicorn') or not loadtest.async_mode_available():
+        raise SystemExit("Hacen falta gunicorn y gevent (pip install gunicorn gevent)")
+
+    for mode in ('sync', 'async'):
+        print(f"\n=== modo {mode}: {args.workers} workers"
+              f"{f' x {args.threads} hilos' if mode == 'sync' else ' gevent'} ===")
+        loadtest.print_results(run_mode(mode, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark de alta de reportes: POST /api/flood-reports de a uno (como antes)
+contra la carga masiva en stream de /api/flood-reports/bulk (NDJSON y CSV).
+
+Pasa por el cliente de prueba de Flask (sin red) sobre una base temporal. El
+cuerpo de la carga masiva se genera a medida que el servidor lo lee, así que
+el pico de memoria medido (tracemalloc) es el del servidor, no el del archivo.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_bulk_ingest [filas] [reportes_de_a_uno]
+"""
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from benchmarks.bench_flood_zones import LAT_RANGE, LNG_RANGE
+
+_workdir = tempfile.mkdtemp(prefix='bench_bulk_')
+os.environ['DATABASE_PATH'] = os.path.join(_workdir, 'flood_data.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(_workdir, 'uploads')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app  # noqa: E402  (lee DATABASE_PATH al importarse)
+
+
+class GeneratedBody(io.RawIOBase):
+    """Cuerpo de la petición producido línea por línea, sin armarlo entero en memoria."""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self._pending) < len(buffer):
+            try:
+                self._pending += next(self._lines)
+            except StopIteration:
+                break
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+def fake_report(rng, i):
+    return {
+        'address': f'Calle {i % 3000} {i % 1500}, Almirante Brown',
+        'description': 'Calle anegada, el agua cubre la vereda',
+        'lat': round(rng.uniform(*LAT_RANGE), 6),
+        'lng': round(rng.uniform(*LNG_RANGE), 6),
+        'water_level': rng.choice(['Bajo', 'Medio', 'Alto']),
+    }
+
+
+def ndjson_lines(count, bad_every=1000):
+    rng = random.Random(1)
+    for i in range(count):
+        if bad_every and i % bad_every == 999:
+            yield b'{"address": "sin coordenadas", "description": "x"}\n'
+        else:
+            yield json.dumps(fake_report(rng, i)).encode('utf-8') + b'\n'
+
+
+def csv_lines(count):
+    rng = random.Random(2)
+    yield b'address,description,lat,lng,water_level\n'
+    for i in range(count):
+        r = fake_report(rng, i)
+        yield f'"{r["address"]}","{r["description"]}",{r["lat"]},{r["lng"]},{r["water_level"]}\n'.encode('utf-8')
+
+
+def bulk(lines, content_type, trace_memory=False):
+    # Sin Content-Length y con wsgi.input_terminated, como llega un cuerpo chunked desde gunicorn
+    environ = EnvironBuilder('/api/flood-reports/bulk', method='POST', content_type=content_type).get_environ()
+    environ['wsgi.input'] = GeneratedBody(lines)
+    environ['wsgi.input_terminated'] = True
+    environ.pop('CONTENT_LENGTH', None)
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    app_iter, status, headers = run_wsgi_app(app.app, environ)
+    body = b''.join(app_iter)
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, json.loads(body), peak
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    singles = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    client = app.app.test_client()
+    rng = random.Random(3)
+
+    started = time.perf_counter()
+    for i in range(singles):
+        client.post('/api/flood-reports', data={k: str(v) for k, v in fake_report(rng, i).items()})
+    elapsed = time.perf_counter() - started
+    print(f"{'caso':32s} {'filas':>8s} {'filas/s':>9s} {'rechazadas':>11s} {'pico memoria':>13s}")
+    print(f"{'POST de a uno':32s} {singles:8d} {singles / elapsed:9.0f} {0:11d} {'-':>13s}")
+
+    for name, make_lines, content_type in (
+        ('bulk NDJSON', ndjson_lines, 'application/x-ndjson'),
+        ('bulk CSV', csv_lines, 'text/csv'),
+    ):
+        # El cuerpo se genera antes de medir, para no sumar el costo del cliente al del servidor
+        elapsed, result, _ = bulk(list(make_lines(rows)), content_type)
+        # tracemalloc frena mucho la carga: el pico de memoria se mide en una pasada aparte
+        _, _, peak = bulk(make_lines(rows // 5), content_type, trace_memory=True)
+        total = result['inserted'] + result['rejected']
+        print(f"{name:32s} {result['inserted']:8d} {total / elapsed:9.0f} {result['rejected']:11d} "
+              f"{peak / 1024 / 1024:11.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark de /api/flood-zones/clusters contra /api/flood-zones sobre una
+tabla sintética grande, en los viewports típicos del mapa.
+
+Mide el tamaño de la respuesta y la latencia de los clusters en frío (tiles
+sin calcular), en caliente (tiles en caché) y después de un reporte nuevo
+(solo se recalculan los tiles que lo contienen).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_clusters [cantidad_de_reportes]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_flood_zones import LAT_RANGE, LNG_RANGE, VIEWPORTS
+
+_workdir = tempfile.mkdtemp(prefix='bench_clusters_')
+os.environ['DATABASE_PATH'] = os.path.join(_workdir, 'flood_data.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(_workdir, 'uploads')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import app  # noqa: E402  (lee DATABASE_PATH al importarse)
+import clusters  # noqa: E402
+
+ZOOMS = {'barrio (~2 km)': 16, 'municipio (~10 km)': 14, 'zona sur (~30 km)': 12}
+
+
+def seed(count):
+    rng = random.Random(7)
+    conn = app.get_db_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO flood_reports (address, description, lat, lng, water_level, timestamp)
+            VALUES ('Calle', 'Calle anegada', ?, ?, ?, '2024-05-01T12:00:00')
+        ''', ((rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE), rng.choice(['Bajo', 'Medio', 'Alto']))
+              for _ in range(count)))
+    conn.close()
+
+
+def timed(client, url):
+    started = time.perf_counter()
+    response = client.get(url)
+    return (time.perf_counter() - started) * 1000, len(response.data)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    seed(count)
+    client = app.app.test_client()
+    client.get('/api/flood-zones/clusters?bbox=0,0,0,0&zoom=0')  # Carga inicial del índice en memoria
+    print(f"{count} reportes")
+    print(f"{'viewport':20s} {'flood-zones':>18s} {'clusters frío':>18s} {'caliente':>9s} {'tras alta':>10s}")
+    for name, bbox in VIEWPORTS.items():
+        query = ','.join(str(v) for v in bbox)
+        full_ms, full_bytes = timed(client, f'/api/flood-zones?bbox={query}&limit=5000')
+        url = f'/api/flood-zones/clusters?bbox={query}&zoom={ZOOMS[name]}'
+        cold_ms, cluster_bytes = timed(client, url)
+        warm_ms, _ = timed(client, url)
+        client.post('/api/flood-reports', data={
+            'address': 'Calle', 'description': 'Calle anegada', 'water_level': 'Alto',
+            'lat': str((bbox[1] + bbox[3]) / 2), 'lng': str((bbox[0] + bbox[2]) / 2)})
+        after_ms, _ = timed(client, url)
+        print(f"{name:20s} {full_ms:7.1f} ms {full_bytes / 1024:6.0f} KB {cold_ms:7.1f} ms {cluster_bytes / 1024:6.1f} KB "
+              f"{warm_ms:6.1f} ms {after_ms:7.1f} ms")
+    print(clusters._tile_cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark de concurrencia de SQLite: escritores (alta de reportes) y lectores
+(consultas del mapa) en paralelo, repartidos en varios procesos con varios
+hilos cada uno, como los workers `gthread` de gunicorn.
+
+Modos:
+  original  conexión nueva por operación, journal por defecto (rollback), sin PRAGMAs
+  wal       conexiones por hilo de db.py, WAL y PRAGMAs ajustados
+  group     como `wal`, con las inserciones por group commit
+
+Uso (desde backend/):
+    python -m benchmarks.bench_db_concurrency [--workers 4] [--threads 8] [--writers 4] [--seconds 5]
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db
+import flood_reports
+from benchmarks.bench_flood_zones import seed
+
+INSERT_SQL = '''
+    INSERT INTO flood_reports (address, description, lat, lng, water_level, image_filename, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+VIEWPORT = (-58.45, -34.85, -58.35, -34.75)
+
+
+def legacy_connection(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def writer(mode, path, rng):
+    params = ('Calle falsa 123', 'Agua en la vereda', rng.uniform(-34.9, -34.7), rng.uniform(-58.5, -58.3),
+              'Medio', None, datetime.datetime.now().isoformat())
+    if mode == 'original':
+        conn = legacy_connection(path)
+        try:
+            conn.execute(INSERT_SQL, params)
+            conn.commit()
+        finally:
+            conn.close()
+    elif mode == 'group':
+        db.group_commit(INSERT_SQL, params)
+    else:
+        conn = db.get_connection()
+        conn.execute(INSERT_SQL, params)
+        conn.commit()
+
+
+def reader(mode, path, rng):
+    conn = legacy_connection(path) if mode == 'original' else db.get_connection()
+    try:
+        flood_reports.query_reports(conn, bbox=VIEWPORT, limit=200)
+    finally:
+        conn.close()
+
+
+def run_thread(mode, path, role, seconds, counters, lock, seed_value):
+    rng = random.Random(seed_value)
+    operation = writer if role == 'writer' else reader
+    deadline = time.monotonic() + seconds
+    done = errors = 0
+    latencies = []
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            operation(mode, path, rng)
+            done += 1
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1  # "database is locked" después del timeout
+    with lock:
+        counters[role] += done
+        counters[role + '_errors'] += errors
+        counters[role + '_latency'] += sum(latencies)
+
+
+def run_worker(mode, path, threads, writers, seconds, counters, lock, worker_id):
+    """Un proceso 'worker' con `threads` hilos, de los cuales `writers` escriben."""
+    db.DATABASE = path
+    pool = []
+    for i in range(threads):
+        role = 'writer' if i < writers else 'reader'
+        t = threading.Thread(target=run_thread, args=(mode, path, role, seconds, counters, lock, worker_id * 1000 + i))
+        t.start()
+        pool.append(t)
+    for t in pool:
+        t.join()
+
+
+def prepare(workdir, mode, rows):
+    path = os.path.join(workdir, f'{mode}.db')
+    conn = seed(path, rows)
+    flood_reports.create_spatial_index(conn.cursor())
+    flood_reports.create_change_tracking(conn.cursor())
+    conn.commit()
+    if mode != 'original':
+        conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4, help='procesos (workers de gunicorn)')
+    parser.add_argument('--threads', type=int, default=8, help='hilos por proceso')
+    parser.add_argument('--writers', type=int, default=4, help='hilos escritores por proceso')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=50_000, help='reportes iniciales')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_db_')
+    print(f"{args.workers} procesos x {args.threads} hilos ({args.writers} escritores por proceso), "
+          f"{args.seconds:.0f} s por modo, {args.rows} reportes iniciales\n")
+    print(f"{'modo':10s} {'escrituras/s':>13s} {'lat. media':>11s} {'errores':>8s} {'lecturas/s':>11s} {'lat. media':>11s} {'errores':>8s}")
+    for mode in ('original', 'wal', 'group'):
+        path = prepare(workdir, mode, args.rows)
+        manager = multiprocessing.Manager()
+        counters = manager.dict({k: 0 for k in ('writer', 'writer_errors', 'writer_latency',
+                                                 'reader', 'reader_errors', 'reader_latency')})
+        lock = manager.Lock()
+        procs = [
+            multiprocessing.Process(target=run_worker, args=(mode, path, args.threads, args.writers, args.seconds, counters, lock, w))
+            for w in range(args.workers)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        w, r = counters['writer'], counters['reader']
+        w_lat = counters['writer_latency'] / w * 1000 if w else 0
+        r_lat = counters['reader_latency'] / r * 1000 if r else 0
+        print(f"{mode:10s} {w / args.seconds:13.0f} {w_lat:9.2f}ms {counters['writer_errors']:8d} "
+              f"{r / args.seconds:11.0f} {r_lat:9.2f}ms {counters['reader_errors']:8d}")
+        manager.shutdown()
+
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
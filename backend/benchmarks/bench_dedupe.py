@@ -0,0 +1,116 @@
+"""
+Benchmark del agrupamiento de noticias casi duplicadas (dedupe.py).
+
+Genera notas sintéticas en las que cada historia aparece en varios medios
+con el título y el resumen levemente cambiados, y compara:
+  - MinHash + índice LSH en SQLite (lo que usa el agregador), en una primera
+    corrida y en una segunda con pocos artículos nuevos;
+  - la comparación de todos contra todos de las mismas huellas.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_dedupe [historias] [copias_por_historia]
+"""
+import random
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import dedupe
+
+# Vocabulario: palabras reales del tema más pseudo-palabras, para que historias distintas no se parezcan
+_vocabulary_rng = random.Random(0)
+WORDS = ('lluvia tormenta alerta arroyo desborde calles anegadas vecinos evacuados barrio municipio '
+         'servicio meteorologico nacional defensa civil zona sur conurbano intensas precipitaciones').split() + [
+    ''.join(_vocabulary_rng.choice('abcdefghijlmnoprstuv') for _ in range(_vocabulary_rng.randint(4, 10)))
+    for _ in range(5000)]
+SOURCES = ('Clarín', 'Infobae', 'La Nación', 'TN', 'Página 12', 'Perfil', 'GNews')
+
+
+def story(rng):
+    title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(7, 11))).capitalize()
+    summary = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(25, 40)))
+    return title, summary
+
+
+def variant(rng, title, summary):
+    """Otra versión de la misma nota: algunas palabras del título cambiadas y el resumen recortado."""
+    words = title.split()
+    for _ in range(rng.randint(0, 2)):
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    cut = summary.split()[:rng.randint(20, 40)]
+    return ' '.join(words) + rng.choice(('', ': qué se sabe', ' | EN VIVO')), '<p>' + ' '.join(cut) + '</p>'
+
+
+def generate(stories, copies, seed=1, prefix='n'):
+    rng = random.Random(seed)
+    items = []
+    for s in range(stories):
+        title, summary = story(rng)
+        for c in range(rng.randint(1, copies)):
+            t, body = (title, summary) if c == 0 else variant(rng, title, summary)
+            items.append({'title': t, 'summary': body, 'source': SOURCES[c % len(SOURCES)],
+                          'link': f'https://{prefix}.example/{s}/{c}', 'story': s})
+    rng.shuffle(items)
+    return items
+
+
+def quality(items, clusters):
+    """(pares de la misma historia juntados, pares de historias distintas juntados por error)."""
+    by_link = dict(clusters)
+    found = false = total = 0
+    groups = {}
+    for item in items:
+        groups.setdefault(by_link[item['link']], []).append(item['story'])
+    for members in groups.values():
+        for i in range(len(members)):
+            for j in range(i + 1, len(members)):
+                if members[i] == members[j]:
+                    found += 1
+                else:
+                    false += 1
+    stories = {}
+    for item in items:
+        stories[item['story']] = stories.get(item['story'], 0) + 1
+    total = sum(n * (n - 1) // 2 for n in stories.values())
+    return found, total, false
+
+
+def main():
+    stories = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    copies = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    items = generate(stories, copies)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE news_articles (link TEXT PRIMARY KEY)')
+    dedupe.create_tables(conn.cursor())
+
+    started = time.perf_counter()
+    with conn:
+        duplicates = dedupe.assign_clusters(conn, items)
+    lsh_ms = (time.perf_counter() - started) * 1000
+    clusters = conn.execute('SELECT link, cluster FROM news_fingerprints').fetchall()
+    found, total, false = quality(items, clusters)
+    print(f"{len(items)} artículos de {stories} historias")
+    print(f"{'MinHash + LSH, primera corrida':36s} {lsh_ms:8.0f} ms  duplicados: {duplicates}  "
+          f"pares encontrados: {found}/{total}  falsos: {false}")
+
+    extra = generate(50, copies, seed=2, prefix='m')
+    started = time.perf_counter()
+    with conn:
+        duplicates = dedupe.assign_clusters(conn, items + extra)
+    print(f"{'MinHash + LSH, corrida incremental':36s} {(time.perf_counter() - started) * 1000:8.0f} ms  "
+          f"({len(extra)} artículos nuevos, {duplicates} duplicados)")
+
+    matrix = dedupe.signatures([dedupe.normalize(i['title'], i['summary']) for i in items])
+    started = time.perf_counter()
+    pairs = 0
+    for i in range(len(matrix)):
+        # Todos contra todos, vectorizado por fila
+        pairs += int(np.count_nonzero((matrix[i + 1:] == matrix[i]).mean(axis=1) >= dedupe.DEDUPE_THRESHOLD))
+    print(f"{'todos contra todos (solo comparar)':36s} {(time.perf_counter() - started) * 1000:8.0f} ms  "
+          f"pares sobre el umbral: {pairs}  comparaciones: {len(matrix) * (len(matrix) - 1) // 2}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark de la exportación en stream (export.py) contra armar la respuesta
+entera en memoria como /api/flood-zones (fetchall + lista de dicts + un solo
+json.dumps).
+
+Mide el tiempo hasta el primer bloque, el tiempo total y cuánto crece la
+memoria máxima del proceso (ru_maxrss) en cada caso. La memoria máxima nunca
+baja: los casos en stream se miden primero y el de todo en memoria al final.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_export [cantidad_de_reportes]
+"""
+import json
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+
+import db
+import export
+import flood_reports
+from benchmarks.bench_flood_zones import seed
+
+
+def measure(func):
+    """(ms hasta el primer bloque, ms total, bytes, MB que creció la memoria máxima) de un generador de bloques."""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in func():
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline  # KB en Linux
+    return first * 1000, total * 1000, size, growth / 1024
+
+
+def in_memory():
+    """Como /api/flood-zones sin límite: todas las filas en dicts y un solo cuerpo JSON."""
+    conn = db.connect()
+    rows = conn.execute(f"SELECT {flood_reports.REPORT_COLUMNS} FROM flood_reports r ORDER BY r.id").fetchall()
+    yield json.dumps({"reported": [dict(row) for row in rows]}).encode('utf-8')
+    conn.really_close()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    workdir = tempfile.mkdtemp(prefix='bench_export_')
+    db.DATABASE = os.path.join(workdir, 'export.db')
+    seed(db.DATABASE, count)
+    conn = sqlite3.connect(db.DATABASE)
+    flood_reports.create_spatial_index(conn.cursor())
+    conn.commit()
+    conn.close()
+
+    # Las páginas de la base leídas con mmap cuentan en ru_maxrss: se recorren una vez antes de medir
+    for _ in export.stream('csv'):
+        pass
+    for _ in export.stream('csv', bbox=(-58.45, -34.85, -58.35, -34.75)):
+        pass
+
+    print(f"{count} reportes")
+    cases = [(f'stream {fmt}', lambda fmt=fmt: export.stream(fmt)) for fmt in export.FORMATS]
+    cases.append(('stream geojson + gzip', lambda: export.stream('geojson', compress=True)))
+    cases.append(('stream csv, bbox municipio', lambda: export.stream('csv', bbox=(-58.45, -34.85, -58.35, -34.75))))
+    cases.append(('en memoria (fetchall + json.dumps)', in_memory))
+    for label, func in cases:
+        first_ms, total_ms, size, growth_mb = measure(func)
+        print(f"{label:36s} primer bloque {first_ms:8.1f} ms  total {total_ms:8.0f} ms  "
+              f"{size / 1e6:7.1f} MB  memoria +{growth_mb:6.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
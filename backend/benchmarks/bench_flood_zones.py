@@ -0,0 +1,127 @@
+"""
+Benchmark de /api/flood-zones sobre una tabla sintética grande.
+
+Compara la consulta original (todo el historial ordenado por fecha) contra
+consultas por zona visible del mapa con el índice R*Tree y contra el mismo
+filtro por bbox sin índice espacial.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_flood_zones [cantidad_de_reportes]
+"""
+import datetime
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import flood_reports
+
+# Zona aproximada del AMBA donde se generan los reportes
+LAT_RANGE = (-35.10, -34.40)
+LNG_RANGE = (-58.80, -58.10)
+
+# Viewports típicos del mapa (oeste, sur, este, norte)
+VIEWPORTS = {
+    'barrio (~2 km)': (-58.405, -34.805, -58.385, -34.785),
+    'municipio (~10 km)': (-58.45, -34.85, -58.35, -34.75),
+    'zona sur (~30 km)': (-58.55, -34.95, -58.25, -34.65),
+}
+
+CREATE_TABLE = '''
+    CREATE TABLE flood_reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lat REAL NOT NULL,
+        lng REAL NOT NULL,
+        address TEXT NOT NULL,
+        description TEXT NOT NULL,
+        water_level TEXT,
+        image_filename TEXT,
+        timestamp TEXT NOT NULL
+    )
+'''
+
+
+def seed(path, count, seed=7):
+    """Crea una base con `count` reportes distribuidos al azar en el AMBA durante 90 días."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(CREATE_TABLE)
+    start = datetime.datetime(2025, 1, 1)
+    levels = ['Bajo', 'Medio', 'Alto', None]
+    rows = (
+        (rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE), f"Calle {i % 3000} {i % 1500}",
+         "Calle anegada, el agua cubre la vereda", rng.choice(levels), None,
+         (start + datetime.timedelta(seconds=rng.randrange(90 * 86400))).isoformat())
+        for i in range(count)
+    )
+    conn.executemany('''
+        INSERT INTO flood_reports (lat, lng, address, description, water_level, image_filename, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return conn
+
+
+def timed(func, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    workdir = tempfile.mkdtemp(prefix='bench_flood_zones_')
+    plain_path = os.path.join(workdir, 'plain.db')
+    indexed_path = os.path.join(workdir, 'indexed.db')
+
+    print(f"Generando {count} reportes sintéticos en {workdir} ...")
+    plain = seed(plain_path, count)
+    plain.row_factory = sqlite3.Row
+    indexed = seed(indexed_path, count)
+    indexed.row_factory = sqlite3.Row
+    started = time.perf_counter()
+    flood_reports.create_spatial_index(indexed.cursor())
+    indexed.commit()
+    print(f"Índices creados en {time.perf_counter() - started:.1f} s (R*Tree: {flood_reports.has_rtree(indexed)})\n")
+
+    legacy_sql = "SELECT id, lat, lng, address, description, water_level, image_filename, timestamp FROM flood_reports ORDER BY timestamp DESC"
+    ms, rows = timed(lambda: plain.execute(legacy_sql).fetchall(), repeat=1)
+    print(f"{'consulta original (sin filtros)':48s} {ms:9.1f} ms  {len(rows):7d} filas")
+
+    for name, bbox in VIEWPORTS.items():
+        ms_plain, (rows_plain, _) = timed(lambda: flood_reports.query_reports(plain, bbox=bbox))
+        ms_rtree, (rows_rtree, _) = timed(lambda: flood_reports.query_reports(indexed, bbox=bbox))
+        assert [r['id'] for r in rows_plain] == [r['id'] for r in rows_rtree]
+        print(f"{'bbox ' + name + ', sin índices':48s} {ms_plain:9.1f} ms  {len(rows_plain):7d} filas")
+        print(f"{'bbox ' + name + ', R*Tree + índice por fecha':48s} {ms_rtree:9.1f} ms  {len(rows_rtree):7d} filas")
+
+    bbox = VIEWPORTS['municipio (~10 km)']
+    since = '2025-03-01T00:00:00'
+    ms, (rows, _) = timed(lambda: flood_reports.query_reports(indexed, bbox=bbox, since=since))
+    print(f"{'bbox municipio + desde el 1/3, con índices':48s} {ms:9.1f} ms  {len(rows):7d} filas")
+
+    # Recorre todas las páginas de la zona sur para medir el costo de la paginación por cursor
+    def all_pages():
+        total, cursor = 0, None
+        while True:
+            page, cursor = flood_reports.query_reports(indexed, bbox=VIEWPORTS['zona sur (~30 km)'], limit=1000, cursor=cursor)
+            total += len(page)
+            if not cursor:
+                return total
+    ms, total = timed(all_pages, repeat=1)
+    print(f"{'zona sur, todas las páginas de 1000':48s} {ms:9.1f} ms  {total:7d} filas")
+
+    plain.close()
+    indexed.close()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark de páginas de /api/news: parsear y ordenar todas las fechas en cada
+petición (como antes) contra fechas en epoch al guardar + mezcla k-way por
+fuente con cursor (news_store.NewsIndex).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_news_pages [artículos] [fuentes]
+"""
+import datetime
+import random
+import sys
+import time
+
+from dateutil import parser as date_parser
+
+import news_store
+
+FORMATS = ('%a, %d %b %Y %H:%M:%S -0300', '%Y-%m-%dT%H:%M:%SZ', '%a, %d %b %Y %H:%M:%S GMT')
+
+
+def generate(count, sources):
+    rng = random.Random(1)
+    start = datetime.datetime(2024, 5, 1)
+    articles = []
+    for i in range(count):
+        date = start + datetime.timedelta(seconds=rng.randint(0, 3 * 86400))
+        articles.append({'title': f'Nota {i}', 'source': f'Fuente {i % sources}', 'summary': '', 'imageUrl': '',
+                         'link': f'https://example.com/{i}', 'date': date.strftime(rng.choice(FORMATS))})
+    return articles
+
+
+def timed(func, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def old_page(articles, limit):
+    def get_date(n):
+        try:
+            return date_parser.parse(n['date'])
+        except (TypeError, ValueError):
+            return datetime.datetime.min
+    return sorted(articles, key=get_date, reverse=True)[:limit]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    sources = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    articles = generate(count, sources)
+
+    started = time.perf_counter()
+    for article in articles:
+        article['publishedAt'] = news_store.to_epoch(article['date'])
+    ingest_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    index = news_store.NewsIndex(articles, 'bench')
+    build_ms = (time.perf_counter() - started) * 1000
+
+    page, _ = index.page(20)
+    deep = page[-1]
+    for _ in range(count // 40):  # Cursor a mitad de la lista
+        deep = index.page(20, (deep['publishedAt'], deep['link']))[0][-1]
+
+    print(f"{count} artículos en {sources} fuentes")
+    print(f"{'antes: parsear + ordenar todo (por petición)':48s} {timed(lambda: old_page(articles, 20), 3):9.2f} ms")
+    print(f"{'fechas a epoch al guardar (una vez por corrida)':48s} {ingest_ms:9.2f} ms")
+    print(f"{'armar listas por fuente (una vez por corrida)':48s} {build_ms:9.2f} ms")
+    print(f"{'primera página de 20':48s} {timed(lambda: index.page(20)):9.3f} ms")
+    print(f"{'página de 20 a mitad de la lista (before)':48s} "
+          f"{timed(lambda: index.page(20, (deep['publishedAt'], deep['link']))):9.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
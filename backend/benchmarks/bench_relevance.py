@@ -0,0 +1,121 @@
+"""
+Micro-benchmark del filtro de relevancia: función original (listas + `any(... in text)`)
+contra el clasificador precompilado de relevance.py.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_relevance [cantidad_de_articulos]
+"""
+import random
+import sys
+import time
+
+import relevance
+
+# --- Copia de la función original de get_news, para comparar ---
+LEGACY_HIGH = [
+    "inundación", "desborde", "crecida", "alerta hídrica", "evacuación",
+    "riesgo de inundación", "riada", "temporal", "anegamientos", "caos vehicular",
+    "corte de luz por tormenta", "arroyo", "río", "aluvión"
+]
+LEGACY_MEDIUM = list(relevance.KEYWORDS_MEDIUM_RELEVANCE)
+LEGACY_EXCLUDE = list(relevance.KEYWORDS_TO_EXCLUDE)
+LEGACY_LOCAL = [
+    "ríachuelo", "plata", "conurbano", "buenos aires", "laplata", "capital federal",
+    "tigre", "quilmes", "san fernando", "vicente lópez", "san isidro", "morón",
+    "merlo", "luján", "chascomús", "salado", "la plata", "buenos aires", "caba", "zona sur", "conurbano", "tigre", "quilmes",
+    "avellaneda", "lanús", "brown", "lomas", "ezeiza", "morón", "berazategui",
+    "san isidro", "merlo", "luján", "capital federal", "argentina",
+    "bernal", "solano", "temperley", "adrogue", "claypole", "longchamps", "glew",
+    "burzaco", "ezeiza", "canning", "cañuelas", "brandsen", "ensenda", "berisso",
+    "quilmes", "berazategui", "florencio varela", "solano", "san francisco solano",
+    "malvinas argentinas", "moreno", "general rodríguez", "pilar", "escobar",
+    "san miguel", "jose c. paz", "hurlingham", "ituzaingó", "moron", "merlo",
+    "la matanza", "gregorio de laferrere", "gonzález catán", "virrey del pino",
+    "lomas de zamora", "lanús", "avellaneda", "wilde", "sarandí", "domínico",
+    "monte grande", "esteban echeverría", "almirante brown", "rafael calzada",
+    "marmol", "lavallol", "tristán suárez", "alejandro korn", "san vicente",
+    "presidente perón", "guernica", "mar del plata", "rosario", "córdoba", "mendoza",
+    "santa fe", "corrientes", "chaco", "formosa", "entre ríos"
+]
+
+
+def legacy_is_relevant_article(title, summary, source_name="", link=""):
+    text = (title + " " + summary + " " + source_name + " " + link).lower()
+    is_highly_relevant = any(keyword in text for keyword in LEGACY_HIGH)
+    is_medium_and_local = any(keyword in text for keyword in LEGACY_MEDIUM) and \
+                          any(loc_kw in text for loc_kw in LEGACY_LOCAL)
+    is_excluded = any(keyword in text for keyword in LEGACY_EXCLUDE)
+    return (is_highly_relevant or is_medium_and_local) and not is_excluded
+
+
+def legacy_classify(text):
+    """Las cuatro clases con el método original (sin cortocircuito), equivalente a relevance.classify."""
+    text = text.lower()
+    classes = set()
+    for name, keywords in (('high', LEGACY_HIGH), ('medium', LEGACY_MEDIUM),
+                           ('exclude', LEGACY_EXCLUDE), ('local', LEGACY_LOCAL)):
+        if any(keyword in text for keyword in keywords):
+            classes.add(name)
+    return classes
+
+
+FILLER = (
+    "el gobierno anunció nuevas medidas para los vecinos de la zona durante la jornada de hoy "
+    "según informaron fuentes oficiales que participaron de la reunión en el municipio"
+).split()
+ALL_KEYWORDS = LEGACY_HIGH + LEGACY_MEDIUM + LEGACY_EXCLUDE + LEGACY_LOCAL
+
+
+def synthetic_articles(count, seed=42):
+    """Genera artículos con texto de relleno y algunas palabras clave mezcladas."""
+    rng = random.Random(seed)
+    articles = []
+    for i in range(count):
+        words = rng.choices(FILLER, k=rng.randint(30, 60))
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words)), rng.choice(ALL_KEYWORDS))
+        title = ' '.join(words[:10]).capitalize()
+        summary = ' '.join(words[10:])
+        link = f"https://www.ejemplo.com.ar/sociedad/{'-'.join(words[:6])}-{i}"
+        articles.append((title, summary, rng.choice(['Clarín Lo Último', 'Infobae Lo Último', 'TN Últimas Noticias']), link))
+    return articles
+
+
+def bench(func, articles, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for article in articles:
+            func(*article)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def report(label, legacy, compiled, count):
+    print(f"{label}")
+    print(f"  original:   {legacy * 1000:8.1f} ms  ({legacy / count * 1e6:6.1f} µs/artículo)")
+    print(f"  compilado:  {compiled * 1000:8.1f} ms  ({compiled / count * 1e6:6.1f} µs/artículo)")
+    print(f"  aceleración: {legacy / compiled:7.1f}x")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    articles = synthetic_articles(count)
+    texts = [(' '.join(a),) for a in articles]
+    long_articles = [(title, summary * 4, source, link) for title, summary, source, link in articles]
+
+    print(f"Artículos sintéticos: {count}")
+    report("is_relevant_article (filtro booleano, el original corta en la primera coincidencia)",
+           bench(legacy_is_relevant_article, articles), bench(relevance.is_relevant_article, articles), count)
+    report("Clasificación completa (las cuatro clases)",
+           bench(legacy_classify, texts), bench(relevance.classify, texts), count)
+    report("is_relevant_article con resúmenes 4 veces más largos",
+           bench(legacy_is_relevant_article, long_articles), bench(relevance.is_relevant_article, long_articles), count)
+
+    # Las diferencias vienen de la normalización de tildes y del anclaje al inicio de palabra.
+    agree = sum(legacy_is_relevant_article(*a) == relevance.is_relevant_article(*a) for a in articles)
+    print(f"Mismo resultado que la función original en {agree}/{count} artículos")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark del motor de riesgo (risk.py) sobre una grilla de 100k celdas.
+
+Mide por separado el cálculo de variables, la puntuación vectorizada de todas
+las celdas y la corrida incremental completa (diferencias + puntuación +
+escritura en SQLite) cuando cambia un solo reporte.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_risk [celdas] [reportes]
+"""
+import datetime
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import risk
+from benchmarks.bench_flood_zones import LAT_RANGE, LNG_RANGE
+
+
+def timed(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    cells = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    report_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    # Celda cuadrada tal que la zona de los reportes tenga `cells` celdas
+    step = math.sqrt((LAT_RANGE[1] - LAT_RANGE[0]) * (LNG_RANGE[1] - LNG_RANGE[0]) / cells)
+    bbox = f'{LNG_RANGE[0]},{LAT_RANGE[0]},{LNG_RANGE[1]},{LAT_RANGE[1]}'
+    engine = risk.RiskEngine(bbox, step)
+    grid = engine.grid
+
+    rng = np.random.default_rng(7)
+    reports = (rng.uniform(*LAT_RANGE, report_count), rng.uniform(*LNG_RANGE, report_count),
+               rng.integers(0, 4, report_count).astype(float))
+    # Lluvia en la grilla del clima (0.05°) y 12 estaciones de río
+    rain_lat, rain_lng = np.meshgrid(np.arange(*LAT_RANGE, 0.05), np.arange(*LNG_RANGE, 0.05))
+    rain = (rain_lat.ravel(), rain_lng.ravel(), rng.uniform(0, 30, rain_lat.size))
+    rivers = (rng.uniform(*LAT_RANGE, 12), rng.uniform(*LNG_RANGE, 12), rng.uniform(-20, 60, 12))
+    print(f"{len(grid)} celdas ({grid.rows}×{grid.cols}, {step * 111:.2f} km), {report_count} reportes, "
+          f"{len(rain[0])} mediciones de lluvia, {len(rivers[0])} estaciones de río")
+
+    features_ms, features = timed(lambda: risk.compute_features(grid, reports, rain, rivers))
+    score_ms, probabilities = timed(lambda: risk.score(features))
+    print(f"{'variables (todas las celdas)':40s} {features_ms:8.1f} ms")
+    print(f"{'puntuación (todas las celdas)':40s} {score_ms:8.1f} ms")
+    print(f"{'total en memoria':40s} {features_ms + score_ms:8.1f} ms")
+
+    workdir = tempfile.mkdtemp(prefix='bench_risk_')
+    conn = sqlite3.connect(os.path.join(workdir, 'risk.db'))
+    risk.create_tables(conn.cursor())
+    now = datetime.datetime.now().isoformat()
+    started = time.perf_counter()
+    written = engine.update(conn, features, 'inicial', now)
+    print(f"{'primera corrida con escritura':40s} {(time.perf_counter() - started) * 1000:8.1f} ms  ({written} celdas)")
+
+    # Un reporte nuevo: cambian sus celdas y las vecinas
+    lat, lng, level = reports
+    point = random.Random(3)
+    reports = (np.append(lat, point.uniform(*LAT_RANGE)), np.append(lng, point.uniform(*LNG_RANGE)), np.append(level, 3.0))
+    started = time.perf_counter()
+    features = risk.compute_features(grid, reports, rain, rivers)
+    written = engine.update(conn, features, 'un reporte más', now)
+    print(f"{'incremental tras un reporte':40s} {(time.perf_counter() - started) * 1000:8.1f} ms  ({written} celdas)")
+
+    started = time.perf_counter()
+    written = engine.update(conn, features, 'sin cambios', now)
+    print(f"{'incremental sin cambios':40s} {(time.perf_counter() - started) * 1000:8.1f} ms  ({written} celdas)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
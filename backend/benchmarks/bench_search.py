@@ -0,0 +1,103 @@
+"""
+Benchmark de la búsqueda de texto completo (search.py) sobre una tabla
+sintética de reportes.
+
+Compara búsquedas con FTS5 (término raro, término muy común, varias palabras,
+frase, con filtros de zona y de tiempo) contra LIKE '%...%', que recorre la
+tabla entera.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_search [cantidad_de_reportes]
+"""
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import flood_reports
+import news_store
+import search
+from benchmarks.bench_flood_zones import CREATE_TABLE, LAT_RANGE, LNG_RANGE, VIEWPORTS, timed
+
+BARRIOS = ('Morón', 'Lanús', 'Quilmes', 'Avellaneda', 'La Matanza', 'Tigre', 'San Isidro', 'Palermo',
+           'Belgrano', 'Flores', 'Lomas de Zamora', 'Berazategui', 'Merlo', 'Moreno', 'Cañuelas', 'Ezeiza')
+FRASES = ('Calle anegada, el agua cubre la vereda', 'El arroyo se desbordó y entró agua a las casas',
+          'Desagüe tapado en la esquina', 'Autos varados por el agua', 'Se cortó la luz en la cuadra',
+          'Vecinos evacuados por la crecida', 'Árbol caído bloquea la calle', 'Sumidero colapsado',
+          'El agua llega a la rodilla', 'Paso bajo nivel inundado, no se puede cruzar')
+
+QUERIES = {
+    'término raro': 'zanjon',
+    'término común': 'agua',
+    'dos palabras': 'arroyo casas',
+    'frase': '"paso bajo nivel"',
+    'mayúsculas, sin tilde, plural': 'MORON desagues',
+}
+
+
+def seed(path, count, seed=11):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(CREATE_TABLE)
+    # 20000 calles inventadas y una real, que queda como término raro (~50 reportes por millón)
+    streets = [f"{rng.choice(('Av.', 'Calle', 'Pasaje'))} {''.join(rng.choice('abcdefgilmnoprstu') for _ in range(rng.randint(5, 9))).capitalize()}"
+               for _ in range(20000)] + ['Zanjón Las Piedras']
+    start = datetime.datetime(2025, 1, 1)
+    step = 90 * 86400 / count  # Los reportes llegan en orden: el id crece con la fecha, como en la tabla real
+    rows = (
+        (rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE),
+         f"{rng.choice(streets)} {rng.randint(1, 9999)}, {rng.choice(BARRIOS)}",
+         ' '.join(rng.sample(FRASES, rng.randint(1, 3))), rng.choice(('Bajo', 'Medio', 'Alto', None)), None,
+         (start + datetime.timedelta(seconds=i * step)).isoformat())
+        for i in range(count)
+    )
+    conn.executemany('''
+        INSERT INTO flood_reports (lat, lng, address, description, water_level, image_filename, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    return conn
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workdir = tempfile.mkdtemp(prefix='bench_search_')
+    conn = seed(os.path.join(workdir, 'search.db'), count)
+    conn.row_factory = sqlite3.Row
+    flood_reports.create_spatial_index(conn.cursor())
+    flood_reports.create_change_tracking(conn.cursor())
+    news_store.create_tables(conn.cursor())
+    started = time.perf_counter()
+    search.create_tables(conn.cursor())
+    conn.commit()
+    print(f"{count} reportes; índice FTS5 armado en {time.perf_counter() - started:.1f} s")
+
+    for label, query in QUERIES.items():
+        terms = search.parse_query(query)
+        # La primera búsqueda de cada término cuenta sus documentos (queda en caché SEARCH_DF_TTL)
+        cold_ms, _ = timed(lambda: search.search_reports(conn, terms), repeat=1)
+        ms, results = timed(lambda: search.search_reports(conn, terms))
+        print(f"{'FTS5 ' + label:42s} {ms:8.2f} ms  ({len(results)} resultados, primera vez {cold_ms:.1f} ms)  "
+              f"{search.match_expression(terms)}")
+
+    terms = search.parse_query('agua')
+    for label, bbox, since in (('bbox municipio', VIEWPORTS['municipio (~10 km)'], None),
+                               ('bbox zona sur', VIEWPORTS['zona sur (~30 km)'], None),
+                               ('bbox barrio', VIEWPORTS['barrio (~2 km)'], None),
+                               ('bbox barrio + since', VIEWPORTS['barrio (~2 km)'], '2025-03-01'),
+                               ('since (último día)', None, '2025-03-31')):
+        ms, results = timed(lambda: search.search_reports(conn, terms, bbox=bbox, since=since))
+        print(f"{'FTS5 término común + ' + label:42s} {ms:8.2f} ms  ({len(results)} resultados)")
+
+    ms, results = timed(lambda: conn.execute(
+        "SELECT id FROM flood_reports WHERE address LIKE ? OR description LIKE ? ORDER BY id DESC LIMIT 20",
+        ('%zanjon%', '%zanjon%')).fetchall(), repeat=3)
+    print(f"{'LIKE %término raro% (recorre la tabla)':42s} {ms:8.2f} ms  ({len(results)} resultados, sin tildes)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark de la página principal: send_from_directory (como antes) contra el
+frontend precargado en memoria de static_assets.py.
+
+Mide peticiones/s a través del cliente de prueba de Flask (sin red), para
+aislar el costo del propio handler: primera visita con gzip y revisita con
+If-None-Match.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_static [segundos_por_caso]
+"""
+import os
+import sys
+import time
+
+from flask import Flask, request, send_from_directory
+
+import static_assets
+
+FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../frontend'))
+
+
+def legacy_app():
+    app = Flask(__name__)
+
+    @app.route('/')
+    def serve_index():
+        return send_from_directory(FRONTEND_DIR, 'index.html')
+
+    return app
+
+
+def assets_app():
+    app = Flask(__name__)
+    assets = static_assets.StaticAssets(FRONTEND_DIR)
+
+    @app.route('/')
+    def serve_index():
+        return assets.response('index.html', request)
+
+    return app
+
+
+def run(client, headers, seconds):
+    done = transferred = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        response = client.get('/', headers=headers)
+        transferred += len(response.data)
+        done += 1
+    return done / seconds, transferred / done
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    gzip_headers = {'Accept-Encoding': 'gzip, deflate, br'}
+    print(f"{'caso':45s} {'pet./s':>9s} {'bytes/resp.':>12s}")
+    for name, app in (('send_from_directory', legacy_app()), ('static_assets', assets_app())):
+        client = app.test_client()
+        first = client.get('/', headers=gzip_headers)
+        etag = first.headers['ETag']
+        rate, size = run(client, gzip_headers, seconds)
+        print(f"{name + ', primera visita':45s} {rate:9.0f} {size:12.0f}")
+        rate, size = run(client, dict(gzip_headers, **{'If-None-Match': etag}), seconds)
+        print(f"{name + ', revisita (If-None-Match)':45s} {rate:9.0f} {size:12.0f}")
+
+
+if __name__ == '__main__':
+    main()
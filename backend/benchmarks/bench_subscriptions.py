@@ -0,0 +1,109 @@
+"""
+Benchmark del cruce de eventos con suscripciones por zona (subscriptions.py).
+
+Genera suscripciones al azar en el AMBA (círculos de 0,5 a 5 km y algunos
+polígonos) y mide el cruce de un reporte, de una carga masiva y de una alerta
+del SMN con área con el índice en memoria, contra comparar el reporte con
+todas las suscripciones (una por una en Python, y todas juntas con NumPy).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_subscriptions [cantidad_de_suscripciones]
+"""
+import datetime
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+
+import flood_reports
+import subscriptions
+from benchmarks.bench_flood_zones import CREATE_TABLE, LAT_RANGE, LNG_RANGE, timed
+from smn_alerts import haversine_matrix, points_in_polygon
+
+# Alerta del SMN de ~30 km sobre el sur del conurbano
+ALERT_AREA = np.array([[-34.65, -58.55], [-34.65, -58.25], [-34.95, -58.25], [-34.95, -58.55]])
+
+
+def random_spec(rng):
+    lat, lng = rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)
+    if rng.random() < 0.1:
+        size = rng.uniform(0.005, 0.03)
+        return {"polygon": [[lat, lng], [lat + size, lng + size / 2], [lat, lng + size], [lat - size / 2, lng + size / 2]]}
+    return {"lat": lat, "lng": lng, "radius_km": rng.uniform(0.5, 5)}
+
+
+def seed(path, count, seed=5):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(CREATE_TABLE)
+    flood_reports.create_change_tracking(conn.cursor())
+    subscriptions.create_tables(conn.cursor())
+    now = datetime.datetime(2025, 1, 1).isoformat()
+    rows = []
+    for i in range(count):
+        lat, lng, radius_km, polygon, bbox = subscriptions._geometry(random_spec(rng))
+        rows.append((f"Suscripción {i}", lat, lng, radius_km, json.dumps(polygon) if polygon else None, *bbox,
+                     'flood_report,smn_alert', 'file', None, '', now))
+    conn.executemany('''
+        INSERT INTO subscriptions (name, lat, lng, radius_km, polygon, min_lat, max_lat, min_lng, max_lng,
+                                   event_types, channel, target, token_hash, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.executemany('''
+        INSERT INTO flood_reports (lat, lng, address, description, water_level, image_filename, timestamp)
+        VALUES (?, ?, 'Calle', 'Agua', NULL, NULL, ?)
+    ''', [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE), now) for _ in range(5000)])
+    conn.commit()
+    return conn, rng
+
+
+def linear_scan(conn, lat, lng):
+    """Cada suscripción comparada con el reporte en Python, sin índice."""
+    matched = []
+    for sub_id, sub_lat, sub_lng, radius_km, polygon in conn.execute(
+            'SELECT id, lat, lng, radius_km, polygon FROM subscriptions'):
+        if radius_km is not None:
+            if haversine_matrix([lat], [lng], [sub_lat], [sub_lng])[0, 0] <= radius_km:
+                matched.append(sub_id)
+        elif points_in_polygon([lat], [lng], np.array(json.loads(polygon)))[0]:
+            matched.append(sub_id)
+    return matched
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    workdir = tempfile.mkdtemp(prefix='bench_subscriptions_')
+    conn, rng = seed(os.path.join(workdir, 'subscriptions.db'), count)
+    build_ms, index = timed(lambda: subscriptions.SubscriptionIndex(conn.execute(subscriptions._INDEX_COLUMNS).fetchall()), repeat=1)
+    print(f"{count} suscripciones; índice armado en {build_ms:.0f} ms ({len(index.cell_members)} entradas en la grilla)")
+
+    points = [(rng.uniform(-34.9, -34.6), rng.uniform(-58.6, -58.3)) for _ in range(500)]
+    ms, matches = timed(lambda: [index.match_points([lat], [lng], 'flood_report')[1] for lat, lng in points], repeat=3)
+    print(f"{'reporte, índice en memoria':42s} {ms / len(points):8.3f} ms  "
+          f"({sum(map(len, matches)) / len(points):.0f} suscripciones avisadas en promedio)")
+
+    lat, lng = points[0]
+    ms, expected = timed(lambda: linear_scan(conn, lat, lng), repeat=1)
+    assert sorted(expected) == sorted(index.ids[matches[0]].tolist())
+    print(f"{'reporte, una por una (Python)':42s} {ms:8.2f} ms")
+    everything = np.arange(len(index))
+    ms, _ = timed(lambda: subscriptions._distance_km(np.full(len(index), lat), np.full(len(index), lng),
+                                                     index.lat[everything], index.lng[everything]) <= index.radius)
+    print(f"{'reporte, todas juntas (NumPy, solo círculos)':42s} {ms:8.2f} ms")
+
+    ms, matches = timed(lambda: index.match_area(ALERT_AREA, 'smn_alert'), repeat=3)
+    print(f"{'alerta SMN de ~30 km':42s} {ms:8.2f} ms  ({len(matches)} suscripciones avisadas)")
+
+    ms, matches = timed(lambda: subscriptions.match_event(conn, index, 'flood_reports_bulk', {"first_id": 1, "last_id": 5000}),
+                        repeat=1)
+    print(f"{'carga masiva de 5000 reportes':42s} {ms:8.2f} ms  ({len(matches)} suscripciones avisadas, "
+          f"{sum(map(len, matches.values()))} pares)")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
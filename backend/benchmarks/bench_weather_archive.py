@@ -0,0 +1,102 @@
+"""
+Benchmark del histórico del clima (weather_archive.py): un año de lecturas
+cada 5 minutos de una estación, guardado en bloques por columnas, contra una
+tabla con una fila por lectura y la fecha en texto (agregando con GROUP BY en
+SQLite).
+
+Mide el espacio en disco y el tiempo de pedir el año entero reducido a unos
+500 intervalos (min/max/promedio), y una semana a intervalos de 1 hora.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_weather_archive [días]
+"""
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+
+import weather_archive
+from benchmarks.bench_flood_zones import timed
+
+STEP = 300
+END = int(datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+
+def synthetic(days, seed=7):
+    """Horas y valores de cada métrica, con ciclo diario y algo de ruido."""
+    rng = np.random.default_rng(seed)
+    times = np.arange(END - days * 86400, END, STEP)
+    daily = np.sin(2 * np.pi * (times % 86400) / 86400)
+    return times, {
+        'temperature': 18 + 6 * daily + rng.normal(0, 1, len(times)),
+        'humidity': 70 - 15 * daily + rng.normal(0, 5, len(times)),
+        'pressure': 1013 + rng.normal(0, 4, len(times)),
+        'wind_speed': rng.gamma(2, 1.5, len(times)),
+        'rain_1h': np.where(rng.random(len(times)) < 0.05, rng.gamma(0.5, 4, len(times)), 0.0),
+    }
+
+
+def seed_rows(conn, times, series):
+    conn.execute('CREATE TABLE observations (station TEXT, metric TEXT, observed_at TEXT, value REAL)')
+    conn.execute('CREATE INDEX idx_observations ON observations (station, metric, observed_at)')
+    stamps = [datetime.datetime.fromtimestamp(t, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S') for t in times.tolist()]
+    for metric, values in series.items():
+        conn.executemany('INSERT INTO observations VALUES (?, ?, ?, ?)',
+                         (('quilmes', metric, stamp, value) for stamp, value in zip(stamps, values.tolist())))
+    conn.commit()
+
+
+def rows_history(conn, metric, start, end, bucket_seconds):
+    """El mismo resultado con una fila por lectura: GROUP BY sobre la fecha en texto."""
+    since = datetime.datetime.fromtimestamp(start, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    until = datetime.datetime.fromtimestamp(end, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    return conn.execute('''
+        SELECT (CAST(strftime('%s', observed_at) AS INTEGER) - ?) / ? AS bucket,
+               MIN(value), MAX(value), AVG(value), COUNT(*)
+        FROM observations
+        WHERE station = 'quilmes' AND metric = ? AND observed_at >= ? AND observed_at < ?
+        GROUP BY bucket ORDER BY bucket
+    ''', (start, bucket_seconds, metric, since, until)).fetchall()
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    workdir = tempfile.mkdtemp(prefix='bench_weather_')
+    times, series = synthetic(days)
+
+    blocks_path, rows_path = os.path.join(workdir, 'blocks.db'), os.path.join(workdir, 'rows.db')
+    blocks = sqlite3.connect(blocks_path)
+    weather_archive.create_tables(blocks.cursor())
+    ms, _ = timed(lambda: [weather_archive.append(blocks, 'quilmes', metric, times, values)
+                           for metric, values in series.items()], repeat=1)
+    blocks.commit()
+    blocks.execute('VACUUM')
+    rows = sqlite3.connect(rows_path)
+    seed_rows(rows, times, series)
+    rows.execute('VACUUM')
+    print(f"{len(times)} lecturas por métrica ({days} días cada {STEP // 60} min), carga en bloques {ms:.0f} ms")
+    print(f"{'espacio en disco, bloques por columnas':50s} {os.path.getsize(blocks_path) / 1e6:8.2f} MB")
+    print(f"{'espacio en disco, una fila por lectura':50s} {os.path.getsize(rows_path) / 1e6:8.2f} MB")
+
+    start, end = int(times[0]), END
+    week = END - 7 * 86400
+    cases = [
+        (f'{days} días en ~500 intervalos', start, end, 500),
+        ('7 días cada 1 hora', week, end, 168),
+    ]
+    for label, since, until, points in cases:
+        ms, result = timed(lambda: weather_archive.history(blocks, 'quilmes', 'rain_1h', since, until, points=points))
+        print(f"{label + ', bloques + NumPy':50s} {ms:8.2f} ms  ({len(result['t'])} intervalos)")
+        bucket = result['bucket_seconds']
+        ms, expected = timed(lambda: rows_history(rows, 'rain_1h', since, until, bucket))
+        assert [count for *_, count in expected] == result['count']
+        print(f"{label + ', fila por lectura (GROUP BY)':50s} {ms:8.2f} ms")
+    blocks.close()
+    rows.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Servidores falsos de todos los servicios externos que usa el backend, para
+medir sin depender de la red: feeds RSS de los medios, GNews,
+OpenWeatherMap, el GeoRSS del SMN y Nominatim.
+
+Las respuestas son sintéticas pero con la forma de las reales. Cada servicio
+tiene una latencia (media + variación al azar) y una tasa de fallos (responde
+503) configurables.
+
+Uso suelto, para levantar la app a mano contra los falsos (desde backend/):
+    python -m benchmarks.fake_upstreams [--port 8900] [--latency 80] [--failure-rate 0.02]
+e imprime las variables de entorno que hay que exportar.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+UPSTREAMS = ('rss', 'gnews', 'weather', 'smn', 'nominatim')
+
+FLOOD_TITLES = [
+    "Inundaciones en {place}: varias familias evacuadas",
+    "Alerta por tormentas fuertes en {place}",
+    "Calles anegadas en {place} tras la lluvia de anoche",
+    "Crecida del arroyo en {place}: piden no circular",
+    "El SMN emitió alerta amarilla por lluvias para {place}",
+]
+OTHER_TITLES = [
+    "Resultados de la fecha del fútbol local",
+    "Nuevo récord de ventas en el sector automotriz",
+    "Se estrenó la película más vista del año",
+    "Cambios en el calendario escolar de {place}",
+]
+PLACES = ["Almirante Brown", "Adrogué", "Lomas de Zamora", "Quilmes", "Lanús", "Burzaco", "Córdoba", "Rosario"]
+
+
+class Behavior:
+    """Latencia y fallos de un servicio falso."""
+
+    def __init__(self, latency_ms=50, jitter_ms=20, failure_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+
+
+class FakeUpstreams:
+    def __init__(self, port=0, latency_ms=50, jitter_ms=20, failure_rate=0.0, overrides=None, feeds=8, seed=1):
+        self.behaviors = {name: Behavior(latency_ms, jitter_ms, failure_rate) for name in UPSTREAMS}
+        for name, changes in (overrides or {}).items():
+            for key, value in changes.items():
+                setattr(self.behaviors[name], key, value)
+        self.feeds = feeds
+        self.requests = {name: 0 for name in UPSTREAMS}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._payloads = self._build_payloads(random.Random(seed))
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self.server.daemon_threads = True
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    # --- Payloads sintéticos (se generan una vez) ---
+
+    def _build_payloads(self, rng):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        payloads = {}
+        for feed in range(self.feeds):
+            items = []
+            for i in range(30):
+                template = rng.choice(FLOOD_TITLES if rng.random() < 0.3 else OTHER_TITLES)
+                title = template.format(place=rng.choice(PLACES))
+                published = format_datetime(now - datetime.timedelta(minutes=rng.randrange(0, 72 * 60)))
+                items.append(
+                    f'<item><title>{title}</title><link>https://medio{feed}.example/nota/{i}</link>'
+                    f'<description>{title}. Más información en la nota.</description>'
+                    f'<pubDate>{published}</pubDate>'
+                    f'<media:thumbnail url="https://medio{feed}.example/img/{i}.jpg"/></item>'
+                )
+            payloads[f'rss/{feed}'] = (
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+                f'<title>Medio {feed}</title>{"".join(items)}</channel></rss>'
+            ).encode('utf-8')
+
+        articles = [{
+            'title': rng.choice(FLOOD_TITLES).format(place=rng.choice(PLACES)),
+            'url': f'https://gnews.example/articulo/{i}',
+            'description': 'Resumen del artículo sobre el temporal.',
+            'publishedAt': (now - datetime.timedelta(hours=rng.randrange(48))).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'image': f'https://gnews.example/img/{i}.jpg',
+            'source': {'name': 'Agencia de prueba'},
+        } for i in range(10)]
+        payloads['gnews'] = json.dumps({'totalArticles': len(articles), 'articles': articles}).encode('utf-8')
+
+        alerts = []
+        for i in range(40):
+            # Mitad en el AMBA, mitad en el resto del país; un tercio con área en vez de punto
+            if i % 2:
+                lat, lon = rng.uniform(-35.0, -34.5), rng.uniform(-58.7, -58.1)
+            else:
+                lat, lon = rng.uniform(-50, -24), rng.uniform(-70, -55)
+            if i % 3 == 0:
+                d = rng.uniform(0.1, 0.6)
+                ring = [(lat - d, lon - d), (lat - d, lon + d), (lat + d, lon + d), (lat + d, lon - d), (lat - d, lon - d)]
+                geometry = '<georss:polygon>' + ' '.join(f'{a:.4f} {b:.4f}' for a, b in ring) + '</georss:polygon>'
+            else:
+                geometry = f'<georss:point>{lat:.4f} {lon:.4f}</georss:point>'
+            alerts.append(
+                f'<item><title>Alerta amarilla por tormentas #{i}</title><link>https://smn.example/aviso/{i}</link>'
+                f'<description>Se esperan tormentas fuertes.</description>'
+                f'<pubDate>{format_datetime(now)}</pubDate>{geometry}</item>'
+            )
+        payloads['smn'] = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0" xmlns:georss="http://www.georss.org/georss"><channel>'
+            f'<title>SMN avisos a corto plazo</title>{"".join(alerts)}</channel></rss>'
+        ).encode('utf-8')
+        return payloads
+
+    @staticmethod
+    def _weather(lat, lon):
+        seed = int(hashlib.md5(f'{lat},{lon}'.encode()).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        return {
+            'name': 'Adrogué', 'sys': {'country': 'AR'},
+            'main': {'temp': round(rng.uniform(5, 30), 1), 'feels_like': round(rng.uniform(5, 30), 1),
+                     'humidity': rng.randrange(40, 100), 'pressure': rng.randrange(995, 1025)},
+            'weather': [{'description': 'lluvia ligera', 'icon': '10d'}],
+            'wind': {'speed': round(rng.uniform(0, 15), 1)},
+        }
+
+    @staticmethod
+    def _geocode(query):
+        if 'sin resultados' in query.lower():
+            return []
+        digest = int(hashlib.md5(query.encode()).hexdigest()[:8], 16)
+        return [{'lat': f'{-34.95 + (digest % 5000) / 10000:.6f}', 'lon': f'{-58.6 + (digest // 5000 % 5000) / 10000:.6f}'}]
+
+    # --- Servidor ---
+
+    def _delay_and_fail(self, name):
+        behavior = self.behaviors[name]
+        with self._rng_lock:
+            self.requests[name] += 1
+            delay = max(0.0, behavior.latency_ms + self._rng.uniform(-behavior.jitter_ms, behavior.jitter_ms)) / 1000
+            fail = self._rng.random() < behavior.failure_rate
+        time.sleep(delay)
+        return fail
+
+    def _handler_class(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                parts = url.path.strip('/').split('/')
+                name = parts[0]
+                if name not in UPSTREAMS:
+                    return self._send(404, b'not found', 'text/plain')
+                if upstreams._delay_and_fail(name):
+                    return self._send(503, b'servicio no disponible', 'text/plain')
+                if name == 'rss':
+                    body = upstreams._payloads.get(f'rss/{parts[-1]}')
+                    if body is None:
+                        return self._send(404, b'not found', 'text/plain')
+                    return self._send(200, body, 'application/rss+xml; charset=utf-8')
+                if name == 'smn':
+                    return self._send(200, upstreams._payloads['smn'], 'application/rss+xml; charset=utf-8')
+                if name == 'gnews':
+                    return self._send(200, upstreams._payloads['gnews'], 'application/json')
+                if name == 'weather':
+                    data = upstreams._weather(query.get('lat', ['0'])[0], query.get('lon', ['0'])[0])
+                else:
+                    data = upstreams._geocode(query.get('q', [''])[0])
+                return self._send(200, json.dumps(data).encode('utf-8'), 'application/json')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-upstreams', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def feeds_config(self):
+        """Contenido para NEWS_FEEDS_FILE."""
+        return [{'name': f'Medio {i}', 'url': f'{self.base_url}/rss/{i}'} for i in range(self.feeds)]
+
+    def env(self, feeds_file):
+        """Variables de entorno que apuntan la app a estos servidores."""
+        return {
+            'NEWS_FEEDS_FILE': feeds_file,
+            'GNEWS_URL': f'{self.base_url}/gnews',
+            'GNEWS_API_KEY': 'clave-de-prueba',
+            'OPENWEATHER_URL': f'{self.base_url}/weather',
+            'OPENWEATHER_API_KEY': 'clave-de-prueba',
+            'SMN_ALERT_RSS_URL': f'{self.base_url}/smn',
+            'NOMINATIM_URL': f'{self.base_url}/nominatim',
+        }
+
+
+def parse_overrides(values, key):
+    """['smn=500', 'rss=200'] → {'smn': {key: 500.0}, 'rss': {key: 200.0}}"""
+    overrides = {}
+    for value in values or []:
+        name, _, number = value.partition('=')
+        if name not in UPSTREAMS:
+            raise SystemExit(f"Servicio desconocido '{name}' (opciones: {', '.join(UPSTREAMS)})")
+        overrides.setdefault(name, {})[key] = float(number)
+    return overrides
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=50, help='latencia media de los servicios falsos (ms)')
+    parser.add_argument('--jitter', type=float, default=20, help='variación de la latencia (± ms)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='proporción de respuestas 503')
+    parser.add_argument('--slow', action='append', metavar='SERVICIO=MS', help='latencia propia de un servicio')
+    parser.add_argument('--fail', action='append', metavar='SERVICIO=TASA', help='tasa de fallos propia de un servicio')
+
+
+def from_arguments(args, port=0):
+    overrides = parse_overrides(args.slow, 'latency_ms')
+    for name, changes in parse_overrides(args.fail, 'failure_rate').items():
+        overrides.setdefault(name, {}).update(changes)
+    return FakeUpstreams(port=port, latency_ms=args.latency, jitter_ms=args.jitter,
+                         failure_rate=args.failure_rate, overrides=overrides)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--feeds-file', default='fake_feeds.json')
+    add_arguments(parser)
+    args = parser.parse_args()
+    upstreams = from_arguments(args, port=args.port).start()
+    args.feeds_file = os.path.abspath(args.feeds_file)
+    with open(args.feeds_file, 'w', encoding='utf-8') as f:
+        json.dump(upstreams.feeds_config(), f)
+    print(f"Servicios falsos en {upstreams.base_url}. Exportá:\n")
+    for key, value in upstreams.env(args.feeds_file).items():
+        print(f"  {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        upstreams.stop()
+
+
+if __name__ == '__main__':
+    main()
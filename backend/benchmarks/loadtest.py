@@ -0,0 +1,287 @@
+"""
+Prueba de carga del backend completo, sin salir a internet.
+
+1. Levanta los servicios externos falsos (benchmarks/fake_upstreams.py).
+2. Genera una base con muchos reportes sintéticos (benchmarks/bench_flood_zones.seed).
+3. Arranca la app en otro proceso apuntada a ambos por variables de entorno
+   (servidor de desarrollo con hilos o gunicorn en modo sync/async si está instalado).
+4. Ejecuta cada escenario con N clientes concurrentes durante unos segundos y
+   reporta throughput, errores y latencias p50/p95/p99.
+
+Uso (desde backend/):
+    python -m benchmarks.loadtest [--reports 200000] [--concurrency 16] [--duration 10]
+                                  [--scenarios flood_zones_bbox,news] [--server gunicorn --mode async --workers 4]
+                                  [--latency 80 --failure-rate 0.02 --slow smn=800 --fail nominatim=0.1]
+                                  [--json resultados.json]
+
+Con --target URL se usa una app ya levantada (no se generan base ni servidor).
+El generador de carga corre en Python: en una sola máquina compite por CPU con
+la app, así que los números sirven para comparar versiones entre sí, no como
+capacidad absoluta.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks import fake_upstreams
+from benchmarks.bench_flood_zones import LAT_RANGE, LNG_RANGE, seed
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ADDRESSES = [f"Calle {n} {100 * (n % 40)}, Almirante Brown" for n in range(300)]
+REGIONS = ['almirante_brown', 'lomas_de_zamora', 'quilmes', 'lanus', 'esteban_echeverria', 'florencio_varela']
+
+
+# --- Escenarios: cada uno recibe (sesión, url base, rng, estado) y devuelve la respuesta ---
+
+def random_viewport(rng, size=0.1):
+    lat = rng.uniform(LAT_RANGE[0], LAT_RANGE[1] - size)
+    lng = rng.uniform(LNG_RANGE[0], LNG_RANGE[1] - size)
+    return f"{lng:.5f},{lat:.5f},{lng + size:.5f},{lat + size:.5f}"
+
+
+def popular_address(rng):
+    # Unas pocas direcciones concentran la mayoría de las consultas, como en un temporal real
+    return ADDRESSES[min(int(rng.paretovariate(1.2)) - 1, len(ADDRESSES) - 1)]
+
+
+SCENARIOS = {
+    'index': lambda s, base, rng, st: s.get(f'{base}/', headers={'Accept-Encoding': 'gzip'}),
+    'flood_zones_full': lambda s, base, rng, st: s.get(f'{base}/api/flood-zones'),
+    'flood_zones_bbox': lambda s, base, rng, st: s.get(f'{base}/api/flood-zones', params={'bbox': random_viewport(rng)}),
+    'flood_zones_revalidate': lambda s, base, rng, st: s.get(f'{base}/api/flood-zones', headers={'If-None-Match': st['etag']}),
+    'flood_zones_delta': lambda s, base, rng, st: s.get(f'{base}/api/flood-zones', params={'since_id': st['high_water'] - 50}),
+    'news': lambda s, base, rng, st: s.get(f'{base}/api/news'),
+    'weather': lambda s, base, rng, st: s.get(f'{base}/api/weather', params={
+        'lat': round(rng.uniform(*LAT_RANGE), 4), 'lon': round(rng.uniform(*LNG_RANGE), 4)}),
+    # Coordenadas de todo el país: casi siempre una celda nueva, o sea una llamada a OpenWeatherMap
+    'weather_cold': lambda s, base, rng, st: s.get(f'{base}/api/weather', params={
+        'lat': round(rng.uniform(-55, -22), 4), 'lon': round(rng.uniform(-73, -53), 4)}),
+    'smn_alerts': lambda s, base, rng, st: s.get(f'{base}/api/smn_alerts', params={'region': rng.choice(REGIONS)}),
+    'geocode': lambda s, base, rng, st: s.get(f'{base}/geocode', params={'address': popular_address(rng)}),
+    'geocode_batch': lambda s, base, rng, st: s.post(f'{base}/geocode/batch', json={
+        'addresses': [popular_address(rng) for _ in range(20)]}),
+    'report_post': lambda s, base, rng, st: s.post(f'{base}/api/flood-reports', data={
+        'address': popular_address(rng), 'description': 'Agua en la calzada', 'water_level': 'Medio',
+        'lat': rng.uniform(*LAT_RANGE), 'lng': rng.uniform(*LNG_RANGE)}),
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_mix(mix, base, state, duration):
+    """
+    Corre varios escenarios a la vez durante `duration` segundos; `mix` es
+    {escenario: clientes}. Devuelve un resumen por escenario.
+    """
+    collected = {name: ([], {}, []) for name in mix}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(name, index):
+        scenario = SCENARIOS[name]
+        rng = random.Random(index)
+        session = requests.Session()  # Conexión keep-alive por cliente, como un navegador
+        local_latencies, local_statuses, local_errors = [], {}, 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = scenario(session, base, rng, state)
+                response.content
+                local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+                if response.status_code >= 500:
+                    local_errors += 1
+            except requests.RequestException:
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - started)
+        latencies, statuses, errors = collected[name]
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=client, args=(name, i))
+               for name, concurrency in mix.items() for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for name, (latencies, statuses, errors) in collected.items():
+        latencies.sort()
+        results.append({
+            'scenario': name,
+            'requests': len(latencies),
+            'rps': len(latencies) / elapsed,
+            'errors': sum(errors),
+            'statuses': statuses,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0) * 1000,
+        })
+    return results
+
+
+def run_scenario(name, base, state, concurrency, duration):
+    """Corre un escenario con `concurrency` clientes. Devuelve el resumen."""
+    return run_mix({name: concurrency}, base, state, duration)[0]
+
+
+# --- Preparación del entorno ---
+
+def async_mode_available():
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def start_app(args, workdir, env_overrides):
+    """Arranca la app en un proceso aparte y espera a que responda."""
+    env = dict(os.environ)
+    env.update(env_overrides)
+    port = args.port
+    if args.server == 'gunicorn':
+        if not shutil.which('gunicorn'):
+            raise SystemExit("gunicorn no está instalado (pip install gunicorn)")
+        if args.mode == 'async' and not async_mode_available():
+            raise SystemExit("El modo async necesita gevent (pip install gevent)")
+        env.update({'SERVER_MODE': args.mode, 'WEB_CONCURRENCY': str(args.workers),
+                    'GUNICORN_THREADS': str(args.threads), 'BIND': f'127.0.0.1:{port}',
+                    'GUNICORN_LOG_LEVEL': 'warning'})
+        command = ['gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log_file = open(os.path.join(workdir, 'app.log'), 'w')
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"La app terminó al arrancar; ver {log_file.name}")
+        try:
+            requests.get(f'{base}/metrics', timeout=1)
+            return process, base
+        except requests.RequestException:
+            time.sleep(0.3)
+    process.terminate()
+    raise SystemExit("La app no respondió a tiempo")
+
+
+def prepare_app_env(upstreams, workdir, reports):
+    """Genera la base sintética y devuelve el entorno que apunta la app a ella y a los servicios falsos."""
+    feeds_file = os.path.join(workdir, 'feeds.json')
+    with open(feeds_file, 'w', encoding='utf-8') as f:
+        json.dump(upstreams.feeds_config(), f)
+
+    db_path = os.path.join(workdir, 'flood_data.db')
+    print(f"Generando {reports} reportes sintéticos en {db_path} ...")
+    seed(db_path, reports).close()
+
+    env = upstreams.env(feeds_file)
+    env.update({
+        'DATABASE_PATH': db_path,
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'LOG_LEVEL': 'WARNING',
+    })
+    # Nominatim falso: sin política de uso, se permite más de 1 consulta/s (salvo que se indique otra cosa)
+    env['GEOCODE_RATE_PER_SEC'] = os.environ.get('GEOCODE_RATE_PER_SEC', '50')
+    env['GEOCODE_BURST'] = os.environ.get('GEOCODE_BURST', '50')
+    return env
+
+
+def prepare_state(base):
+    """Datos que necesitan algunos escenarios (ETag y marca de agua actuales) y precalentamiento."""
+    response = requests.get(f'{base}/api/flood-zones', params={'limit': 1})
+    state = {'high_water': response.json().get('high_water') or 0}
+    state['etag'] = requests.get(f'{base}/api/flood-zones').headers.get('ETag', '')
+    requests.get(f'{base}/api/news', timeout=60)  # Primera corrida del agregador de noticias
+    return state
+
+
+def print_results(results):
+    print(f"\n{'escenario':24s} {'pet.':>7s} {'pet./s':>8s} {'errores':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'máx ms':>8s}  códigos")
+    for r in results:
+        codes = ' '.join(f'{k}:{v}' for k, v in sorted(r['statuses'].items()))
+        print(f"{r['scenario']:24s} {r['requests']:7d} {r['rps']:8.1f} {r['errors']:8d} {r['p50_ms']:8.1f} "
+              f"{r['p95_ms']:8.1f} {r['p99_ms']:8.1f} {r['max_ms']:8.1f}  {codes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--reports', type=int, default=200_000, help='reportes sintéticos en la base')
+    parser.add_argument('--concurrency', type=int, default=16, help='clientes simultáneos')
+    parser.add_argument('--duration', type=float, default=10, help='segundos por escenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='escenarios separados por coma')
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync',
+                        help='SERVER_MODE de gunicorn.conf.py (async = workers gevent)')
+    parser.add_argument('--workers', type=int, default=4, help='workers de gunicorn')
+    parser.add_argument('--threads', type=int, default=8, help='hilos por worker de gunicorn')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--target', help='URL de una app ya levantada (omite base, servidor y servicios falsos)')
+    parser.add_argument('--json', help='guarda los resultados en este archivo')
+    fake_upstreams.add_arguments(parser)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Escenarios desconocidos: {', '.join(unknown)} (opciones: {', '.join(SCENARIOS)})")
+
+    workdir = tempfile.mkdtemp(prefix='loadtest_')
+    upstreams = process = None
+    try:
+        if args.target:
+            base = args.target.rstrip('/')
+        else:
+            upstreams = fake_upstreams.from_arguments(args).start()
+            env = prepare_app_env(upstreams, workdir, args.reports)
+            server = f'gunicorn/{args.mode}' if args.server == 'gunicorn' else args.server
+            print(f"Arrancando la app ({server}) ...")
+            process, base = start_app(args, workdir, env)
+
+        state = prepare_state(base)
+        print(f"{args.concurrency} clientes, {args.duration:.0f} s por escenario, contra {base}")
+        results = []
+        for name in names:
+            result = run_scenario(name, base, state, args.concurrency, args.duration)
+            results.append(result)
+            print(f"  {name}: {result['rps']:.1f} pet./s, p95 {result['p95_ms']:.1f} ms")
+        print_results(results)
+        if upstreams:
+            print(f"\nPeticiones a los servicios falsos: {upstreams.requests}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        if upstreams:
+            upstreams.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
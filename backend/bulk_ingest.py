@@ -0,0 +1,250 @@
+"""
+Carga masiva de reportes de inundación (centros de atención municipales, apps
+asociadas) en POST /api/flood-reports/bulk.
+
+- El cuerpo se lee como stream, línea por línea: NDJSON (un objeto JSON por
+  línea) o CSV con encabezado. Nunca se guarda el archivo completo en memoria:
+  solo el bloque en curso y los primeros BULK_MAX_ERRORS errores.
+- Cada fila se valida por separado; las válidas se insertan en transacciones de
+  BULK_CHUNK_SIZE filas (un COMMIT por bloque, no por reporte) y las inválidas
+  se informan con su número de línea.
+- Por cada bloque confirmado se publica un evento "flood_reports_bulk" con el
+  rango de ids, en lugar de un evento por reporte.
+"""
+import csv
+import datetime
+import hmac
+import io
+import json
+import logging
+import os
+import sqlite3
+
+from dateutil import parser as date_parser
+
+import db
+import events
+import metrics
+
+log = logging.getLogger(__name__)
+
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '5000'))              # Filas por transacción
+BULK_MAX_ERRORS = int(os.getenv('BULK_MAX_ERRORS', '1000'))              # Errores detallados en la respuesta (el resto solo se cuenta)
+BULK_MAX_FIELD_LENGTH = int(os.getenv('BULK_MAX_FIELD_LENGTH', '2000'))  # Largo máximo de dirección, descripción y nivel
+BULK_INGEST_TOKEN = os.getenv('BULK_INGEST_TOKEN')                       # Si está definido se exige "Authorization: Bearer <token>"
+
+FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/json-seq': 'ndjson',
+    'text/csv': 'csv',
+}
+
+INSERT_SQL = '''
+    INSERT INTO flood_reports (address, description, lat, lng, water_level, image_filename, timestamp)
+    VALUES (?, ?, ?, ?, ?, NULL, ?)
+'''
+
+
+class InvalidRow(ValueError):
+    """La fila no es un reporte válido; el mensaje se devuelve al cliente."""
+
+
+class MalformedBody(ValueError):
+    """El cuerpo no se puede seguir leyendo (codificación o CSV roto)."""
+
+
+def authorized(header):
+    """True si no hay token configurado o si el header Authorization coincide."""
+    if not BULK_INGEST_TOKEN:
+        return True
+    return hmac.compare_digest(header or '', f'Bearer {BULK_INGEST_TOKEN}')
+
+
+def detect_format(requested, mimetype):
+    """Formato pedido con ?format= o deducido del Content-Type. None si no se reconoce."""
+    if requested:
+        return requested if requested in ('ndjson', 'csv') else None
+    return FORMATS.get(mimetype)
+
+
+# --- Validación ---
+
+def _text(row, field, required):
+    value = row.get(field)
+    if type(value) is str:
+        value = value.strip()
+        if value and len(value) <= BULK_MAX_FIELD_LENGTH:
+            return value
+        if value:
+            raise InvalidRow(f"'{field}' supera los {BULK_MAX_FIELD_LENGTH} caracteres")
+    elif value is not None:
+        raise InvalidRow(f"'{field}' debe ser texto")
+    if required:
+        raise InvalidRow(f"falta '{field}'")
+    return None
+
+
+def _coordinate(row, field, limit):
+    value = row.get(field)
+    if isinstance(value, bool):
+        raise InvalidRow(f"'{field}' debe ser numérico")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f"'{field}' debe ser numérico")
+    if not -limit <= number <= limit:  # También descarta NaN
+        raise InvalidRow(f"'{field}' fuera de rango")
+    return number
+
+
+def _timestamp(value, default):
+    """
+    Fecha ISO 8601 en el mismo formato que el alta individual: hora local sin zona.
+    Las fechas con zona ("...Z", "-03:00") se pasan a hora local; si no, ORDER BY
+    timestamp y los filtros since/until (comparaciones de texto) mezclarían formatos.
+    """
+    if value is None or value == '':
+        return default
+    if not isinstance(value, str):
+        raise InvalidRow("'timestamp' debe ser texto ISO 8601")
+    try:
+        parsed = date_parser.isoparse(value.strip())
+    except ValueError:
+        raise InvalidRow("'timestamp' debe estar en formato ISO 8601")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def validate(row, default_timestamp):
+    """Convierte una fila (dict) en los parámetros de INSERT_SQL o lanza InvalidRow."""
+    if not isinstance(row, dict):
+        raise InvalidRow("se espera un objeto con los campos del reporte")
+    return (
+        _text(row, 'address', True),
+        _text(row, 'description', True),
+        _coordinate(row, 'lat', 90),
+        _coordinate(row, 'lng', 180),
+        _text(row, 'water_level', False),
+        _timestamp(row.get('timestamp'), default_timestamp),
+    )
+
+
+# --- Lectura incremental del cuerpo ---
+
+_decode_json = json.JSONDecoder().decode
+
+
+class _RawReader(io.RawIOBase):
+    """
+    Adapta cualquier objeto con read() a io.RawIOBase, para poder envolverlo en un
+    BufferedReader: según el servidor, request.stream es un LimitedStream de
+    werkzeug o (con cuerpos chunked) el Body de gunicorn.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def ndjson_rows(stream):
+    """(número de línea, dict o InvalidRow) por cada línea no vacía."""
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, _decode_json(line.decode('utf-8'))
+        except UnicodeDecodeError:
+            raise MalformedBody(f"línea {number}: el cuerpo debe estar en UTF-8")
+        except ValueError as e:
+            yield number, InvalidRow(f"JSON inválido: {e}")
+
+
+def csv_rows(stream):
+    """(número de línea, dict) por cada fila de un CSV con encabezado."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        raise MalformedBody(f"línea {reader.line_num + 1}: el cuerpo debe estar en UTF-8")
+    except csv.Error as e:
+        raise MalformedBody(f"línea {reader.line_num}: CSV inválido ({e})")
+
+
+# --- Inserción ---
+
+def _flush(conn, chunk, result):
+    with metrics.sqlite_query('flood_reports.bulk_insert'), conn:
+        conn.executemany(INSERT_SQL, chunk)
+        # La transacción tiene el lock de escritura: los ids del bloque son consecutivos
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    first_id = last_id - len(chunk) + 1
+    result['inserted'] += len(chunk)
+    result['first_id'] = result['first_id'] or first_id
+    result['last_id'] = last_id
+    try:
+        events.publish('flood_reports_bulk', {"first_id": first_id, "last_id": last_id, "count": len(chunk)})
+    except Exception as e:  # Los reportes ya están guardados
+        log.warning("No se pudo publicar el evento de carga masiva", extra={'error': str(e)})
+
+
+def ingest(stream, fmt, dry_run=False):
+    """
+    Lee, valida e inserta los reportes del stream. Devuelve el resumen: filas
+    insertadas y rechazadas, rango de ids, errores por línea y, si el cuerpo se
+    cortó por un error de formato, el motivo en "aborted".
+    """
+    result = {"inserted": 0, "rejected": 0, "errors": [], "errors_truncated": False,
+              "first_id": None, "last_id": None, "dry_run": dry_run}
+    buffered = io.BufferedReader(_RawReader(stream), 1 << 16)
+    rows = ndjson_rows(buffered) if fmt == 'ndjson' else csv_rows(buffered)
+    default_timestamp = datetime.datetime.now().isoformat()
+    conn = None if dry_run else db.get_connection()
+    chunk = []
+    valid = 0
+    try:
+        try:
+            for line, row in rows:
+                try:
+                    if isinstance(row, InvalidRow):
+                        raise row
+                    params = validate(row, default_timestamp)
+                except InvalidRow as e:
+                    result['rejected'] += 1
+                    if len(result['errors']) < BULK_MAX_ERRORS:
+                        result['errors'].append({"line": line, "error": str(e)})
+                    else:
+                        result['errors_truncated'] = True
+                    continue
+                valid += 1
+                if dry_run:
+                    continue
+                chunk.append(params)
+                if len(chunk) >= BULK_CHUNK_SIZE:
+                    _flush(conn, chunk, result)
+                    chunk = []
+        except MalformedBody as e:
+            result['aborted'] = str(e)  # Las filas válidas anteriores al corte se insertan igual
+        if chunk:
+            _flush(conn, chunk, result)
+    except sqlite3.Error as e:
+        # Los bloques anteriores ya quedaron confirmados; el resumen indica hasta dónde se llegó
+        log.exception("Error de base de datos en la carga masiva")
+        result['aborted'] = f"error de base de datos: {e}"
+    finally:
+        if conn:
+            conn.close()
+    if dry_run:
+        result['valid'] = valid
+    log.info("Carga masiva de reportes", extra={'format': fmt, 'inserted': result['inserted'],
+                                                 'rejected': result['rejected'], 'dry_run': dry_run})
+    return result
@@ -0,0 +1,129 @@
+"""
+Caché en memoria con vencimiento (TTL), tamaño acotado (LRU) y "single-flight":
+si varias peticiones piden la misma clave vencida al mismo tiempo, solo una
+llama a la fuente y las demás esperan su resultado. Si la fuente falla y hay
+un valor vencido no demasiado viejo, se sirve ese valor. Quienes esperan una
+carga ajena lo hacen como mucho `wait_timeout` segundos.
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+
+_instances = weakref.WeakSet()  # Todas las cachés creadas, para exportar sus métricas
+
+
+class SingleFlightCache:
+    def __init__(self, name, ttl, max_entries=1024, stale_ttl=0, wait_timeout=30):
+        self.name = name
+        self.ttl = ttl                  # Segundos que un valor se considera fresco
+        self.stale_ttl = stale_ttl      # Segundos extra que se puede servir vencido si la fuente falla
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout  # Segundos que se espera una carga en curso antes de desistir
+        self._entries = OrderedDict()   # clave -> (valor, guardado_en)
+        self._inflight = {}             # clave -> Future de la carga en curso
+        self._invalidated = set()       # Claves invalidadas mientras se cargaban: ese resultado no se guarda
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.coalesced = 0              # Peticiones que esperaron una carga ya en curso
+        self.errors = 0
+        self.evictions = 0
+        _instances.add(self)
+
+    def _fresh(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[1] < self.ttl:
+            self._entries.move_to_end(key)
+            return entry
+        return None
+
+    def get_or_load(self, key, loader):
+        """Devuelve el valor de `key`, llamando a `loader()` solo si no hay uno fresco."""
+        with self._lock:
+            entry = self._fresh(key, time.monotonic())
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except TimeoutError:
+                raise TimeoutError(f"La carga de {key!r} en la caché {self.name} tardó más de {self.wait_timeout}s")
+
+        try:
+            value = loader()
+        except BaseException as e:
+            # También con BaseException (gevent.Timeout, GreenletExit): si la clave quedara en
+            # _inflight, todos los pedidos siguientes esperarían un resultado que nunca llega
+            with self._lock:
+                self.errors += 1
+                del self._inflight[key]
+                self._invalidated.discard(key)
+                entry = self._entries.get(key)
+                if (isinstance(e, Exception) and entry is not None
+                        and time.monotonic() - entry[1] < self.ttl + self.stale_ttl):
+                    self.stale_served += 1
+                    future.set_result(entry[0])
+                    return entry[0]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if key in self._invalidated:
+                self._invalidated.discard(key)  # Se calculó con datos que ya cambiaron
+            else:
+                self._entries[key] = (value, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def invalidate(self, keys):
+        """Descarta las claves indicadas (y evita guardar las que se estén cargando ahora)."""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                if key in self._inflight:
+                    self._invalidated.add(key)
+
+    def clear(self):
+        """Descarta todas las entradas."""
+        with self._lock:
+            self._entries.clear()
+            self._invalidated.update(self._inflight)
+
+    def stats(self):
+        """Contadores de uso de la caché."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "coalesced": self.coalesced,
+                "stale_served": self.stale_served,
+                "errors": self.errors,
+                "evictions": self.evictions,
+            }
+
+
+def all_caches():
+    """Cachés vivas en este proceso, ordenadas por nombre."""
+    return sorted(_instances, key=lambda c: c.name)
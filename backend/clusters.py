@@ -0,0 +1,260 @@
+"""
+Agrupamiento de reportes para el mapa según el zoom (clusters y mapa de calor).
+
+- Cada proceso guarda las columnas id/lat/lng/nivel de flood_reports en arrays
+  de NumPy ordenados por longitud. Se cargan una vez y después solo se agregan
+  los reportes nuevos (id mayor al último visto).
+- El mapa se divide en tiles Web Mercator (z/x/y, como Google Maps) y cada
+  tile en una grilla de CLUSTER_GRID × CLUSTER_GRID celdas. Los reportes de
+  una celda forman un cluster con su cantidad, centroide y nivel de agua
+  máximo, calculados con np.bincount sobre todos los puntos del tile a la vez.
+- Los clusters se guardan por (zoom, x, y). Al llegar reportes nuevos se
+  descartan solo los tiles que los contienen, en todos los zooms. Si la tabla
+  cambió de otra forma (modificación o baja) se recarga todo.
+- El tamaño de la respuesta está acotado: como mucho CLUSTER_GRID² clusters
+  por tile y CLUSTER_MAX_TILES tiles por consulta (si la zona pedida abarca
+  más, se usa un zoom menor).
+"""
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+import cache
+import metrics
+
+log = logging.getLogger(__name__)
+
+CLUSTER_GRID = int(os.getenv('CLUSTER_GRID', '8'))                        # Celdas por lado de cada tile
+CLUSTER_MAX_TILES = int(os.getenv('CLUSTER_MAX_TILES', '64'))             # Tiles por consulta con bbox
+CLUSTER_MAX_ZOOM = int(os.getenv('CLUSTER_MAX_ZOOM', '20'))
+CLUSTER_CACHE_MAX_TILES = int(os.getenv('CLUSTER_CACHE_MAX_TILES', '20000'))
+
+MAX_MERCATOR_LAT = 85.05112878
+
+# Orden de los niveles de agua: el cluster informa el más alto de sus reportes
+WATER_LEVELS = {'bajo': 1, 'medio': 2, 'alto': 3}
+LEVEL_NAMES = (None, 'Bajo', 'Medio', 'Alto')
+
+_tile_cache = cache.SingleFlightCache('cluster_tiles', ttl=24 * 3600, max_entries=CLUSTER_CACHE_MAX_TILES)
+
+
+# --- Tiles Web Mercator ---
+
+def _mercator_x(lng, zoom):
+    return (np.asarray(lng, dtype=float) + 180.0) / 360.0 * (1 << zoom)
+
+
+def _mercator_y(lat, zoom):
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    return (1.0 - np.arcsinh(np.tan(lat)) / math.pi) / 2.0 * (1 << zoom)
+
+
+def tile_bounds(zoom, x, y):
+    """(oeste, sur, este, norte) del tile en grados."""
+    n = 1 << zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def tiles_for_bbox(bbox, zoom):
+    """Tiles (x, y) que cubren el bbox en ese zoom."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    n = 1 << zoom
+    x0, x1 = (int(np.clip(v, 0, n - 1)) for v in _mercator_x([min_lng, max_lng], zoom))
+    y0, y1 = (int(np.clip(v, 0, n - 1)) for v in _mercator_y([max_lat, min_lat], zoom))
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def zoom_for_bbox(bbox, zoom):
+    """El zoom pedido o, si el bbox abarca más de CLUSTER_MAX_TILES tiles, el mayor zoom que entra."""
+    while zoom > 0:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        xs = _mercator_x([min_lng, max_lng], zoom)
+        ys = _mercator_y([max_lat, min_lat], zoom)
+        if (int(xs[1]) - int(xs[0]) + 1) * (int(ys[1]) - int(ys[0]) + 1) <= CLUSTER_MAX_TILES:
+            break
+        zoom -= 1
+    return zoom
+
+
+# --- Columnas de reportes en memoria ---
+
+class ReportColumns:
+    """Snapshot inmutable de id/lat/lng/nivel, ordenado por longitud."""
+
+    def __init__(self, ids, lat, lng, level):
+        order = np.argsort(lng, kind='stable')
+        self.ids = ids[order]
+        self.lat = lat[order]
+        self.lng = lng[order]
+        self.level = level[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def within(self, west, south, east, north):
+        """Índices de los puntos dentro del rectángulo (búsqueda binaria en lng + máscara en lat)."""
+        start, stop = np.searchsorted(self.lng, [west, east], side='left')
+        lat = self.lat[start:stop]
+        return start + np.flatnonzero((lat >= south) & (lat < north))
+
+    def append(self, ids, lat, lng, level):
+        """Snapshot nuevo con estos puntos insertados en su lugar (el actual no se modifica)."""
+        positions = np.searchsorted(self.lng, lng, side='right')
+        new = ReportColumns.__new__(ReportColumns)
+        new.ids = np.insert(self.ids, positions, ids)
+        new.lat = np.insert(self.lat, positions, lat)
+        new.lng = np.insert(self.lng, positions, lng)
+        new.level = np.insert(self.level, positions, level)
+        return new
+
+
+def _level_codes(values):
+    return np.fromiter((WATER_LEVELS.get((v or '').strip().lower(), 0) for v in values), dtype=np.int8, count=len(values))
+
+
+def _columns_from_rows(rows):
+    if not rows:
+        empty = np.empty(0)
+        return np.empty(0, dtype=np.int64), empty, empty.copy(), np.empty(0, dtype=np.int8)
+    ids, lat, lng, levels = zip(*rows)
+    return (np.asarray(ids, dtype=np.int64), np.asarray(lat, dtype=float), np.asarray(lng, dtype=float),
+            _level_codes(levels))
+
+
+class ReportIndex:
+    """Columnas de flood_reports en memoria, al día con la marca de agua de la tabla."""
+
+    def __init__(self):
+        self.columns = None
+        self.max_id = 0
+        self.version = None
+        self._lock = threading.Lock()
+
+    @metrics.sqlite_query('clusters.load')
+    def _load(self, conn, high_water):
+        rows = conn.execute('SELECT id, lat, lng, water_level FROM flood_reports WHERE id <= ?',
+                            (high_water[0],)).fetchall()
+        self.columns = ReportColumns(*_columns_from_rows(rows))
+        self.max_id, self.version = high_water
+        _tile_cache.clear()
+        log.info("Reportes cargados para clusters", extra={'reports': len(rows)})
+
+    def refresh(self, conn, high_water):
+        """Incorpora los cambios de flood_reports hasta `high_water` (de get_high_water)."""
+        max_id, version = high_water
+        if version == self.version:
+            return
+        with self._lock:
+            if self.version is not None and version <= self.version:
+                return  # Otro hilo ya lo actualizó
+            if self.columns is None:
+                self._load(conn, high_water)
+                return
+            with metrics.sqlite_query('clusters.new_reports'):
+                rows = conn.execute('SELECT id, lat, lng, water_level FROM flood_reports WHERE id > ? AND id <= ?',
+                                    (self.max_id, max_id)).fetchall()
+            if version - self.version != len(rows):
+                # Cada alta suma 1 a la versión: si no coincide hubo modificaciones o bajas
+                self._load(conn, high_water)
+                return
+            ids, lat, lng, level = _columns_from_rows(rows)
+            # Primero el snapshot nuevo y después la invalidación: un tile que se calcule
+            # entre medio usa los datos nuevos o se descarta al terminar (ver SingleFlightCache).
+            self.columns = self.columns.append(ids, lat, lng, level)
+            self.max_id, self.version = max_id, version
+            _tile_cache.invalidate(affected_tiles(lat, lng))
+
+
+def affected_tiles(lat, lng):
+    """Claves (zoom, x, y) de los tiles que contienen alguno de estos puntos, en todos los zooms."""
+    keys = []
+    for zoom in range(CLUSTER_MAX_ZOOM + 1):
+        n = 1 << zoom
+        xs = np.clip(_mercator_x(lng, zoom).astype(np.int64), 0, n - 1)
+        ys = np.clip(_mercator_y(lat, zoom).astype(np.int64), 0, n - 1)
+        for x, y in set(zip(xs.tolist(), ys.tolist())):
+            keys.append((zoom, x, y))
+    return keys
+
+
+index = ReportIndex()
+
+
+# --- Clusters por tile ---
+
+def _compute_tile(columns, zoom, x, y):
+    west, south, east, north = tile_bounds(zoom, x, y)
+    selected = columns.within(west, south, east, north)
+    if len(selected) == 0:
+        return []
+    lat = columns.lat[selected]
+    lng = columns.lng[selected]
+    # Celda de la grilla dentro del tile, en coordenadas Mercator (celdas cuadradas en pantalla)
+    cx = np.clip(((_mercator_x(lng, zoom) - x) * CLUSTER_GRID).astype(np.int64), 0, CLUSTER_GRID - 1)
+    cy = np.clip(((_mercator_y(lat, zoom) - y) * CLUSTER_GRID).astype(np.int64), 0, CLUSTER_GRID - 1)
+    cell = cy * CLUSTER_GRID + cx
+    size = CLUSTER_GRID * CLUSTER_GRID
+
+    counts = np.bincount(cell, minlength=size)
+    sum_lat = np.bincount(cell, weights=lat, minlength=size)
+    sum_lng = np.bincount(cell, weights=lng, minlength=size)
+    max_level = np.zeros(size, dtype=np.int8)
+    np.maximum.at(max_level, cell, columns.level[selected])
+    any_id = np.zeros(size, dtype=np.int64)
+    np.maximum.at(any_id, cell, columns.ids[selected])  # Con un solo reporte, es su id
+
+    occupied = np.flatnonzero(counts)
+    result = []
+    for count, lat_sum, lng_sum, level, report_id in zip(
+            counts[occupied].tolist(), sum_lat[occupied].tolist(), sum_lng[occupied].tolist(),
+            max_level[occupied].tolist(), any_id[occupied].tolist()):
+        cluster = {
+            "lat": round(lat_sum / count, 6),
+            "lng": round(lng_sum / count, 6),
+            "count": count,
+            "max_water_level": LEVEL_NAMES[level],
+        }
+        if count == 1:
+            cluster["id"] = report_id
+        result.append(cluster)
+    return result
+
+
+def tile(zoom, x, y):
+    """Clusters de un tile (desde la caché si no cambió desde la última refresh())."""
+    return _tile_cache.get_or_load((zoom, x, y), lambda: _compute_tile(index.columns, zoom, x, y))
+
+
+def clusters_for_bbox(bbox, zoom):
+    """Clusters de todos los tiles que cubren el bbox. Devuelve (zoom usado, clusters)."""
+    zoom = zoom_for_bbox(bbox, zoom)
+    min_lng, min_lat, max_lng, max_lat = bbox
+    result = []
+    for x, y in tiles_for_bbox(bbox, zoom):
+        # Los tiles del borde pueden tener clusters fuera del bbox: se filtran por su centroide
+        result.extend(c for c in tile(zoom, x, y)
+                      if min_lng <= c["lng"] <= max_lng and min_lat <= c["lat"] <= max_lat)
+    return zoom, result
+
+
+def heatmap(clusters):
+    """Formato compacto para capas de calor: [lat, lng, peso]."""
+    return [[c["lat"], c["lng"], c["count"]] for c in clusters]
+
+
+def parse_tile(zoom, x, y):
+    """Valida z/x/y de un tile. Lanza ValueError."""
+    if not 0 <= zoom <= CLUSTER_MAX_ZOOM:
+        raise ValueError(f"zoom debe estar entre 0 y {CLUSTER_MAX_ZOOM}")
+    n = 1 << zoom
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError("tile fuera de rango para ese zoom")
+    return zoom, x, y
+
@@ -0,0 +1,258 @@
+"""
+Capa de acceso a SQLite.
+
+- Una conexión por hilo, reutilizada entre peticiones (con su caché de sentencias preparadas).
+- En modo async (gevent) cada greenlet toma su propia conexión de un pool del worker
+  y la devuelve al cerrarla: una transacción abierta nunca abarca sentencias de otra
+  petición, y la espera ante una base bloqueada cede el control en vez de frenar el
+  loop (ver `_retry_locked`).
+- Modo WAL: los lectores no se bloquean mientras otro proceso escribe.
+- PRAGMAs ajustados (synchronous, cache_size, mmap_size, busy_timeout).
+- Group commit opcional: las inserciones concurrentes se juntan en una sola transacción.
+"""
+import collections
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import async_mode
+import metrics
+
+DATABASE = os.getenv('DATABASE_PATH', 'flood_data.db')
+
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))            # Caché de páginas por conexión
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))     # Lecturas vía mmap (bytes)
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))         # Espera ante bloqueos de escritura
+DB_CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', '256'))      # Sentencias preparadas por conexión
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))                        # Conexiones libres que guarda cada worker (modo async)
+
+DB_GROUP_COMMIT = os.getenv('DB_GROUP_COMMIT', '0') == '1'                # Activa el group commit de inserciones
+DB_GROUP_COMMIT_MAX_BATCH = int(os.getenv('DB_GROUP_COMMIT_MAX_BATCH', '256'))
+DB_GROUP_COMMIT_WAIT_MS = float(os.getenv('DB_GROUP_COMMIT_WAIT_MS', '2'))  # Cuánto esperar a que lleguen más escrituras
+
+# Conexión por hilo real (modo sync y hilos de fondo fuera de gevent)
+_local = async_mode.thread_local()
+
+# Modo async: conexión por greenlet (threading.local ya está parcheado) y conexiones
+# libres del worker. Un deque: append/pop son atómicos y no dependen de los locks de gevent.
+_greenlet_local = threading.local()
+_pool = collections.deque()
+
+
+class ThreadConnection(sqlite3.Connection):
+    """
+    Conexión que pertenece a un hilo (o, en modo async, a un greenlet). `close()` no la
+    cierra: descarta una transacción pendiente y la deja lista para la próxima petición
+    del mismo hilo; en modo async la devuelve al pool del worker.
+    """
+    path = None
+    checkouts = 0         # get_connection() sin cerrar del greenlet que la tiene (modo async)
+    cooperative = False   # Espera los bloqueos cediendo el control en vez de con busy_timeout
+
+    def execute(self, *args):
+        if self.cooperative:
+            return _retry_locked(super().execute, *args)
+        return super().execute(*args)
+
+    def executemany(self, sql, params):
+        if self.cooperative:
+            return _retry_locked(super().executemany, sql, list(params))  # Una lista, por si hay que reintentar
+        return super().executemany(sql, params)
+
+    def commit(self):
+        if self.cooperative:
+            return _retry_locked(super().commit)
+        return super().commit()
+
+    def close(self):
+        if self.checkouts > 1:  # Cierre anidado: el greenlet sigue usándola
+            self.checkouts -= 1
+            return
+        if self.in_transaction:
+            self.rollback()
+        if self.checkouts:
+            self.checkouts = 0
+            _greenlet_local.conn = None
+            _check_in(self)
+
+    def really_close(self):
+        super().close()
+
+
+def _retry_locked(call, *args):
+    """
+    Reintenta `call` mientras otra conexión tenga la base bloqueada, hasta DB_BUSY_TIMEOUT_MS.
+    Reemplaza al busy_timeout en modo async: SQLite espera dentro de la librería C y
+    frenaría todo el worker, mientras que time.sleep (parcheado por gevent) cede el control.
+    """
+    deadline = time.monotonic() + DB_BUSY_TIMEOUT_MS / 1000
+    wait = 0.001
+    while True:
+        try:
+            return call(*args)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or time.monotonic() + wait > deadline:
+                raise
+        time.sleep(wait)
+        wait = min(wait * 2, 0.05)
+
+
+def _configure(conn):
+    conn.row_factory = sqlite3.Row # Permite acceder a las columnas por nombre
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')   # Seguro con WAL; solo se puede perder la última transacción ante un corte de luz
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout={0 if conn.cooperative else DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+
+def connect(path=None):
+    """Abre una conexión nueva (no compartida) con los PRAGMAs de la aplicación."""
+    cooperative = async_mode.active()
+    conn = sqlite3.connect(
+        path or DATABASE,
+        factory=ThreadConnection,
+        cached_statements=DB_CACHED_STATEMENTS,
+        timeout=0 if cooperative else DB_BUSY_TIMEOUT_MS / 1000,
+    )
+    conn.path = path or DATABASE
+    conn.cooperative = cooperative
+    _configure(conn)
+    return conn
+
+
+def get_connection():
+    """
+    Devuelve la conexión del hilo actual, creándola la primera vez. En modo async, la
+    del greenlet actual: la primera llamada la toma del pool y el `close()` que la
+    equilibra la devuelve.
+    """
+    if async_mode.active():
+        return _check_out()
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != DATABASE:
+        conn = _local.conn = connect()
+        _local.path = DATABASE
+    return conn
+
+
+def _check_out():
+    conn = getattr(_greenlet_local, 'conn', None)
+    if conn is None:
+        try:
+            conn = _pool.pop()
+        except IndexError:
+            conn = connect()
+        if conn.path != DATABASE:
+            conn.really_close()
+            conn = connect()
+        _greenlet_local.conn = conn
+    conn.checkouts += 1
+    return conn
+
+
+def _check_in(conn):
+    if len(_pool) < DB_POOL_SIZE and conn.path == DATABASE:
+        _pool.append(conn)
+    else:
+        conn.really_close()
+
+
+class GroupCommitWriter:
+    """
+    Hilo escritor único por proceso: junta las inserciones que llegan al mismo tiempo
+    y las confirma con un solo COMMIT. Cada llamador recibe su propio lastrowid.
+    """
+
+    def __init__(self, max_batch=DB_GROUP_COMMIT_MAX_BATCH, wait_ms=DB_GROUP_COMMIT_WAIT_MS):
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='db-group-commit', daemon=True)
+        self.thread.start()
+
+    def execute(self, sql, params, timeout=30):
+        """Encola una escritura y espera a que se confirme. Devuelve el lastrowid."""
+        future = Future()
+        self.pending.put((sql, params, future))
+        return future.result(timeout=timeout)
+
+    def _next_batch(self):
+        batch = [self.pending.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.pending.get(timeout=self.wait))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect()
+        while True:
+            batch = self._next_batch()
+            try:
+                results = []
+                with metrics.sqlite_query('group_commit.batch'), conn:  # Una sola transacción para todo el lote
+                    for sql, params, _ in batch:
+                        results.append(conn.execute(sql, params).lastrowid)
+                for (_, _, future), rowid in zip(batch, results):
+                    future.set_result(rowid)
+            except Exception:
+                # El lote se deshizo completo: se reintenta cada escritura por separado
+                # para que solo falle la que tiene el problema.
+                for sql, params, future in batch:
+                    try:
+                        with conn:
+                            future.set_result(conn.execute(sql, params).lastrowid)
+                    except Exception as e:
+                        future.set_exception(e)
+
+
+_group_writer = None
+_group_writer_lock = threading.Lock()
+
+
+def group_commit(sql, params):
+    """Ejecuta una escritura a través del hilo de group commit. Devuelve el lastrowid."""
+    global _group_writer
+    if _group_writer is None:
+        with _group_writer_lock:
+            if _group_writer is None:
+                _group_writer = GroupCommitWriter()
+    return _group_writer.execute(sql, params)
+
+
+# --- Tareas periódicas de un solo proceso ---
+
+def create_tables(cursor):
+    """Crea la tabla de turnos de las tareas periódicas si no existe."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS background_slots (
+            name TEXT PRIMARY KEY,
+            slot INTEGER NOT NULL -- Último turno (epoch // intervalo) que corrió algún proceso
+        )
+    ''')
+
+
+def claim_slot(conn, name, interval, now=None):
+    """
+    Reserva el turno actual (de `interval` segundos) de la tarea `name`. Con varios
+    workers todos lo intentan al empezar cada turno y solo uno recibe True; los
+    demás saltean la tarea hasta el turno siguiente.
+    """
+    slot = int((now or time.time()) // interval)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('SELECT slot FROM background_slots WHERE name = ?', (name,)).fetchone()
+        claimed = row is None or row[0] < slot
+        if claimed:
+            conn.execute('INSERT OR REPLACE INTO background_slots (name, slot) VALUES (?, ?)', (name, slot))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return claimed
@@ -0,0 +1,224 @@
+"""
+Detección de noticias casi duplicadas entre fuentes (la misma nota de agencia
+publicada por varios medios con títulos apenas distintos).
+
+- Huella: MinHash de DEDUPE_PERMUTATIONS valores sobre los fragmentos de
+  DEDUPE_SHINGLE caracteres del título y el comienzo del resumen, sin HTML,
+  tildes ni puntuación. La proporción de valores iguales entre dos
+  huellas estima la similitud de Jaccard de sus textos.
+- Índice LSH: la huella se corta en DEDUPE_BANDS bandas y cada banda es una
+  clave de bucket. Dos artículos solo se comparan si comparten algún bucket,
+  así que agrupar N artículos cuesta O(N) y no O(N²).
+- Las huellas y los buckets se guardan en SQLite: en cada corrida del
+  agregador solo se procesan los links nuevos, que se comparan también con los
+  de corridas anteriores. Cada artículo queda asignado a un grupo (el link del
+  primero que se vio) y al leer se devuelve uno por grupo con los demás adjuntos.
+"""
+import logging
+import os
+import re
+
+import numpy as np
+
+import metrics
+from relevance import fold
+
+log = logging.getLogger(__name__)
+
+DEDUPE_PERMUTATIONS = int(os.getenv('DEDUPE_PERMUTATIONS', '64'))   # Valores de cada huella MinHash
+DEDUPE_BANDS = int(os.getenv('DEDUPE_BANDS', '16'))                 # Bandas del índice LSH (debe dividir a DEDUPE_PERMUTATIONS)
+DEDUPE_THRESHOLD = float(os.getenv('DEDUPE_THRESHOLD', '0.5'))      # Similitud estimada mínima para considerar duplicados
+DEDUPE_SHINGLE = int(os.getenv('DEDUPE_SHINGLE', '5'))              # Largo de los fragmentos de texto comparados
+DEDUPE_MAX_CHARS = int(os.getenv('DEDUPE_MAX_CHARS', '400'))        # Caracteres del texto que entran en la huella
+
+_ROWS = DEDUPE_PERMUTATIONS // DEDUPE_BANDS
+# Permutaciones por multiplicación y desplazamiento: ((a·x + b) mod 2⁶⁴) >> 32 con `a` impar.
+# El desborde de uint64 hace el módulo gratis (sin la división de (a·x + b) mod p).
+_rng = np.random.RandomState(20240501)  # Semilla fija: las huellas guardadas siguen siendo comparables entre procesos
+_A = _rng.randint(0, 1 << 63, DEDUPE_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.randint(0, 1 << 63, DEDUPE_PERMUTATIONS, dtype=np.uint64)
+_POWERS = np.array([257 ** i for i in range(DEDUPE_SHINGLE - 1, -1, -1)], dtype=np.uint64)
+_MAX_SHINGLES_PER_BATCH = 20000  # Acota la matriz fragmentos × permutaciones
+
+_TAGS = re.compile(r'<[^>]+>')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+DUPLICATES = metrics.Counter('news_duplicates_total', 'Artículos agrupados con otro casi idéntico.')
+
+
+def create_tables(cursor):
+    """Crea las tablas de huellas y del índice LSH."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS news_fingerprints (
+            link TEXT PRIMARY KEY,
+            cluster TEXT NOT NULL, -- Link del primer artículo del grupo
+            signature BLOB -- MinHash (uint32); NULL si el texto era demasiado corto
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_news_fingerprints_cluster ON news_fingerprints (cluster)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS news_lsh_buckets (
+            bucket INTEGER NOT NULL,
+            link TEXT NOT NULL,
+            PRIMARY KEY (bucket, link)
+        ) WITHOUT ROWID
+    ''')
+
+
+# --- Huellas ---
+
+def normalize(title, summary):
+    """Texto comparable: sin HTML, en minúsculas, sin tildes ni puntuación."""
+    text = fold(f"{title or ''} {_TAGS.sub(' ', summary or '')}")
+    return _NON_WORD.sub(' ', text).strip()[:DEDUPE_MAX_CHARS]
+
+
+def _shingles(texts):
+    """
+    Hashes (32 bits) de los fragmentos de DEDUPE_SHINGLE caracteres de todos los
+    textos, sin repetidos dentro de cada texto, ordenados por texto. Se calculan
+    en una sola pasada sobre los textos concatenados. Devuelve (hashes, cantidad por texto).
+    """
+    data = np.frombuffer('\n'.join(texts).encode('ascii'), dtype=np.uint8)
+    if len(data) < DEDUPE_SHINGLE:
+        return np.empty(0, dtype=np.uint64), np.zeros(len(texts), dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(data, DEDUPE_SHINGLE)
+    hashes = (windows.astype(np.uint64) * _POWERS).sum(axis=1) & np.uint64(0xFFFFFFFF)
+    # Los fragmentos que cruzan el separador entre dos textos no cuentan
+    separators = np.cumsum(data == ord('\n'))
+    text_of = separators[:len(hashes)]
+    valid = separators[DEDUPE_SHINGLE - 1:] == text_of + (data[:len(hashes)] == ord('\n'))
+    valid &= data[:len(hashes)] != ord('\n')
+    keys = np.sort((text_of[valid].astype(np.uint64) << np.uint64(32)) | hashes[valid])
+    keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    counts = np.bincount((keys >> np.uint64(32)).astype(np.int64), minlength=len(texts))
+    return keys & np.uint64(0xFFFFFFFF), counts
+
+
+def signatures(texts):
+    """
+    Matriz (textos × DEDUPE_PERMUTATIONS) de MinHash en uint32. Todas las
+    permutaciones de todos los fragmentos se calculan en bloque con NumPy.
+    Los textos sin fragmentos quedan con la fila en 0xFFFFFFFF.
+    """
+    result = np.full((len(texts), DEDUPE_PERMUTATIONS), 0xFFFFFFFF, dtype=np.uint32)
+    hashes, counts = _shingles(texts)
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(texts):
+        # Lote de textos con a lo sumo _MAX_SHINGLES_PER_BATCH fragmentos (siempre al menos uno)
+        first = ends[start] - counts[start]
+        stop = max(int(np.searchsorted(ends, first + _MAX_SHINGLES_PER_BATCH, side='right')), start + 1)
+        batch_counts = counts[start:stop]
+        if ends[stop - 1] > first:
+            # Permutaciones × fragmentos: cada fila es contigua para el mínimo por texto
+            with np.errstate(over='ignore'):
+                values = ((_A[:, None] * hashes[first:ends[stop - 1]][None, :] + _B[:, None]) >> np.uint64(32)).astype(np.uint32)
+            nonempty = np.flatnonzero(batch_counts)
+            offsets = np.concatenate(([0], np.cumsum(batch_counts[nonempty])[:-1]))
+            result[start + nonempty] = np.minimum.reduceat(values, offsets, axis=1).T
+        start = stop
+    return result
+
+
+def band_keys(signature_matrix):
+    """Clave de bucket (int64) de cada banda de cada huella: (textos × DEDUPE_BANDS)."""
+    bands = signature_matrix.astype(np.uint64).reshape(len(signature_matrix), DEDUPE_BANDS, _ROWS)
+    keys = np.arange(DEDUPE_BANDS, dtype=np.uint64)[None, :] + np.uint64(0x9E3779B97F4A7C15)
+    with np.errstate(over='ignore'):
+        for row in range(_ROWS):
+            keys = (keys ^ bands[:, :, row]) * np.uint64(0x100000001B3)
+            keys ^= keys >> np.uint64(29)
+    return keys.view(np.int64)
+
+
+def similarity(a, b):
+    """Similitud de Jaccard estimada a partir de dos huellas."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+# --- Agrupamiento incremental ---
+
+@metrics.sqlite_query('news.dedupe')
+def assign_clusters(conn, news_items):
+    """
+    Calcula la huella de los links que todavía no tienen una y los asigna al grupo
+    del artículo más parecido (de esta corrida o de las anteriores) si supera
+    DEDUPE_THRESHOLD; si no, abren un grupo propio. Se ejecuta dentro de la
+    transacción del llamador. Devuelve cuántos artículos nuevos resultaron duplicados.
+    """
+    items = {}
+    for item in news_items:
+        if item.get('link') and item['link'] != '#':
+            items.setdefault(item['link'], item)
+    known = {row[0] for row in conn.execute('SELECT link FROM news_fingerprints')}
+    new = [item for link, item in items.items() if link not in known]
+    if not new:
+        return 0
+
+    matrix = signatures([normalize(item['title'], item['summary']) for item in new])
+    keys = band_keys(matrix)
+    run_buckets = {}   # Buckets de los artículos de esta corrida: clave → [índice en `new`]
+    clusters = []
+    fingerprint_rows, bucket_rows = [], []
+    duplicates = 0
+    placeholders = ', '.join('?' * DEDUPE_BANDS)
+    for i, item in enumerate(new):
+        signature = matrix[i]
+        cluster = item['link']
+        if (signature == 0xFFFFFFFF).all():  # Texto demasiado corto para comparar
+            fingerprint_rows.append((item['link'], cluster, None))
+            clusters.append(cluster)
+            continue
+        row_keys = keys[i].tolist()
+        best = DEDUPE_THRESHOLD
+        for link, candidate_cluster, blob in conn.execute(f'''
+            SELECT DISTINCT f.link, f.cluster, f.signature
+            FROM news_lsh_buckets b JOIN news_fingerprints f ON f.link = b.link
+            WHERE b.bucket IN ({placeholders})
+        ''', row_keys):
+            score = similarity(signature, np.frombuffer(blob, dtype=np.uint32))
+            if score >= best:
+                best, cluster = score, candidate_cluster
+        for j in {j for key in row_keys for j in run_buckets.get(key, ())}:
+            score = similarity(signature, matrix[j])
+            if score >= best:
+                best, cluster = score, clusters[j]
+        if cluster != item['link']:
+            duplicates += 1
+        clusters.append(cluster)
+        for key in row_keys:
+            run_buckets.setdefault(key, []).append(i)
+        fingerprint_rows.append((item['link'], cluster, signature.tobytes()))
+        bucket_rows.extend((key, item['link']) for key in row_keys)
+
+    conn.executemany('INSERT OR REPLACE INTO news_fingerprints (link, cluster, signature) VALUES (?, ?, ?)', fingerprint_rows)
+    conn.executemany('INSERT OR IGNORE INTO news_lsh_buckets (bucket, link) VALUES (?, ?)', bucket_rows)
+    DUPLICATES.inc(amount=duplicates)
+    return duplicates
+
+
+def prune(conn):
+    """Borra huellas y buckets de artículos que ya no están en news_articles."""
+    conn.execute('DELETE FROM news_fingerprints WHERE link NOT IN (SELECT link FROM news_articles)')
+    conn.execute('DELETE FROM news_lsh_buckets WHERE link NOT IN (SELECT link FROM news_articles)')
+
+
+def group(articles):
+    """
+    Deja un artículo por grupo (el primero en el orden recibido) y le agrega en
+    "relatedArticles" fuente, título y link de los demás. `articles` trae "cluster".
+    """
+    representatives = {}
+    result = []
+    for article in articles:
+        cluster = article.pop('cluster', None) or article['link']
+        representative = representatives.get(cluster)
+        if representative is None:
+            article['relatedArticles'] = []
+            representatives[cluster] = article
+            result.append(article)
+        else:
+            representative['relatedArticles'].append(
+                {'source': article['source'], 'title': article['title'], 'link': article['link']})
+    return result
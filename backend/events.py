@@ -0,0 +1,247 @@
+"""
+Canal de eventos en vivo (Server-Sent Events) para el frontend: reportes de
+inundación nuevos y alertas del SMN nuevas o modificadas.
+
+- Cada evento se guarda en la tabla `events` (id creciente), así que lo que se
+  publica en un worker de gunicorn llega a los clientes de todos los demás.
+- Por proceso hay un solo hilo lector que trae los eventos nuevos de la base
+  (una consulta cada EVENTS_POLL_INTERVAL, no una por cliente) y los deja en un
+  buffer circular ya formateados. Las conexiones no tienen cola propia: esperan
+  todas en la misma Condition y copian del buffer lo que les falta. En modo async
+  (gevent) una conexión inactiva es solo un greenlet dormido.
+- Reanudación: el navegador reenvía Last-Event-ID al reconectarse y se le
+  mandan los eventos posteriores, del buffer o, si ya salieron de él, de la tabla.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+import async_mode
+import db
+import metrics
+
+log = logging.getLogger(__name__)
+
+EVENTS_BUFFER_SIZE = int(os.getenv('EVENTS_BUFFER_SIZE', '1024'))        # Eventos recientes en memoria por proceso
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', '0.5'))   # Segundos entre lecturas de la tabla
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', '15'))            # Comentario periódico para proxies y balanceadores
+EVENTS_REPLAY_MAX = int(os.getenv('EVENTS_REPLAY_MAX', '1000'))          # Máximo de eventos reenviados al reanudar
+EVENTS_MAX_ROWS = int(os.getenv('EVENTS_MAX_ROWS', '20000'))             # Filas que se conservan en la tabla
+EVENTS_RETRY_MS = int(os.getenv('EVENTS_RETRY_MS', '3000'))              # Espera sugerida al navegador para reconectar
+# En modo sync cada conexión abierta ocupa un hilo del worker (GUNICORN_THREADS, ver gunicorn.conf.py): por
+# defecto se usa como mucho la cuarta parte, para no dejar sin hilos al resto de la API. Las pestañas que no
+# entran reciben 503 y el frontend pasa a consultar periódicamente.
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '8'))
+EVENTS_MAX_CLIENTS = int(os.getenv('EVENTS_MAX_CLIENTS', '10000' if async_mode.active() else str(max(1, GUNICORN_THREADS // 4))))
+
+EVENT_TYPES = ('flood_report', 'flood_reports_bulk', 'smn_alert')
+
+metrics.Collector('sse_clients', 'Conexiones SSE abiertas en este proceso.', 'gauge', (),
+                  lambda: [((), hub.clients)])
+EVENTS_PUBLISHED = metrics.Counter('sse_events_published_total', 'Eventos publicados por este proceso.', ('type',))
+
+
+class TooManyClients(Exception):
+    """Se alcanzó EVENTS_MAX_CLIENTS en este proceso."""
+
+
+def create_tables(cursor):
+    """Crea la tabla de eventos si no existe."""
+    # AUTOINCREMENT: los ids no se reutilizan al podar la tabla (Last-Event-ID sigue siendo válido)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL, -- JSON
+            created_at REAL NOT NULL
+        )
+    ''')
+
+
+def _format(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'.encode('utf-8')
+
+
+_INSERT_SQL = 'INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)'
+
+
+def insert(conn, event_type, payload):
+    """Agrega un evento dentro de la transacción en curso de `conn` (el llamador confirma y luego llama a notify())."""
+    conn.execute(_INSERT_SQL, (event_type, json.dumps(payload, ensure_ascii=False, default=str), time.time()))
+    EVENTS_PUBLISHED.inc(event_type)
+
+
+def publish(event_type, payload):
+    """Guarda y difunde un evento. Devuelve su id."""
+    params = (event_type, json.dumps(payload, ensure_ascii=False, default=str), time.time())
+    if db.DB_GROUP_COMMIT:
+        event_id = db.group_commit(_INSERT_SQL, params)
+    else:
+        conn = db.get_connection()
+        with metrics.sqlite_query('events.insert'), conn:
+            event_id = conn.execute(_INSERT_SQL, params).lastrowid
+        conn.close()
+    EVENTS_PUBLISHED.inc(event_type)
+    notify()
+    return event_id
+
+
+def notify():
+    """Despierta al lector de este proceso para que no espere al próximo intervalo."""
+    hub.wake()
+
+
+class EventHub:
+    def __init__(self, buffer_size=EVENTS_BUFFER_SIZE):
+        self.buffer = collections.deque(maxlen=buffer_size)  # (id, tipo, bytes SSE)
+        self.last_id = None
+        self.clients = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Arranca (una sola vez por proceso) el hilo que lee la tabla de eventos."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            conn = db.get_connection()
+            self.last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+            conn.close()
+            self._thread = threading.Thread(target=self._run, name='events-reader', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        conn = db.connect()
+        polls = 0
+        while True:
+            self._wake.wait(EVENTS_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                with metrics.sqlite_query('events.poll'):
+                    rows = conn.execute('SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT 500',
+                                        (self.last_id,)).fetchall()
+                polls += 1
+                if polls % 1000 == 0:
+                    self._prune(conn)
+            except Exception as e:
+                log.warning("Error al leer la tabla de eventos", extra={'error': str(e)})
+                time.sleep(1)
+                continue
+            if not rows:
+                continue
+            with self._cond:
+                for row in rows:
+                    self.buffer.append((row['id'], row['type'], _format(row['id'], row['type'], row['data'])))
+                self.last_id = rows[-1]['id']
+                self._cond.notify_all()
+            if len(rows) == 500:
+                self._wake.set()  # Quedan más: seguir leyendo sin esperar
+
+    @staticmethod
+    def _prune(conn):
+        with conn:
+            conn.execute('DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?', (EVENTS_MAX_ROWS,))
+
+    def _replay(self, after, until):
+        """Eventos (after, until] que ya no están en el buffer, leídos de la tabla."""
+        conn = db.get_connection()
+        with metrics.sqlite_query('events.replay'):
+            rows = conn.execute('''
+                SELECT id, type, data FROM events WHERE id > ? AND id <= ? ORDER BY id DESC LIMIT ?
+            ''', (after, until, EVENTS_REPLAY_MAX)).fetchall()
+        conn.close()
+        return [(r['id'], r['type'], _format(r['id'], r['type'], r['data'])) for r in reversed(rows)]
+
+    def events_after(self, cursor):
+        """Eventos con id > cursor que este proceso ya conoce, en orden."""
+        with self._cond:
+            last_id = self.last_id
+            oldest = self.buffer[0][0] if self.buffer else last_id + 1
+            recent = []
+            for event in reversed(self.buffer):
+                if event[0] <= cursor:
+                    break
+                recent.append(event)
+        recent.reverse()
+        if cursor + 1 < oldest and cursor < last_id:
+            # El cliente se desconectó hace más de lo que guarda el buffer
+            return self._replay(cursor, oldest - 1) + recent
+        return recent
+
+    def wait_after(self, cursor, timeout):
+        """Espera hasta `timeout` segundos a que haya eventos con id > cursor."""
+        with self._cond:
+            if self.last_id <= cursor:
+                self._cond.wait(timeout)
+        return self.events_after(cursor)
+
+    def stream(self, last_event_id=None, types=None):
+        """
+        Respuesta SSE para un cliente. El lugar se reserva acá (contar y sumar bajo el
+        mismo lock, para que una ráfaga de conexiones no supere EVENTS_MAX_CLIENTS) y se
+        libera al cerrar la respuesta, aunque nunca se haya empezado a enviar.
+        Lanza TooManyClients si no hay lugar.
+        """
+        self.ensure_started()
+        with self._cond:
+            if self.clients >= EVENTS_MAX_CLIENTS:
+                raise TooManyClients()
+            self.clients += 1
+            # Sin Last-Event-ID el cliente recibe solo lo que pase a partir de ahora
+            start = self.last_id if last_event_id is None else last_event_id
+
+        def generate():
+            cursor = start
+            yield f'retry: {EVENTS_RETRY_MS}\n\n'.encode('utf-8')
+            while True:
+                events = self.wait_after(cursor, EVENTS_HEARTBEAT)
+                if not events:
+                    yield b': ping\n\n'
+                    continue
+                chunk = b''.join(payload for _, event_type, payload in events
+                                 if types is None or event_type in types)
+                cursor = events[-1][0]
+                if chunk:
+                    yield chunk
+
+        return ClientStream(self, generate())
+
+    def _release(self):
+        with self._cond:
+            self.clients -= 1
+
+
+class ClientStream:
+    """Iterable de una conexión SSE: el servidor WSGI llama a close() al terminar o si el cliente corta."""
+
+    def __init__(self, hub, generator):
+        self._hub = hub
+        self._generator = generator
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._generator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self._generator.close()
+        if not self._released:
+            self._released = True
+            self._hub._release()
+
+
+hub = EventHub()
@@ -0,0 +1,184 @@
+"""
+Exportación de reportes de inundación para herramientas GIS: GeoJSON
+(FeatureCollection), NDJSON (un reporte por línea, el mismo formato que acepta
+la carga masiva) o CSV.
+
+- La respuesta es un generador: las filas se leen de a EXPORT_FETCH_SIZE del
+  cursor de SQLite (nunca fetchall) y se envían en bloques de unos
+  EXPORT_CHUNK_BYTES. La memoria no depende de la cantidad de reportes y el
+  primer byte sale enseguida.
+- La consulta recorre un índice en el orden de salida (id, o fecha si se filtra
+  por tiempo), sin ordenar en memoria. Un bbox con pocos reportes usa el R*Tree
+  y ordena solo esos (como mucho EXPORT_RTREE_MAX_ROWS); uno grande se filtra
+  fila por fila mientras se recorre.
+- Cada exportación usa una conexión propia: lo exportado es una instantánea
+  consistente aunque entren reportes nuevos mientras tanto.
+- gzip opcional: si el cliente manda Accept-Encoding: gzip se comprime en
+  stream con zlib, bloque por bloque (Content-Encoding: gzip).
+"""
+import csv
+import io
+import json
+import logging
+import os
+import time
+import zlib
+
+import db
+import flood_reports
+import metrics
+from clusters import WATER_LEVELS
+
+log = logging.getLogger(__name__)
+
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '1000'))            # Filas leídas del cursor por vez
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', str(64 * 1024)))   # Tamaño aproximado de cada bloque enviado
+EXPORT_RTREE_MAX_ROWS = int(os.getenv('EXPORT_RTREE_MAX_ROWS', '50000'))    # Reportes del bbox hasta los que conviene el R*Tree
+EXPORT_GZIP_LEVEL = int(os.getenv('EXPORT_GZIP_LEVEL', '6'))
+
+FORMATS = {
+    'geojson': ('application/geo+json', 'geojson'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+CSV_COLUMNS = ('id', 'lat', 'lng', 'address', 'description', 'water_level', 'timestamp', 'image_url', 'image_full_url')
+
+EXPORTED_ROWS = metrics.Counter('export_rows_total', 'Reportes exportados por formato.', ('format',))
+
+
+def parse_water_levels(levels=None, minimum=None):
+    """
+    Niveles de agua pedidos ('alto,medio' y/o un mínimo), normalizados. None si no
+    se filtra por nivel. Lanza ValueError con un nivel desconocido.
+    """
+    selected = None
+    if levels:
+        selected = {level.strip().lower() for level in levels.split(',')}
+    if minimum:
+        threshold = WATER_LEVELS.get(minimum.strip().lower())
+        if threshold is None:
+            raise ValueError(f"min_water_level debe ser uno de: {', '.join(WATER_LEVELS)}")
+        at_least = {name for name, value in WATER_LEVELS.items() if value >= threshold}
+        selected = at_least if selected is None else selected & at_least
+    if selected is not None and not selected <= set(WATER_LEVELS):
+        raise ValueError(f"water_level debe ser uno o más de: {', '.join(WATER_LEVELS)}")
+    return sorted(selected) if selected is not None else None
+
+
+def build_query(conn, bbox=None, since=None, until=None, water_levels=None):
+    """SQL y parámetros de la exportación, en un orden que SQLite resuelve con un índice."""
+    use_rtree = (bool(bbox) and flood_reports.has_rtree(conn)
+                 and flood_reports.bbox_is_selective(conn, bbox, EXPORT_RTREE_MAX_ROWS // flood_reports.RTREE_SELECTIVITY_FACTOR))
+    from_clause, conditions, params = flood_reports.build_filters(conn, bbox, since, until, use_rtree=use_rtree)
+    if water_levels is not None:
+        conditions.append(f"lower(trim(r.water_level)) IN ({', '.join('?' * len(water_levels))})")
+        params += water_levels
+    sql = f"SELECT {flood_reports.REPORT_COLUMNS} FROM {from_clause}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # Con filtro de tiempo, idx_flood_reports_timestamp ya da el orden; si no, la clave primaria
+    sql += " ORDER BY r.timestamp, r.id" if (since or until) and not use_rtree else " ORDER BY r.id"
+    return sql, params
+
+
+# --- Formatos ---
+
+def _image_urls(image_filename, base_url):
+    if not image_filename:
+        return None, None
+    return f"{base_url}/api/uploads/thumbs/{image_filename}", f"{base_url}/api/uploads/{image_filename}"
+
+
+def _report(row, base_url):
+    report = dict(row)
+    report["image_url"], report["image_full_url"] = _image_urls(row['image_filename'], base_url)
+    return report
+
+
+def _feature(row, base_url):
+    properties = _report(row, base_url)
+    del properties["lat"], properties["lng"]
+    return {"type": "Feature", "id": row['id'],
+            "geometry": {"type": "Point", "coordinates": [row['lng'], row['lat']]},
+            "properties": properties}
+
+
+def _geojson(batches, base_url):
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ''
+    for batch in batches:
+        # Un solo json.dumps por lote: sin los corchetes, los features quedan separados por comas
+        yield separator + json.dumps([_feature(row, base_url) for row in batch], ensure_ascii=False)[1:-1]
+        separator = ',\n'
+    yield '\n]}\n'
+
+
+def _ndjson(batches, base_url):
+    for batch in batches:
+        yield ''.join(json.dumps(_report(row, base_url), ensure_ascii=False) + '\n' for row in batch)
+
+
+def _csv(batches, base_url):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for batch in batches:
+        writer.writerows((row['id'], row['lat'], row['lng'], row['address'], row['description'], row['water_level'],
+                          row['timestamp'], *_image_urls(row['image_filename'], base_url)) for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+WRITERS = {'geojson': _geojson, 'ndjson': _ndjson, 'csv': _csv}
+
+
+def _chunks(pieces, compress):
+    """Junta los fragmentos de texto en bloques de ~EXPORT_CHUNK_BYTES y los comprime si hace falta."""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if compress else None  # wbits=31: formato gzip
+    pending, size = [], 0
+    for piece in pieces:
+        pending.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_BYTES:
+            data = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def stream(fmt, bbox=None, since=None, until=None, water_levels=None, base_url='', compress=False):
+    """
+    Generador con el cuerpo de la exportación en bytes. La consulta se abre al
+    empezar a iterar y la conexión se cierra al terminar o si el cliente corta.
+    """
+    started = time.monotonic()
+    conn = db.connect()
+    exported = 0
+    try:
+        sql, params = build_query(conn, bbox, since, until, water_levels)
+        cursor = conn.execute(sql, params)
+
+        def batches():
+            nonlocal exported
+            while True:
+                batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not batch:
+                    return
+                exported += len(batch)
+                EXPORTED_ROWS.inc(fmt, amount=len(batch))
+                yield batch
+
+        yield from _chunks(WRITERS[fmt](batches(), base_url.rstrip('/')), compress)
+        log.info("Exportación completa", extra={'format': fmt, 'rows': exported, 'gzip': compress,
+                                                'seconds': round(time.monotonic() - started, 2)})
+    finally:
+        conn.really_close()
@@ -0,0 +1,233 @@
+"""
+Consultas sobre la tabla flood_reports: filtro por zona visible del mapa
+(bounding box), ventana de tiempo, paginación por cursor y sincronización
+incremental (solo los reportes nuevos desde el último id visto).
+
+El filtro espacial usa un índice R*Tree de SQLite (`flood_reports_rtree`) que
+se mantiene sincronizado con flood_reports mediante triggers. Si la versión de
+SQLite no trae el módulo R*Tree, se usa un índice común sobre (lat, lng).
+"""
+import base64
+import hashlib
+import json
+import logging
+import sqlite3
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+FLOOD_ZONES_DEFAULT_LIMIT = 1000   # Reportes por página si el cliente no pide otra cantidad
+FLOOD_ZONES_MAX_LIMIT = 5000       # Tope por página, para acotar el tamaño de la respuesta
+
+# Si el bbox contiene más de limit * RTREE_SELECTIVITY_FACTOR reportes conviene recorrer
+# el índice por fecha y cortar al llegar a `limit`, en vez de juntar y ordenar todos los del R*Tree.
+RTREE_SELECTIVITY_FACTOR = 10
+
+REPORT_COLUMNS = "r.id, r.lat, r.lng, r.address, r.description, r.water_level, r.image_filename, r.timestamp"
+
+
+def create_spatial_index(cursor):
+    """Crea el índice espacial y los triggers que lo mantienen al día (idempotente)."""
+    # lat/lng en el índice por fecha: el filtro por bbox se evalúa sin leer cada fila de la tabla
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_flood_reports_timestamp ON flood_reports (timestamp DESC, id DESC, lat, lng)')
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS flood_reports_rtree USING rtree(
+                id, min_lat, max_lat, min_lng, max_lng
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        log.warning("SQLite sin soporte R*Tree; se usa un índice común sobre lat/lng", extra={'error': str(e)})
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_flood_reports_lat_lng ON flood_reports (lat, lng)')
+        return
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS flood_reports_rtree_insert AFTER INSERT ON flood_reports BEGIN
+            INSERT INTO flood_reports_rtree (id, min_lat, max_lat, min_lng, max_lng)
+            VALUES (new.id, new.lat, new.lat, new.lng, new.lng);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS flood_reports_rtree_update AFTER UPDATE OF lat, lng ON flood_reports BEGIN
+            UPDATE flood_reports_rtree
+            SET min_lat = new.lat, max_lat = new.lat, min_lng = new.lng, max_lng = new.lng
+            WHERE id = new.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS flood_reports_rtree_delete AFTER DELETE ON flood_reports BEGIN
+            DELETE FROM flood_reports_rtree WHERE id = old.id;
+        END
+    ''')
+    # Reportes cargados antes de que existiera el índice
+    cursor.execute('''
+        INSERT INTO flood_reports_rtree (id, min_lat, max_lat, min_lng, max_lng)
+        SELECT id, lat, lat, lng, lng FROM flood_reports
+        WHERE id NOT IN (SELECT id FROM flood_reports_rtree)
+    ''')
+
+
+def create_change_tracking(cursor):
+    """
+    Crea el contador de versión de flood_reports. Los triggers lo incrementan en cada
+    alta, modificación o baja, así el ETag cambia aunque no cambie el id máximo.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('flood_reports', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS flood_reports_version_{event.lower()} AFTER {event} ON flood_reports BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'flood_reports';
+            END
+        ''')
+
+
+@metrics.sqlite_query('flood_reports.high_water')
+def get_high_water(conn):
+    """
+    Devuelve (id máximo, versión) de flood_reports sin leer las filas. Los dos valores
+    salen de una sola sentencia (una misma instantánea): con dos consultas, un alta
+    entre ambas daría una versión que ya cuenta una fila mayor que el id devuelto.
+    """
+    max_id, version = conn.execute('''
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM flood_reports),
+               (SELECT version FROM table_versions WHERE name = 'flood_reports')
+    ''').fetchone()
+    return max_id, (version or 0)
+
+
+def make_etag(high_water, *variant):
+    """ETag fuerte a partir de la marca de agua de la tabla y de lo que varía la respuesta (parámetros, host)."""
+    max_id, version = high_water
+    digest = hashlib.sha1(repr(variant).encode('utf-8')).hexdigest()[:12]
+    return f"fz-{max_id}-{version}-{digest}"
+
+
+def has_rtree(conn):
+    """True si la base tiene el índice R*Tree de reportes."""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'flood_reports_rtree'").fetchone()
+    return row is not None
+
+
+def encode_cursor(row):
+    """Cursor opaco para pedir la página siguiente a partir del último reporte devuelto."""
+    raw = json.dumps([row['timestamp'], row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Devuelve (timestamp, id) del cursor. Lanza ValueError si no es válido."""
+    try:
+        timestamp, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(timestamp), int(report_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def parse_bbox(value):
+    """Parsea 'oeste,sur,este,norte' (lng_min,lat_min,lng_max,lat_max, como GeoJSON). Lanza ValueError."""
+    parts = [float(p) for p in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError("bbox debe tener 4 valores: oeste,sur,este,norte")
+    min_lng, min_lat, max_lng, max_lat = parts
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ValueError("bbox inválido: el mínimo es mayor que el máximo")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def bbox_is_selective(conn, bbox, limit):
+    """
+    True si el bbox contiene pocos reportes (menos de limit * RTREE_SELECTIVITY_FACTOR).
+    El conteo se corta en ese umbral, así que su costo está acotado aunque el bbox sea enorme.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    threshold = limit * RTREE_SELECTIVITY_FACTOR
+    (matches,) = conn.execute('''
+        SELECT count(*) FROM (
+            SELECT 1 FROM flood_reports_rtree
+            WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ?
+            LIMIT ?
+        )
+    ''', (min_lat, max_lat, min_lng, max_lng, threshold)).fetchone()
+    return matches < threshold
+
+
+def build_filters(conn, bbox=None, since=None, until=None, use_rtree=None):
+    """
+    Arma (FROM, condiciones WHERE, parámetros) para los filtros de zona y tiempo.
+    `use_rtree=None` usa el R*Tree siempre que exista.
+    """
+    from_clause = "flood_reports r"
+    conditions = []
+    params = []
+    if bbox:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        if use_rtree is None:
+            use_rtree = has_rtree(conn)
+        if use_rtree:
+            from_clause += " JOIN flood_reports_rtree t ON t.id = r.id"
+            # El R*Tree guarda coordenadas en float32 redondeadas hacia afuera, por eso se buscan
+            # cajas que se crucen con el bbox y después se confirma con los valores exactos.
+            conditions.append("t.max_lat >= ? AND t.min_lat <= ? AND t.max_lng >= ? AND t.min_lng <= ?")
+            params += [min_lat, max_lat, min_lng, max_lng]
+        conditions.append("r.lat BETWEEN ? AND ? AND r.lng BETWEEN ? AND ?")
+        params += [min_lat, max_lat, min_lng, max_lng]
+    if since:
+        conditions.append("r.timestamp >= ?")
+        params.append(since)
+    if until:
+        conditions.append("r.timestamp < ?")
+        params.append(until)
+    return from_clause, conditions, params
+
+
+@metrics.sqlite_query('flood_reports.query')
+def query_reports(conn, bbox=None, since=None, until=None, limit=FLOOD_ZONES_DEFAULT_LIMIT, cursor=None):
+    """
+    Devuelve (filas, cursor_siguiente) con los reportes más recientes primero.
+    `cursor_siguiente` es None cuando no hay más páginas.
+    """
+    use_rtree = bool(bbox) and has_rtree(conn) and bbox_is_selective(conn, bbox, limit)
+    from_clause, conditions, params = build_filters(conn, bbox, since, until, use_rtree=use_rtree)
+    if cursor:
+        cursor_timestamp, cursor_id = decode_cursor(cursor)
+        # Comparación de tuplas: SQLite la resuelve como rango sobre idx_flood_reports_timestamp
+        conditions.append("(r.timestamp, r.id) < (?, ?)")
+        params += [cursor_timestamp, cursor_id]
+
+    sql = f"SELECT {REPORT_COLUMNS} FROM {from_clause}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # Se pide una fila de más para saber si hay página siguiente
+    sql += " ORDER BY r.timestamp DESC, r.id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+
+@metrics.sqlite_query('flood_reports.query_since')
+def query_reports_since(conn, since_id, bbox=None, limit=FLOOD_ZONES_DEFAULT_LIMIT):
+    """
+    Reportes con id mayor a `since_id`, en orden de alta (id ascendente).
+    Devuelve (filas, hay_mas); para seguir, se vuelve a pedir con el último id recibido.
+    """
+    # Los reportes nuevos son pocos: se recorre el rango de ids y se filtra el bbox fila por fila.
+    from_clause, conditions, params = build_filters(conn, bbox, use_rtree=False)
+    conditions.append("r.id > ?")
+    params.append(since_id)
+    sql = f"SELECT {REPORT_COLUMNS} FROM {from_clause} WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY r.id ASC LIMIT ?"
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    return rows[:limit], len(rows) > limit
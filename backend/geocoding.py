@@ -0,0 +1,277 @@
+"""
+Geocodificación con Nominatim (OpenStreetMap) detrás de una caché persistente
+y un limitador de tasa.
+
+- Las direcciones se normalizan (minúsculas, sin tildes ni signos, espacios
+  colapsados) y el resultado se guarda en la tabla `geocode_cache` de SQLite,
+  con desalojo LRU. Una misma dirección nunca se consulta dos veces.
+- El limitador es un token bucket guardado en SQLite, así que vale para todos
+  los hilos y todos los workers: Nominatim permite ~1 petición por segundo.
+- Las direcciones que no están en caché pueden resolverse en segundo plano
+  (cola + hilo trabajador) para el endpoint por lotes.
+"""
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import cache
+import db
+import http_client
+import metrics
+from relevance import fold
+
+log = logging.getLogger(__name__)
+
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search')
+NOMINATIM_USER_AGENT = "AlertaInundaciones.IA (klini@ejemplo.com)"  # Personaliza esto
+NOMINATIM_TIMEOUT = float(os.getenv('NOMINATIM_TIMEOUT', '5'))
+
+GEOCODE_RATE_PER_SEC = float(os.getenv('GEOCODE_RATE_PER_SEC', '1'))       # Política de uso de Nominatim
+GEOCODE_BURST = float(os.getenv('GEOCODE_BURST', '1'))                      # Capacidad del bucket
+GEOCODE_MAX_WAIT = float(os.getenv('GEOCODE_MAX_WAIT', '5'))                # Espera máxima por un turno en /geocode
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '50000'))
+GEOCODE_NEGATIVE_TTL = int(os.getenv('GEOCODE_NEGATIVE_TTL', str(24 * 3600)))  # "Sin resultados" se reintenta después de esto
+GEOCODE_QUEUE_SIZE = int(os.getenv('GEOCODE_QUEUE_SIZE', '1000'))
+GEOCODE_BATCH_MAX = 100                                                     # Direcciones por llamada al endpoint por lotes
+
+_TOUCH_INTERVAL = 3600   # Solo se actualiza last_used_at si pasó al menos esto (evita una escritura por acierto)
+
+# Capa en memoria delante de SQLite: además agrupa consultas simultáneas de la misma dirección.
+_memory_cache = cache.SingleFlightCache('geocode', ttl=3600, max_entries=4096)
+
+_pending = queue.Queue(maxsize=GEOCODE_QUEUE_SIZE)
+_pending_keys = set()
+_pending_lock = threading.Lock()
+_worker = None
+
+
+class RateLimited(Exception):
+    """No hubo turno libre para consultar Nominatim dentro del tiempo de espera."""
+
+
+def create_tables(cursor):
+    """Crea la caché de geocodificación y el estado del limitador si no existen."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            query_key TEXT PRIMARY KEY, -- Dirección normalizada
+            address TEXT NOT NULL,      -- Dirección tal como se consultó la primera vez
+            latitude TEXT,              -- NULL si Nominatim no encontró resultados
+            longitude TEXT,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_geocode_cache_last_used ON geocode_cache (last_used_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+
+def normalize_address(address):
+    """'Av. Espora 1234,  Adrogué ' → 'av espora 1234, adrogue'."""
+    text = fold(address)
+    text = re.sub(r"[^\w,]+", ' ', text)
+    text = re.sub(r'\s*,\s*', ', ', text)
+    return re.sub(r'\s+', ' ', text).strip(' ,')
+
+
+# --- Limitador de tasa (token bucket compartido entre procesos) ---
+
+@metrics.sqlite_query('geocode.rate_limit')
+def _try_take_token(conn, name, rate, burst):
+    """Intenta tomar un token. Devuelve 0 si lo consiguió o los segundos a esperar."""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')  # Serializa el acceso al bucket entre workers
+    try:
+        row = conn.execute('SELECT tokens, updated_at FROM rate_limits WHERE name = ?', (name,)).fetchone()
+        tokens = burst if row is None else min(burst, row['tokens'] + (now - row['updated_at']) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        conn.execute('INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at) VALUES (?, ?, ?)', (name, tokens, now))
+        conn.execute('COMMIT')
+        return wait
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def acquire(max_wait, name='nominatim', rate=GEOCODE_RATE_PER_SEC, burst=GEOCODE_BURST):
+    """Espera un turno para llamar a la API. Lanza RateLimited si no llega antes de `max_wait`."""
+    deadline = time.monotonic() + max_wait
+    conn = db.get_connection()
+    try:
+        while True:
+            wait = _try_take_token(conn, name, rate, burst)
+            if wait == 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(f"Límite de {rate} consultas/s a Nominatim")
+            time.sleep(wait)
+    finally:
+        conn.close()
+
+
+# --- Caché persistente ---
+
+@metrics.sqlite_query('geocode.lookup')
+def _lookup(conn, key):
+    """Busca en SQLite. Devuelve (encontrado_en_cache, resultado_o_None)."""
+    row = conn.execute(
+        'SELECT latitude, longitude, created_at, last_used_at FROM geocode_cache WHERE query_key = ?', (key,)
+    ).fetchone()
+    if row is None:
+        return False, None
+    now = time.time()
+    if row['latitude'] is None and now - row['created_at'] > GEOCODE_NEGATIVE_TTL:
+        return False, None  # Resultado negativo vencido: se vuelve a consultar
+    if now - row['last_used_at'] > _TOUCH_INTERVAL:
+        with conn:
+            conn.execute('UPDATE geocode_cache SET last_used_at = ? WHERE query_key = ?', (now, key))
+    if row['latitude'] is None:
+        return True, None
+    return True, {"latitude": row['latitude'], "longitude": row['longitude']}
+
+
+@metrics.sqlite_query('geocode.store')
+def _store(conn, key, address, result):
+    now = time.time()
+    with conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO geocode_cache (query_key, address, latitude, longitude, created_at, last_used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key, address, result and result['latitude'], result and result['longitude'], now, now))
+        # Desalojo LRU: se borran las menos usadas recientemente por encima del máximo
+        conn.execute('''
+            DELETE FROM geocode_cache WHERE query_key IN (
+                SELECT query_key FROM geocode_cache ORDER BY last_used_at
+                LIMIT max(0, (SELECT count(*) FROM geocode_cache) - ?)
+            )
+        ''', (GEOCODE_CACHE_MAX_ENTRIES,))
+
+
+def _query_nominatim(address):
+    params = {"q": address, "format": "json", "limit": 1}
+    headers = {"User-Agent": NOMINATIM_USER_AGENT}
+    with metrics.upstream_call('Nominatim'):
+        # Sin reintentos: cada llamada tiene que pasar por el limitador de tasa (política de uso de Nominatim)
+        response = http_client.get(NOMINATIM_URL, source='Nominatim', params=params, headers=headers,
+                                   timeout=NOMINATIM_TIMEOUT, retries=0)
+        response.raise_for_status()
+        data = response.json()
+    if data:
+        return {"latitude": data[0]["lat"], "longitude": data[0]["lon"]}
+    return None
+
+
+def _resolve(key, address, max_wait):
+    conn = db.get_connection()
+    try:
+        found, result = _lookup(conn, key)
+        if found:
+            return result
+        # Con Nominatim caído no tiene sentido esperar un turno del limitador
+        http_client.breaker('Nominatim').raise_if_open()
+        acquire(max_wait)
+        # Otro worker pudo haberla resuelto mientras esperábamos el turno
+        found, result = _lookup(conn, key)
+        if found:
+            return result
+        result = _query_nominatim(address)
+        _store(conn, key, address, result)
+        return result
+    finally:
+        conn.close()
+
+
+def geocode(address, max_wait=GEOCODE_MAX_WAIT):
+    """
+    Devuelve {"latitude", "longitude"} o None si no hay resultados.
+    Lanza RateLimited o requests.RequestException si no se pudo consultar.
+    """
+    key = normalize_address(address)
+    return _memory_cache.get_or_load(key, lambda: _resolve(key, address, max_wait))
+
+
+def cached(address):
+    """Solo consulta las cachés, sin red. Devuelve (encontrado, resultado)."""
+    key = normalize_address(address)
+    conn = db.get_connection()
+    try:
+        return _lookup(conn, key)
+    finally:
+        conn.close()
+
+
+# --- Resolución en segundo plano para el endpoint por lotes ---
+
+def _run_worker():
+    while True:
+        key, address = _pending.get()
+        try:
+            geocode(address, max_wait=60)
+        except Exception as e:
+            log.warning("Error al geocodificar en segundo plano", extra={'address': address, 'error': str(e)})
+        finally:
+            with _pending_lock:
+                _pending_keys.discard(key)
+
+
+def enqueue(address):
+    """Encola una dirección para resolverla en segundo plano. Devuelve False si la cola está llena."""
+    global _worker
+    key = normalize_address(address)
+    with _pending_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, name='geocode-worker', daemon=True)
+            _worker.start()
+        if key in _pending_keys:
+            return True
+        try:
+            _pending.put_nowait((key, address))
+        except queue.Full:
+            return False
+        _pending_keys.add(key)
+    return True
+
+
+def geocode_batch(addresses):
+    """
+    Resuelve varias direcciones sin esperar a la red: devuelve lo que ya está en caché
+    y encola el resto. Cada resultado tiene status 'ok', 'not_found', 'pending' o 'queue_full'.
+    """
+    results = []
+    for address in addresses:
+        found, result = cached(address)
+        if found and result:
+            results.append({"address": address, "status": "ok", **result})
+        elif found:
+            results.append({"address": address, "status": "not_found"})
+        else:
+            status = "pending" if enqueue(address) else "queue_full"
+            results.append({"address": address, "status": status})
+    return results
+
+
+def stats():
+    """Contadores de la caché en memoria, tamaño de la persistente y direcciones en cola."""
+    conn = db.get_connection()
+    try:
+        persisted = conn.execute('SELECT count(*) FROM geocode_cache').fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        "memory": _memory_cache.stats(),
+        "persisted_entries": persisted,
+        "max_persisted_entries": GEOCODE_CACHE_MAX_ENTRIES,
+        "pending": _pending.qsize(),
+    }
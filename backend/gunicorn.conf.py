@@ -0,0 +1,37 @@
+"""
+Configuración de gunicorn (desde backend/):
+
+    gunicorn -c gunicorn.conf.py app:app                    # modo sync: workers con hilos
+    SERVER_MODE=async gunicorn -c gunicorn.conf.py app:app  # modo async: workers gevent
+
+En modo sync cada petición ocupa un hilo mientras espera a un servicio externo:
+con OpenWeatherMap o Nominatim lentos, los GUNICORN_THREADS de cada worker se
+agotan y hasta las rutas que solo leen SQLite quedan en cola. En modo async cada
+worker atiende hasta WORKER_CONNECTIONS peticiones a la vez con greenlets; la
+espera de red cede el control (ver async_mode.py y http_client.py).
+"""
+import multiprocessing
+import os
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'sync')  # 'sync' (gthread) o 'async' (gevent)
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(4, multiprocessing.cpu_count() * 2))))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+keepalive = 5
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+if SERVER_MODE == 'async':
+    worker_class = 'gevent'
+    worker_connections = int(os.getenv('WORKER_CONNECTIONS', '1000'))
+elif SERVER_MODE == 'sync':
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', '8'))
+else:
+    raise SystemExit(f"SERVER_MODE desconocido: {SERVER_MODE!r} (opciones: sync, async)")
+
+
+def post_worker_init(worker):
+    # Después de cargar la app (y, en modo async, de parchear con gevent): hilos de fondo una vez por worker
+    import app
+    app.start_background_workers()
@@ -0,0 +1,297 @@
+"""
+Cliente HTTP compartido para todos los servicios externos (feeds RSS, GNews,
+OpenWeatherMap, Nominatim, SMN).
+
+Una sola requests.Session por proceso con un pool de conexiones keep-alive por
+host: las llamadas repetidas al mismo servicio no pagan de nuevo el handshake
+TCP/TLS. En modo async (gevent) los sockets del pool son cooperativos, así que
+una petición que espera a un servicio lento no retiene el worker.
+
+Cada llamada se hace en nombre de una fuente (el mismo nombre que usan las
+métricas) y pasa por:
+- timeouts separados de conexión (HTTP_CONNECT_TIMEOUT) y de lectura (el
+  `timeout` de cada llamada);
+- reintentos acotados (HTTP_RETRIES) con espera exponencial y jitter completo,
+  solo ante errores de conexión y respuestas 429/502/503/504. Un timeout de
+  lectura no se reintenta (el servicio está lento, no caído) y no se reintenta
+  si la llamada ya gastó su `timeout`;
+- un circuit breaker por fuente: tras BREAKER_FAILURE_THRESHOLD llamadas
+  fallidas seguidas el circuito se abre y las llamadas fallan al instante con
+  CircuitOpenError durante BREAKER_RESET_TIMEOUT segundos. Después se deja pasar
+  una sola llamada de prueba: si responde, se cierra; si no, vuelve a abrirse.
+  Mientras tanto cada llamador sirve lo último que obtuvo bien (cachés con
+  `stale_ttl`, entradas guardadas de cada feed).
+
+El estado de los breakers es por proceso, como las métricas: con varios
+workers de gunicorn cada uno lleva el suyo.
+
+Para destinos elegidos por los usuarios (webhooks) está public_only_session():
+una sesión aparte que, al abrir cada conexión, comprueba la dirección del otro
+extremo del socket ya conectado y la cierra si no es pública. Así no importa lo
+que devuelva el DNS entre la validación y la conexión (DNS rebinding).
+"""
+import datetime
+import ipaddress
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '16'))  # Hosts distintos con pool propio
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '32'))          # Conexiones guardadas por host
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))  # Segundos para abrir la conexión
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))                     # Reintentos ante errores transitorios
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.25'))      # Espera base entre reintentos (se duplica)
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '2'))           # Tope de cada espera
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))  # Fallos seguidos que abren el circuito
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))      # Segundos abierto antes de probar de nuevo
+
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+RETRIES = metrics.Counter('upstream_retries_total', 'Reintentos de llamadas a servicios externos.', ('source',))
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+session.mount('http://', _adapter)
+session.mount('https://', _adapter)
+
+
+# --- Destinos públicos ---
+
+def is_public_address(value):
+    """True si la IP (texto) es global; las IPv6 con una IPv4 adentro (::ffff:a.b.c.d) se juzgan por esta."""
+    address = ipaddress.ip_address(value.split('%', 1)[0])
+    address = getattr(address, 'ipv4_mapped', None) or address
+    return address.is_global
+
+
+def _checked_socket(conn, sock):
+    peer = sock.getpeername()[0]
+    if not is_public_address(peer):
+        sock.close()
+        raise NewConnectionError(conn, f"Conexión rechazada: {conn.host} resolvió a una dirección no pública ({peer})")
+    return sock
+
+
+class _PublicHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        return _checked_socket(self, super()._new_conn())
+
+
+class _PublicHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        return _checked_socket(self, super()._new_conn())
+
+
+class _PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _PublicHTTPConnection
+
+
+class _PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _PublicHTTPSConnection
+
+
+class PublicOnlyAdapter(HTTPAdapter):
+    """Adapter que solo deja abrir conexiones cuyo otro extremo es una dirección pública."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _PublicHTTPConnectionPool, 'https': _PublicHTTPSConnectionPool}
+
+
+def public_only_session():
+    """Sesión para destinos elegidos por usuarios: sin proxies del entorno y solo hacia direcciones públicas."""
+    public = requests.Session()
+    public.trust_env = False  # Con un proxy, el otro extremo sería el proxy y no el destino
+    adapter = PublicOnlyAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+    public.mount('http://', adapter)
+    public.mount('https://', adapter)
+    return public
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """La fuente está marcada como caída: no se la llama hasta que pase BREAKER_RESET_TIMEOUT."""
+
+    def __init__(self, source, retry_in):
+        super().__init__(f"Circuito abierto para {source}: sin llamadas por {retry_in:.0f}s")
+        self.source = source
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Breaker de una fuente: closed → open (tras fallos seguidos) → half_open (una prueba) → closed."""
+
+    STATES = ('closed', 'half_open', 'open')  # En este orden se exporta como número en /metrics
+
+    def __init__(self, source, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.source = source
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = None           # time.time() de la última apertura
+        self.last_error = None
+        self.failures = 0
+        self.rejected = 0               # Llamadas que fallaron al instante por el circuito abierto
+        self._probe_started = None      # time.time() de la llamada de prueba en curso (half_open)
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Lanza CircuitOpenError si no se debe llamar ahora; en half_open deja pasar una sola prueba."""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            now = time.time()
+            retry_in = self.opened_at + self.reset_timeout - now
+            if self.state == 'open' and retry_in <= 0:
+                self.state = 'half_open'
+            # Una prueba que nunca informó (el hilo murió, timeout de gevent) no bloquea para siempre
+            if self.state == 'half_open' and (self._probe_started is None or now - self._probe_started > self.reset_timeout):
+                self._probe_started = now
+                return
+            self.rejected += 1
+        raise CircuitOpenError(self.source, max(retry_in, 0))
+
+    def raise_if_open(self):
+        """Como before_call pero sin ocupar la llamada de prueba: para no esperar turnos en vano."""
+        with self._lock:
+            retry_in = self.opened_at + self.reset_timeout - time.time() if self.state == 'open' else 0
+            if retry_in > 0:
+                self.rejected += 1
+        if retry_in > 0:
+            raise CircuitOpenError(self.source, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                log.info("Circuito cerrado: la fuente volvió a responder", extra={'source': self.source})
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self._probe_started = None
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self._probe_started = None
+            if self.state == 'half_open' or (self.state == 'closed' and self.consecutive_failures >= self.failure_threshold):
+                if self.state == 'closed':
+                    log.warning("Circuito abierto: la fuente falló varias veces seguidas",
+                                extra={'source': self.source, 'failures': self.consecutive_failures, 'error': self.last_error})
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def status(self):
+        """Estado para /api/upstreams."""
+        with self._lock:
+            retry_at = None
+            if self.state != 'closed':
+                retry_at = datetime.datetime.fromtimestamp(self.opened_at + self.reset_timeout).isoformat()
+            return {
+                "source": self.source,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "last_error": self.last_error,
+                "opened_at": datetime.datetime.fromtimestamp(self.opened_at).isoformat() if self.opened_at else None,
+                "retry_at": retry_at,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(source):
+    """Breaker de la fuente (se crea la primera vez que se la nombra)."""
+    with _breakers_lock:
+        found = _breakers.get(source)
+        if found is None:
+            found = _breakers[source] = CircuitBreaker(source)
+        return found
+
+
+def breaker_states():
+    """Estado de todos los breakers de este proceso, ordenados por fuente."""
+    with _breakers_lock:
+        breakers = sorted(_breakers.values(), key=lambda b: b.source)
+    return [b.status() for b in breakers]
+
+
+metrics.Collector('upstream_circuit_state', 'Estado del circuit breaker por fuente (0 cerrado, 1 probando, 2 abierto).',
+                  'gauge', ('source',),
+                  lambda: [((s['source'],), CircuitBreaker.STATES.index(s['state'])) for s in breaker_states()])
+
+
+def _backoff(attempt, response=None):
+    """Espera antes del reintento `attempt` (0, 1, ...): jitter completo, o Retry-After si el servicio lo pide."""
+    cap = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt)
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), HTTP_BACKOFF_MAX)
+    return random.uniform(0, cap)
+
+
+def request(method, url, source=None, timeout=10, retries=HTTP_RETRIES, session=session, **kwargs):
+    """
+    requests.request sobre el pool compartido (u otra `session`, mismos argumentos), con
+    reintentos y el breaker de `source` (por defecto, el host de la URL). `timeout` es el de lectura;
+    una tupla (conexión, lectura) se respeta tal cual. Lanza CircuitOpenError sin
+    llamar si el circuito está abierto. Las respuestas 429 y 5xx cuentan como fallo
+    de la fuente; las demás (también 4xx) como respuesta.
+    """
+    source = source or urlsplit(url).hostname
+    circuit = breaker(source)
+    circuit.before_call()
+    if not isinstance(timeout, tuple):
+        timeout = (min(HTTP_CONNECT_TIMEOUT, timeout), timeout)
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            error, response = e, None
+        except Exception as e:  # Timeout de lectura u otro error: no se reintenta
+            circuit.record_failure(e)
+            raise
+        else:
+            if response.status_code not in RETRY_STATUSES and response.status_code < 500:
+                circuit.record_success()
+                return response
+            error = requests.exceptions.HTTPError(f"{response.status_code} de {source}", response=response)
+
+        wait = _backoff(attempt, response)
+        if attempt >= retries or time.monotonic() - started + wait > timeout[1]:
+            circuit.record_failure(error)
+            if response is None:
+                raise error
+            return response  # El llamador decide con raise_for_status()
+        if response is not None:
+            response.close()
+        attempt += 1
+        RETRIES.inc(source)
+        time.sleep(wait)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST con los mismos reintentos que get: pasar retries=0 si el destino no es idempotente."""
+    return request('POST', url, **kwargs)
@@ -0,0 +1,161 @@
+"""
+Almacenamiento de las imágenes de los reportes.
+
+- La subida se copia a disco por bloques mientras se calcula su SHA-256; el
+  archivo se guarda como `<sha256>.<ext>`, así una misma foto subida varias
+  veces ocupa un solo archivo.
+- Las miniaturas (redimensionadas, re-codificadas como JPEG y sin metadatos
+  EXIF) se generan fuera de la petición, en un pool de hilos.
+- Como el nombre depende del contenido, originales y miniaturas se pueden
+  servir con caché larga e inmutable.
+
+Pillow es opcional: sin Pillow no hay miniaturas y se sirve la imagen original.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import async_mode
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Sin Pillow se sirven los originales
+    Image = None
+
+# Ruta absoluta: send_from_directory resuelve las rutas relativas desde backend/, no desde el cwd
+UPLOAD_FOLDER = os.path.abspath(os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(__file__), 'uploads')))
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbs')
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '480'))          # Lado mayor de la miniatura, en píxeles
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '80'))
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+CHUNK_SIZE = 64 * 1024
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600   # Archivos nombrados por su contenido: nunca cambian
+
+# Firma de los primeros bytes → extensión. El tipo se decide por el contenido, no por el nombre.
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+_CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.(png|jpg|gif)$')
+
+log = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+_pending = set()
+_pending_lock = threading.Lock()
+
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+
+
+class InvalidImage(Exception):
+    """El archivo no es una imagen PNG, JPEG o GIF."""
+
+
+class ImageTooLarge(Exception):
+    """El archivo supera UPLOAD_MAX_BYTES."""
+
+
+def _detect_extension(head):
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def is_content_addressed(filename):
+    return bool(_CONTENT_ADDRESSED.match(filename))
+
+
+def thumbnail_name(filename):
+    return os.path.splitext(filename)[0] + '.jpg'
+
+
+def save_upload(stream):
+    """
+    Copia el archivo subido a UPLOAD_FOLDER por bloques y devuelve su nombre
+    `<sha256>.<ext>`. Si ya existía una imagen idéntica, se reutiliza.
+    """
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            head = stream.read(CHUNK_SIZE)
+            extension = _detect_extension(head)
+            if extension is None:
+                raise InvalidImage("Tipo de archivo de imagen no permitido.")
+            size = 0
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise ImageTooLarge(f"La imagen supera el máximo de {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = stream.read(CHUNK_SIZE)
+
+        filename = f"{digest.hexdigest()}.{extension}"
+        final_path = os.path.join(UPLOAD_FOLDER, filename)
+        if os.path.exists(final_path):
+            os.remove(temp_path)  # Misma foto ya guardada
+        else:
+            os.replace(temp_path, final_path)
+        return filename
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _make_thumbnail(filename):
+    source = os.path.join(UPLOAD_FOLDER, filename)
+    target = os.path.join(THUMBNAIL_FOLDER, thumbnail_name(filename))
+    try:
+        with Image.open(source) as img:
+            img.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))  # JPEG: decodifica directamente a menor escala
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                # Aplana la transparencia sobre blanco (JPEG no tiene canal alfa)
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+            else:
+                img = img.convert('RGB')
+            img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            fd, temp_path = tempfile.mkstemp(dir=THUMBNAIL_FOLDER, prefix='.thumb-')
+            with os.fdopen(fd, 'wb') as out:
+                img.save(out, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            os.replace(temp_path, target)
+    except Exception:
+        log.exception("Error al generar una miniatura", extra={'image': filename})
+    finally:
+        with _pending_lock:
+            _pending.discard(filename)
+
+
+def schedule_thumbnail(filename):
+    """Encola la generación de la miniatura si hace falta. No bloquea."""
+    if Image is None or thumbnail_path(filename):
+        return
+    if not os.path.exists(os.path.join(UPLOAD_FOLDER, filename)):
+        return
+    with _pending_lock:
+        if filename in _pending:
+            return
+        _pending.add(filename)
+    # Pillow es CPU pura: en modo async corre en un hilo real para no frenar al loop de gevent
+    _executor.submit(async_mode.offload, _make_thumbnail, filename)
+
+
+def thumbnail_path(filename):
+    """Nombre de la miniatura dentro de THUMBNAIL_FOLDER si ya existe, si no None."""
+    name = thumbnail_name(filename)
+    return name if os.path.exists(os.path.join(THUMBNAIL_FOLDER, name)) else None
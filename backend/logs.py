@@ -0,0 +1,68 @@
+"""
+Logging estructurado para todo el backend (reemplaza a los print()).
+
+Cada módulo usa `logging.getLogger(__name__)` y pasa los datos variables como
+campos en `extra`, por ejemplo:
+
+    log.info("reporte guardado", extra={"report_id": 12, "lat": -34.8})
+
+Con LOG_FORMAT=json cada línea es un objeto JSON; si no, texto con los campos
+como clave=valor. El nivel se elige con LOG_LEVEL (INFO por defecto); los
+mensajes por debajo del nivel no se formatean.
+"""
+import json
+import logging
+import os
+import sys
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' o 'json'
+
+# Atributos que trae todo LogRecord: lo que sobra son los campos pasados en `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def _fields(record):
+    return {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v!r}' if isinstance(v, str) and ' ' in v else f'{k}={v}' for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        data.update(_fields(record))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+_configured = False
+
+
+def setup():
+    """Configura el logger raíz una sola vez por proceso."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
@@ -0,0 +1,176 @@
+"""
+Métricas en memoria exportadas en formato de texto de Prometheus (/metrics).
+
+- Latencia por ruta HTTP (histograma por ruta, método y código de respuesta).
+- Duración y errores de las llamadas a servicios externos (feeds RSS, GNews,
+  OpenWeatherMap, Nominatim, SMN) y tiempo de parseo de los feeds.
+- Duración de las consultas SQLite, por consulta.
+- Aciertos/fallos de las cachés en memoria (cache.SingleFlightCache).
+
+Los valores son por proceso: con varios workers de gunicorn cada scrape ve
+los contadores del worker que atendió la petición.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+import cache
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQLITE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [conteos por bucket (no acumulados) + el de +Inf, suma]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Mide el bloque (o la función decorada) y lo registra con estas etiquetas."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(float(bound)))
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Collector:
+    """Métricas calculadas al momento del scrape: `func()` devuelve [(etiquetas, valor), ...]."""
+
+    def __init__(self, name, help_text, metric_type, labelnames, func):
+        self.name = name
+        self.help = help_text
+        self.type = metric_type
+        self.labelnames = labelnames
+        self.func = func
+        _registry.append(self)
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.type}'
+        for labels, value in self.func():
+            if value is not None:
+                yield f'{self.name}{_format_labels(self.labelnames, labels)} {value}'
+
+
+# --- Métricas de la aplicación ---
+
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'Duración de las peticiones HTTP por ruta.',
+                         ('route', 'method', 'status'))
+UPSTREAM_LATENCY = Histogram('upstream_request_duration_seconds', 'Duración de las llamadas a servicios externos.',
+                             ('source',))
+UPSTREAM_ERRORS = Counter('upstream_errors_total', 'Llamadas a servicios externos que fallaron, por tipo de error.',
+                          ('source', 'error'))
+FEED_PARSE_LATENCY = Histogram('feed_parse_duration_seconds', 'Tiempo de parseo de feeds RSS/GeoRSS con feedparser.',
+                               ('source',))
+SQLITE_LATENCY = Histogram('sqlite_query_duration_seconds', 'Duración de las consultas SQLite (incluye leer las filas).',
+                           ('query',), buckets=SQLITE_BUCKETS)
+
+
+def _cache_stat(key):
+    return lambda: [((c.name,), c.stats()[key]) for c in cache.all_caches()]
+
+
+Collector('cache_hits_total', 'Aciertos de las cachés en memoria.', 'counter', ('cache',), _cache_stat('hits'))
+Collector('cache_misses_total', 'Fallos de las cachés en memoria.', 'counter', ('cache',), _cache_stat('misses'))
+Collector('cache_stale_served_total', 'Valores vencidos servidos porque la fuente falló.', 'counter', ('cache',),
+          _cache_stat('stale_served'))
+Collector('cache_hit_ratio', 'Proporción de aciertos desde que arrancó el proceso.', 'gauge', ('cache',),
+          _cache_stat('hit_ratio'))
+Collector('cache_entries', 'Entradas guardadas en cada caché.', 'gauge', ('cache',), _cache_stat('entries'))
+
+
+@contextmanager
+def upstream_call(source):
+    """Mide una llamada a un servicio externo y cuenta el error si lanza una excepción."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(source, type(e).__name__)
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, source)
+
+
+def sqlite_query(name):
+    """Context manager / decorador que mide una consulta SQLite."""
+    return SQLITE_LATENCY.time(name)
+
+
+def feed_parse(source):
+    """Context manager que mide el parseo de un feed."""
+    return FEED_PARSE_LATENCY.time(source)
+
+
+def render():
+    """Todas las métricas en formato de texto de Prometheus."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
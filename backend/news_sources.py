@@ -0,0 +1,229 @@
+"""
+Descarga concurrente de las fuentes de noticias (feeds RSS locales + GNews).
+
+Cada fuente se descarga en un pool de hilos acotado, con un timeout por fuente
+y un plazo total para toda la etapa. Los feeds RSS se piden con GET condicional
+(ETag / Last-Modified): si el servidor responde 304 se reutilizan las entradas
+ya parseadas en la descarga anterior sin volver a parsear el XML.
+Una fuente lenta se descarta de la respuesta en lugar de bloquearla.
+
+Cada fuente tiene su circuit breaker en http_client: si está caída (o su
+circuito está abierto) se usan las últimas entradas que se obtuvieron bien,
+durante NEWS_SOURCE_STALE_TTL segundos, con estado 'stale'.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import feedparser
+import requests
+
+import http_client
+import metrics
+
+log = logging.getLogger(__name__)
+
+# --- Configuración de la etapa de descarga ---
+NEWS_FETCH_WORKERS = int(os.getenv('NEWS_FETCH_WORKERS', '6'))        # Tamaño máximo del pool de hilos
+NEWS_SOURCE_TIMEOUT = float(os.getenv('NEWS_SOURCE_TIMEOUT', '4'))     # Segundos máximos por fuente
+NEWS_FETCH_DEADLINE = float(os.getenv('NEWS_FETCH_DEADLINE', '6'))     # Segundos máximos para toda la etapa
+NEWS_SOURCE_STALE_TTL = int(os.getenv('NEWS_SOURCE_STALE_TTL', '21600'))  # Cuánto se reutilizan las entradas de una fuente caída
+USER_AGENT = "AlertaInundaciones.IA (klini@ejemplo.com)"
+
+# He actualizado algunas URLs con las que tienen más probabilidad de ser feeds RSS válidos.
+# Aún así, debes verificar cada una manualmente.
+LOCAL_RSS_FEEDS = [
+    {'name': 'Clarín Lo Último', 'url': 'https://www.clarin.com/rss/lo-ultimo/'},
+    {'name': 'Infobae Lo Último', 'url': 'https://www.infobae.com/feeds/rss/'},
+    {'name': 'La Nación Lo Último', 'url': 'https://www.lanacion.com.ar/arc/outboundfeeds/rss/'},
+    {'name': 'Página 12 Sociedad', 'url': 'https://www.pagina12.com.ar/rss/secciones/sociedad/notas'},
+    {'name': 'Ámbito Municipios', 'url': 'https://www.ambito.com/rss/pages/municipios.xml'},
+    {'name': 'TN Últimas Noticias', 'url': 'https://tn.com.ar/feeds/ultimas-noticias.xml'},
+    {'name': 'Diario Crónica Sociedad', 'url': 'https://www.diariocronica.com.ar/rss/sociedad'},
+    {'name': 'La Voz Córdoba Lo Último', 'url': 'https://www.lavoz.com.ar/feeds/ultimas-noticias.xml'},
+    # Quité los que eran claramente páginas web, Facebook, o URLs que no funcionaban como RSS.
+    # Es CRUCIAL que verifiques que estas URLs de RSS son VÁLIDAS.
+]
+
+# Un JSON con la misma forma ([{"name": ..., "url": ...}, ...]) reemplaza la lista anterior
+# (por ejemplo, para apuntar a los servidores falsos de benchmarks/loadtest.py).
+NEWS_FEEDS_FILE = os.getenv('NEWS_FEEDS_FILE')
+if NEWS_FEEDS_FILE:
+    with open(NEWS_FEEDS_FILE, encoding='utf-8') as f:
+        LOCAL_RSS_FEEDS = json.load(f)
+
+GNEWS_URL = os.getenv('GNEWS_URL', 'https://gnews.io/api/v4/search')
+
+# Pool compartido por todas las peticiones: nunca hay más de NEWS_FETCH_WORKERS descargas en curso.
+_executor = ThreadPoolExecutor(max_workers=NEWS_FETCH_WORKERS, thread_name_prefix='news-fetch')
+
+# Validadores HTTP, entradas parseadas y momento de la última descarga exitosa, por URL.
+_feed_cache = {}
+_feed_cache_lock = threading.Lock()
+
+# Reporte (tiempos y fallos por fuente) de la última etapa de descarga completa.
+last_fetch_report = []
+
+
+class SourceTimeout(Exception):
+    """La fuente superó su tiempo máximo de descarga."""
+
+
+def _download(url, source, headers, params=None):
+    """GET con timeout de conexión/lectura, reintentos y breaker de la fuente, y plazo total para leer el cuerpo."""
+    started = time.monotonic()
+    response = http_client.get(url, source=source, params=params, headers=headers, timeout=NEWS_SOURCE_TIMEOUT, stream=True)
+    if response.status_code == 304:
+        response.close()
+        return response, b''
+    response.raise_for_status()
+
+    # El timeout de requests es por operación de socket; un servidor que envía
+    # el cuerpo muy despacio podría superarlo igual, así que cortamos a mano.
+    chunks = []
+    for chunk in response.iter_content(chunk_size=16384):
+        chunks.append(chunk)
+        if time.monotonic() - started > NEWS_SOURCE_TIMEOUT:
+            response.close()
+            error = SourceTimeout(f"más de {NEWS_SOURCE_TIMEOUT}s descargando {url}")
+            http_client.breaker(source).record_failure(error)
+            raise error
+    return response, b''.join(chunks)
+
+
+def _stale_entries(url, error):
+    """Últimas entradas buenas de la fuente si no son demasiado viejas; si no, vuelve a lanzar `error`."""
+    with _feed_cache_lock:
+        cached = _feed_cache.get(url)
+    if cached is None or time.time() - cached['fetched_at'] > NEWS_SOURCE_STALE_TTL:
+        raise error
+    return cached['entries'], 'stale'
+
+
+def fetch_rss_feed(feed_info):
+    """Descarga un feed RSS con GET condicional. Devuelve (entradas, estado)."""
+    url = feed_info['url']
+    headers = {'User-Agent': USER_AGENT}
+    with _feed_cache_lock:
+        cached = _feed_cache.get(url)
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    try:
+        with metrics.upstream_call(feed_info['name']):
+            response, body = _download(url, feed_info['name'], headers)
+    except (requests.exceptions.RequestException, SourceTimeout) as e:
+        return _stale_entries(url, e)
+    if response.status_code == 304 and cached:
+        # Sin cambios desde la última vez: no hace falta volver a parsear.
+        with _feed_cache_lock:
+            cached['fetched_at'] = time.time()
+        return cached['entries'], 'not_modified'
+
+    with metrics.feed_parse(feed_info['name']):
+        parsed_feed = feedparser.parse(body)
+    with _feed_cache_lock:
+        _feed_cache[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'entries': parsed_feed.entries,
+            'fetched_at': time.time(),
+        }
+    return parsed_feed.entries, 'ok'
+
+
+def fetch_gnews():
+    """Consulta la API de GNews. Devuelve (artículos, estado)."""
+    gnews_api_key = os.getenv('GNEWS_API_KEY')
+    if not gnews_api_key:
+        log.warning("GNEWS_API_KEY no está configurada; se omite GNews")
+        return [], 'skipped'
+
+    # Aquí la clave: 'country=ar' ya está bien.
+    # Aumentar 'max' y luego filtrar más agresivamente podría ser útil.
+    params = {'q': 'inundaciones', 'lang': 'es', 'country': 'ar', 'max': 10, 'apikey': gnews_api_key}
+    try:
+        with metrics.upstream_call('GNews'):
+            _, body = _download(GNEWS_URL, 'GNews', {'User-Agent': USER_AGENT}, params=params)
+    except (requests.exceptions.RequestException, SourceTimeout) as e:
+        return _stale_entries(GNEWS_URL, e)
+    articles = json.loads(body).get('articles', [])
+    with _feed_cache_lock:
+        _feed_cache[GNEWS_URL] = {'entries': articles, 'fetched_at': time.time()}
+    return articles, 'ok'
+
+
+def _timed(kind, source, func, *args):
+    """Ejecuta la descarga de una fuente midiendo su duración."""
+    started = time.monotonic()
+    result = {'kind': kind, 'source': source, 'entries': [], 'status': 'error', 'error': None}
+    try:
+        result['entries'], result['status'] = func(*args)
+    except requests.exceptions.RequestException as e:
+        result['error'] = f"Error de red o HTTP: {e}"
+    except Exception as e:
+        result['error'] = f"Error inesperado: {e}"
+    result['elapsed_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+
+def fetch_all_sources(use_gnews=True):
+    """
+    Descarga todas las fuentes en paralelo y devuelve (resultados, reporte).
+    Las fuentes que no terminan antes de NEWS_FETCH_DEADLINE quedan fuera de
+    los resultados y figuran en el reporte con estado 'timeout'.
+    """
+    global last_fetch_report
+
+    started = time.monotonic()
+    futures = {}
+    for feed_info in LOCAL_RSS_FEEDS:
+        future = _executor.submit(_timed, 'rss', feed_info, fetch_rss_feed, feed_info)
+        futures[future] = {'kind': 'rss', 'source': feed_info}
+    if use_gnews:
+        gnews_info = {'name': 'GNews', 'url': GNEWS_URL}
+        future = _executor.submit(_timed, 'gnews', gnews_info, fetch_gnews)
+        futures[future] = {'kind': 'gnews', 'source': gnews_info}
+
+    done, _ = wait(futures, timeout=NEWS_FETCH_DEADLINE)  # Las pendientes se cancelan y registran abajo
+
+    results = []
+    report = []
+    for future, info in futures.items():
+        if future in done:
+            result = future.result()
+            if result['status'] != 'error':
+                results.append(result)
+            else:
+                log.warning("Error al obtener una fuente de noticias",
+                            extra={'source': info['source']['name'], 'url': info['source']['url'], 'error': result['error']})
+            entry = {
+                'name': info['source']['name'],
+                'status': result['status'],
+                'elapsed_ms': result['elapsed_ms'],
+                'items': len(result['entries']),
+                'error': result['error'],
+            }
+        else:
+            # La descarga sigue en el pool (acotada por NEWS_SOURCE_TIMEOUT) pero no la esperamos.
+            future.cancel()
+            metrics.UPSTREAM_ERRORS.inc(info['source']['name'], 'DeadlineExceeded')
+            log.warning("Fuente de noticias descartada por superar el plazo",
+                        extra={'source': info['source']['name'], 'deadline_s': NEWS_FETCH_DEADLINE})
+            entry = {
+                'name': info['source']['name'],
+                'status': 'timeout',
+                'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+                'items': 0,
+                'error': f"Plazo de {NEWS_FETCH_DEADLINE}s superado",
+            }
+        report.append(entry)
+
+    last_fetch_report = report
+    return results, report
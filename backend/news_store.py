@@ -0,0 +1,332 @@
+"""
+Agregador de noticias en segundo plano con almacenamiento persistente en SQLite.
+
+Un hilo de fondo ejecuta el pipeline de noticias (descarga + filtrado) cada
+NEWS_REFRESH_INTERVAL segundos y guarda los artículos en la tabla
+`news_articles`, usando el link como clave. La ruta /api/news solo lee de esa
+tabla, así que el tráfico hacia los medios no depende de cuántos usuarios haya.
+
+Si los datos están vencidos al momento de leer, se sirven igual y se dispara
+una actualización en segundo plano (stale-while-revalidate).
+
+La fecha de cada artículo se convierte una sola vez, al guardarlo, a epoch UTC
+(`published_at`). Cada proceso arma tras cada actualización una lista por
+fuente ya ordenada por fecha, y cada página de /api/news sale de una mezcla
+k-way con heap de esas listas a partir del cursor `before`: O(k log fuentes)
+por página, sin parsear ni ordenar en cada petición.
+"""
+import base64
+import bisect
+import calendar
+import datetime
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from dateutil import parser as date_parser
+
+import dedupe
+import metrics
+
+log = logging.getLogger(__name__)
+
+NEWS_REFRESH_INTERVAL = int(os.getenv('NEWS_REFRESH_INTERVAL', '300'))    # Segundos entre actualizaciones
+NEWS_RETENTION_HOURS = int(os.getenv('NEWS_RETENTION_HOURS', '72'))      # Cuánto conservar artículos que ya no aparecen
+NEWS_STALE_AFTER = int(os.getenv('NEWS_STALE_AFTER', str(2 * NEWS_REFRESH_INTERVAL)))  # Edad a partir de la cual se revalida al leer
+NEWS_COLD_START_WAIT = float(os.getenv('NEWS_COLD_START_WAIT', '10'))    # Espera máxima si la tabla está vacía
+NEWS_PAGE_SIZE = int(os.getenv('NEWS_PAGE_SIZE', '20'))                  # Artículos por página si no se pide `limit`
+NEWS_MAX_PAGE_SIZE = int(os.getenv('NEWS_MAX_PAGE_SIZE', '100'))
+
+# Zona horaria de las fechas que llegan sin ella (medios argentinos: UTC-3, sin horario de verano)
+DEFAULT_TZ = datetime.timezone(datetime.timedelta(hours=-3))
+
+UNPARSEABLE_DATES = metrics.Counter('news_unparseable_dates_total', 'Artículos cuya fecha no se pudo interpretar.', ('source',))
+
+_collect_news = None        # Función que ejecuta el pipeline y devuelve la lista de noticias
+_get_connection = None      # Función que abre una conexión a la base de datos
+_refresh_lock = threading.Lock()
+_start_lock = threading.Lock()
+_refresh_done = threading.Event()
+_worker = None
+
+
+NEWS_ARTICLES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS news_articles (
+        id INTEGER PRIMARY KEY, -- Alias del rowid: estable ante VACUUM, es la clave del índice news_fts
+        link TEXT NOT NULL UNIQUE,
+        title TEXT NOT NULL,
+        source TEXT,
+        date TEXT, -- Fecha tal como la publica la fuente
+        summary TEXT,
+        image_url TEXT,
+        rank INTEGER NOT NULL, -- Posición dentro de la corrida que lo vio por última vez
+        first_seen_at TEXT NOT NULL,
+        last_seen_at TEXT NOT NULL,
+        published_at INTEGER -- Fecha de publicación en epoch UTC; NULL si no se pudo interpretar
+    )
+'''
+NEWS_ARTICLE_COLUMNS = 'link, title, source, date, summary, image_url, rank, first_seen_at, last_seen_at, published_at'
+
+
+def create_tables(cursor):
+    """Crea las tablas del almacén de noticias si no existen."""
+    cursor.execute(NEWS_ARTICLES_TABLE)
+    # Bases creadas antes de published_at: se agrega la columna y se completa a partir de `date`
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(news_articles)')}
+    if 'published_at' not in columns:
+        cursor.execute('ALTER TABLE news_articles ADD COLUMN published_at INTEGER')
+        rows = cursor.execute('SELECT link, date FROM news_articles').fetchall()
+        cursor.executemany('UPDATE news_articles SET published_at = ? WHERE link = ?',
+                           [(to_epoch(date), link) for link, date in rows])
+    # Bases con el link como clave primaria: el índice FTS (search.py) usaba el rowid implícito,
+    # que VACUUM puede renumerar. Se copian los artículos a la tabla con `id` (sus índices y
+    # triggers se van con la tabla vieja y se vuelven a crear abajo y en search.create_tables)
+    if 'id' not in columns:
+        cursor.execute('ALTER TABLE news_articles RENAME TO news_articles_old')
+        cursor.execute(NEWS_ARTICLES_TABLE)
+        cursor.execute(f'INSERT INTO news_articles ({NEWS_ARTICLE_COLUMNS}) SELECT {NEWS_ARTICLE_COLUMNS} FROM news_articles_old')
+        cursor.execute('DROP TABLE news_articles_old')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_news_articles_seen ON news_articles (last_seen_at DESC, rank)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_news_articles_source_published ON news_articles (source, published_at DESC)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS news_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+
+def to_epoch(value, parsed=None):
+    """
+    Fecha de publicación en epoch UTC (int), o None si no se puede interpretar.
+    `parsed` es el struct_time (UTC) que feedparser ya calculó, si lo hay.
+    """
+    if parsed is not None:
+        return calendar.timegm(parsed)
+    if not value:
+        return None
+    try:
+        date = date_parser.parse(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=DEFAULT_TZ)
+    return int(date.timestamp())
+
+
+@metrics.sqlite_query('news.save_articles')
+def save_articles(conn, news_items, refreshed_at):
+    """Inserta/actualiza los artículos de una corrida y purga los viejos."""
+    rows = []
+    for rank, item in enumerate(news_items):
+        if not item.get('link') or item['link'] == '#':
+            continue
+        published_at = item['published_at'] if 'published_at' in item else to_epoch(item['date'])
+        if published_at is None:
+            UNPARSEABLE_DATES.inc(item['source'] or '')
+        rows.append((item['link'], item['title'], item['source'], item['date'], item['summary'], item['imageUrl'],
+                     rank, refreshed_at, refreshed_at, published_at))
+    cutoff = (datetime.datetime.fromisoformat(refreshed_at) - datetime.timedelta(hours=NEWS_RETENTION_HOURS)).isoformat()
+    with conn:
+        conn.executemany('''
+            INSERT INTO news_articles (link, title, source, date, summary, image_url, rank, first_seen_at, last_seen_at, published_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(link) DO UPDATE SET
+                title = excluded.title, source = excluded.source, date = excluded.date,
+                summary = excluded.summary, image_url = excluded.image_url,
+                rank = excluded.rank, last_seen_at = excluded.last_seen_at,
+                published_at = excluded.published_at
+        ''', rows)
+        conn.execute('DELETE FROM news_articles WHERE last_seen_at < ?', (cutoff,))
+        # Huellas de los artículos nuevos y grupos de casi duplicados (ver dedupe.py)
+        dedupe.assign_clusters(conn, news_items)
+        dedupe.prune(conn)
+        conn.execute("INSERT OR REPLACE INTO news_meta (key, value) VALUES ('refreshed_at', ?)", (refreshed_at,))
+
+
+def load_refreshed_at(conn):
+    """Devuelve la fecha (ISO) de la última actualización exitosa, o None."""
+    meta = conn.execute("SELECT value FROM news_meta WHERE key = 'refreshed_at'").fetchone()
+    return meta[0] if meta else None
+
+
+@metrics.sqlite_query('news.load_articles')
+def load_articles(conn):
+    """
+    Devuelve (artículos, fecha de la última actualización) desde la base, con un
+    artículo por grupo de casi duplicados y los demás en "relatedArticles".
+    Cada artículo lleva "publishedAt" (epoch UTC); si la fecha de la fuente no se
+    pudo interpretar, se usa el momento en que se vio por primera vez.
+    """
+    rows = conn.execute('''
+        SELECT a.title, a.source, a.date, a.summary, a.link, a.image_url, f.cluster, a.published_at, a.first_seen_at
+        FROM news_articles a LEFT JOIN news_fingerprints f ON f.link = a.link
+        ORDER BY a.last_seen_at DESC, a.rank ASC
+    ''').fetchall()
+    refreshed_at = load_refreshed_at(conn)
+    articles = [
+        {'title': r[0], 'source': r[1], 'date': r[2], 'summary': r[3], 'link': r[4], 'imageUrl': r[5], 'cluster': r[6],
+         'publishedAt': r[7] if r[7] is not None else int(datetime.datetime.fromisoformat(r[8]).timestamp())}
+        for r in rows
+    ]
+    return dedupe.group(articles), refreshed_at
+
+
+def encode_cursor(article):
+    """Cursor `before` opaco que apunta justo después de este artículo."""
+    raw = json.dumps([article['publishedAt'], article['link']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Devuelve (publishedAt, link) del cursor. Lanza ValueError si no es válido."""
+    try:
+        published_at, link = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return int(published_at), str(link)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+class NewsIndex:
+    """
+    Artículos de una actualización, en una lista por fuente ordenada por
+    (fecha descendente, link). Inmutable: se reemplaza entero cuando cambia refreshed_at.
+    """
+
+    def __init__(self, articles, refreshed_at):
+        self.refreshed_at = refreshed_at
+        by_source = {}
+        for article in articles:
+            by_source.setdefault(article['source'], []).append(((-article['publishedAt'], article['link']), article))
+        self.keys = []
+        self.lists = []
+        for entries in by_source.values():
+            entries.sort(key=lambda entry: entry[0])
+            self.keys.append([key for key, _ in entries])
+            self.lists.append(entries)
+        self.total = len(articles)
+
+    def page(self, limit, before=None):
+        """Hasta `limit` artículos posteriores al cursor, y si quedan más."""
+        start_key = (-before[0], before[1]) if before is not None else None
+        streams = []
+        for keys, entries in zip(self.keys, self.lists):
+            # Búsqueda binaria del cursor en cada fuente: solo se recorre lo que entra en la página
+            position = bisect.bisect_right(keys, start_key) if start_key is not None else 0
+            streams.append(itertools.islice(entries, position, position + limit + 1))
+        merged = heapq.merge(*streams, key=lambda entry: entry[0])
+        page = [article for _, article in itertools.islice(merged, limit + 1)]
+        return page[:limit], len(page) > limit
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _current_index(conn):
+    """Índice de la última actualización; se rearma solo si otra corrida cambió refreshed_at."""
+    global _index
+    refreshed_at = load_refreshed_at(conn)
+    index = _index
+    if index is not None and index.refreshed_at == refreshed_at:
+        return index
+    with _index_lock:
+        if _index is None or _index.refreshed_at != refreshed_at:
+            articles, refreshed_at = load_articles(conn)
+            _index = NewsIndex(articles, refreshed_at)
+        return _index
+
+
+def refresh():
+    """Ejecuta una corrida del pipeline y persiste el resultado. Se saltea si ya hay una en curso."""
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        news_items = _collect_news()
+        conn = _get_connection()
+        try:
+            save_articles(conn, news_items, datetime.datetime.now().isoformat())
+        finally:
+            conn.close()
+        log.info("Noticias actualizadas", extra={'articles': len(news_items)})
+        return True
+    except Exception:
+        log.exception("Error en el agregador de noticias")
+        return False
+    finally:
+        _refresh_done.set()
+        _refresh_lock.release()
+
+
+def refresh_in_background():
+    """Dispara una actualización sin bloquear al que llama."""
+    threading.Thread(target=refresh, name='news-refresh', daemon=True).start()
+
+
+def _seconds_since_last_refresh():
+    conn = _get_connection()
+    try:
+        refreshed_at = load_refreshed_at(conn)
+    finally:
+        conn.close()
+    if not refreshed_at:
+        return None
+    return (datetime.datetime.now() - datetime.datetime.fromisoformat(refreshed_at)).total_seconds()
+
+
+def _run_periodically():
+    while True:
+        # Con varios workers de gunicorn, cada uno tiene su hilo; si otro proceso
+        # ya actualizó hace poco, esperamos a que venza en lugar de repetir la descarga.
+        try:
+            age = _seconds_since_last_refresh()
+        except Exception as e:
+            log.warning("Error al leer el estado del agregador de noticias", extra={'error': str(e)})
+            age = None
+        if age is None or age >= NEWS_REFRESH_INTERVAL:
+            refresh()
+            time.sleep(NEWS_REFRESH_INTERVAL)
+        else:
+            time.sleep(NEWS_REFRESH_INTERVAL - age)
+
+
+def ensure_started(collect_news, get_connection):
+    """Arranca (una sola vez por proceso) el hilo que actualiza las noticias periódicamente."""
+    global _collect_news, _get_connection, _worker
+    with _start_lock:
+        if _worker is not None:
+            return
+        _collect_news = collect_news
+        _get_connection = get_connection
+        _worker = threading.Thread(target=_run_periodically, name='news-aggregator', daemon=True)
+        _worker.start()
+
+
+def is_stale(refreshed_at):
+    """True si la última actualización es más vieja que NEWS_STALE_AFTER."""
+    if not refreshed_at:
+        return True
+    age = datetime.datetime.now() - datetime.datetime.fromisoformat(refreshed_at)
+    return age.total_seconds() > NEWS_STALE_AFTER
+
+
+def get_page(conn, limit=NEWS_PAGE_SIZE, before=None):
+    """
+    Lee una página de noticias: devuelve (artículos, cursor siguiente o None,
+    fecha de la última actualización). Si todavía no hay ninguna corrida
+    (arranque en frío) espera a la primera hasta NEWS_COLD_START_WAIT segundos;
+    si están vencidas, las devuelve igual y pide una actualización en segundo plano.
+    """
+    index = _current_index(conn)
+    if index.refreshed_at is None:
+        _refresh_done.wait(NEWS_COLD_START_WAIT)
+        index = _current_index(conn)
+    elif is_stale(index.refreshed_at):
+        refresh_in_background()
+    articles, has_more = index.page(limit, before)
+    next_cursor = encode_cursor(articles[-1]) if has_more else None
+    return articles, next_cursor, index.refreshed_at
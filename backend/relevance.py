@@ -0,0 +1,166 @@
+"""
+Clasificador de relevancia de noticias precompilado.
+
+Las listas de palabras clave se normalizan una sola vez al importar el módulo
+(minúsculas, sin tildes, sin duplicados) y se compilan en una única expresión
+regular con forma de trie que acepta cada término con o sin tildes. Así,
+clasificar un artículo es una sola pasada sobre el texto en lugar de ~150
+búsquedas `keyword in text`.
+"""
+import re
+import unicodedata
+
+# --- Configuración de Palabras Clave para Filtrado (UNIFICADAS) ---
+# Palabras clave que indican ALTA relevancia para inundaciones
+KEYWORDS_HIGHLY_RELEVANT = [
+    "inundación", "desborde", "crecida", "alerta hídrica", "evacuación",
+    "riesgo de inundación", "riada", "temporal", "anegamientos", "caos vehicular",
+    "corte de luz por tormenta", "arroyo", "río", "aluvión"
+]
+# Palabras clave que indican una relevancia MEDIA y que necesitan contexto
+KEYWORDS_MEDIUM_RELEVANCE = [
+    "lluvia fuerte", "tormenta", "pronóstico", "precipitaciones",
+    "defensa civil", "protección civil", "emergencia climática",
+    "barrio afectado", "vías anegadas", "rescate", "damnificados",
+    "suministro de agua", "infraestructura", "obra hídrica", "lluvia",
+    "anegado", "calles inundadas", "viviendas afectadas",
+    "clima extremo", "granizo", "alerta amarilla", "alerta naranja"
+]
+# Palabras clave a EXCLUIR (si aparecen, la noticia es probablemente irrelevante para tu tema)
+KEYWORDS_TO_EXCLUDE = [
+    "fútbol", "deporte", "política", "elecciones", "economía", "bolsa",
+    "dólar", "mercado", "inflación", "justicia", "celebridad", "espectáculos",
+    "incendio", "sequía", "pandemia", "vacuna", "salud", "crimen", "seguridad",
+    "noticias internacionales", "turismo", "gastronomía"
+]
+# Nombres de lugares, ríos o zonas específicas de Argentina/Buenos Aires
+# (los duplicados y las variantes con/sin tilde se unifican al compilar)
+LOCAL_KEYWORDS = [
+    "ríachuelo", "plata", "conurbano", "buenos aires", "laplata", "capital federal",
+    "tigre", "quilmes", "san fernando", "vicente lópez", "san isidro", "morón",
+    "merlo", "luján", "chascomús", "salado", "la plata", "caba", "zona sur",
+    "avellaneda", "lanús", "brown", "lomas", "ezeiza", "berazategui",
+    "argentina", # Añadir "argentina" aquí es importante para la API externa
+    "bernal", "solano", "temperley", "adrogue", "claypole", "longchamps", "glew",
+    "burzaco", "canning", "cañuelas", "brandsen", "ensenda", "berisso",
+    "florencio varela", "san francisco solano",
+    "malvinas argentinas", "moreno", "general rodríguez", "pilar", "escobar",
+    "san miguel", "jose c. paz", "hurlingham", "ituzaingó",
+    "la matanza", "gregorio de laferrere", "gonzález catán", "virrey del pino",
+    "lomas de zamora", "wilde", "sarandí", "domínico",
+    "monte grande", "esteban echeverría", "almirante brown", "rafael calzada",
+    "marmol", "lavallol", "tristán suárez", "alejandro korn", "san vicente",
+    "presidente perón", "guernica", "mar del plata", "rosario", "córdoba", "mendoza", # Otras ciudades importantes de Argentina
+    "santa fe", "corrientes", "chaco", "formosa", "entre ríos" # Provincias del litoral con riesgo de inundaciones
+]
+
+HIGH = 'high'
+MEDIUM = 'medium'
+EXCLUDE = 'exclude'
+LOCAL = 'local'
+
+_CLASS_KEYWORDS = {
+    HIGH: KEYWORDS_HIGHLY_RELEVANT,
+    MEDIUM: KEYWORDS_MEDIUM_RELEVANCE,
+    EXCLUDE: KEYWORDS_TO_EXCLUDE,
+    LOCAL: LOCAL_KEYWORDS,
+}
+_CLASS_BITS = {name: 1 << i for i, name in enumerate(_CLASS_KEYWORDS)}
+
+
+def fold(text):
+    """Pasa el texto a minúsculas y sin tildes ("Morón" → "moron", "Cañuelas" → "canuelas")."""
+    text = text.lower()
+    if text.isascii():
+        return text
+    return unicodedata.normalize('NFD', text).encode('ascii', 'ignore').decode('ascii')
+
+
+# Cada letra del patrón acepta también sus variantes con tilde, así el texto del
+# artículo solo se pasa a minúsculas (mucho más barato que normalizarlo entero).
+_ACCENT_CLASSES = {'a': '[aá]', 'e': '[eé]', 'i': '[ií]', 'o': '[oó]', 'u': '[uúü]', 'n': '[nñ]'}
+
+
+def _char_pattern(char):
+    return _ACCENT_CLASSES.get(char) or re.escape(char)
+
+
+def _trie_pattern(node):
+    """Convierte un trie {carácter: subtrie, '': fin} en una alternancia regex factorizada."""
+    alternatives = []
+    ends_here = '' in node
+    for char in sorted(k for k in node if k):
+        alternatives.append(_char_pattern(char) + _trie_pattern(node[char]))
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and not ends_here:
+        return alternatives[0]
+    body = '(?:' + '|'.join(alternatives) + ')'
+    # Cuantificador codicioso: en una misma posición se prueba primero el término más largo.
+    return body + '?' if ends_here else body
+
+
+def _compile():
+    """Normaliza y deduplica los términos y arma el patrón y la tabla término→clases."""
+    term_bits = {}
+    for class_name, keywords in _CLASS_KEYWORDS.items():
+        for keyword in keywords:
+            term = fold(keyword)
+            term_bits[term] = term_bits.get(term, 0) | _CLASS_BITS[class_name]
+
+    # Si un término es prefijo de otro ("lluvia" / "lluvia fuerte"), en esa posición
+    # la regex solo reporta el más largo; por eso el largo hereda las clases del corto.
+    for term in term_bits:
+        for other, bits in term_bits.items():
+            if other != term and term.startswith(other):
+                term_bits[term] |= bits
+
+    trie = {}
+    for term in term_bits:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    # \W: los términos se anclan al inicio de una palabra. Sin tildes, "rio" aparecería
+    # dentro de "periodo"; con el ancla sigue cubriendo "rios" o "inundaciones".
+    # Solo se consume el separador; el término va en un lookahead para poder encontrar
+    # coincidencias solapadas ("entre rios" y "rio").
+    pattern = re.compile(r'\W(?=(' + _trie_pattern(trie) + '))')
+    return pattern, term_bits
+
+
+_PATTERN, _TERM_BITS = _compile()
+
+# Clases por texto coincidente tal cual aparece (con o sin tildes), para no normalizar dos veces lo mismo.
+_MATCH_BITS = dict(_TERM_BITS)
+
+
+def _classify_bits(text):
+    bits = 0
+    for match in _PATTERN.findall(' ' + text.lower()):
+        match_bits = _MATCH_BITS.get(match)
+        if match_bits is None:
+            match_bits = _MATCH_BITS[match] = _TERM_BITS[fold(match)]
+        bits |= match_bits
+    return bits
+
+
+def classify(text):
+    """Devuelve el conjunto de clases de palabras clave ('high', 'medium', 'exclude', 'local') presentes en el texto."""
+    bits = _classify_bits(text)
+    return {name for name, bit in _CLASS_BITS.items() if bits & bit}
+
+
+def is_relevant_article(title, summary, source_name="", link=""):
+    """
+    Un artículo es relevante si es altamente relevante, o de relevancia media Y local
+    (es crucial que las noticias de "lluvia fuerte" estén asociadas a Argentina/localidad),
+    y además no contiene ninguna palabra clave de exclusión.
+    """
+    # Combine all text fields that can contain keywords
+    bits = _classify_bits(title + " " + summary + " " + source_name + " " + link)
+    if bits & _CLASS_BITS[EXCLUDE]:
+        return False
+    return bool(bits & _CLASS_BITS[HIGH]) or \
+        (bool(bits & _CLASS_BITS[MEDIUM]) and bool(bits & _CLASS_BITS[LOCAL]))
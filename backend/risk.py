@@ -0,0 +1,435 @@
+"""
+Motor de predicción de riesgo de inundación por celda de una grilla regular
+(RISK_CELL_DEG grados de lado sobre RISK_BBOX). Alimenta /api/predictions.
+
+- Entradas por celda: reportes recientes de flood_reports (cantidad y nivel de
+  agua máximo, sumando las 8 celdas vecinas), lluvia de la última hora según
+  el clima ya consultado a OpenWeatherMap (ver record_rainfall) y variación del
+  nivel de los ríos en 24 h (tabla river_levels, cargada por POST /api/river-levels).
+- El modelo es una regresión logística sobre esas cuatro variables, evaluada
+  con NumPy sobre todas las celdas a la vez. Los coeficientes son una
+  calibración inicial a mano, hasta tener un histórico para ajustarlos.
+- Los resultados se guardan en risk_scores y la ruta solo los lee. Un hilo de
+  fondo recalcula cada RISK_REFRESH_INTERVAL segundos, pero solo vuelve a
+  puntuar y escribir las celdas cuyas entradas cambiaron; si ninguna entrada
+  cambió desde la última corrida (de cualquier worker), no hace nada.
+"""
+import datetime
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+import db
+import flood_reports
+import metrics
+from clusters import LEVEL_NAMES, WATER_LEVELS
+from smn_alerts import haversine_matrix
+
+log = logging.getLogger(__name__)
+
+RISK_BBOX = os.getenv('RISK_BBOX', '-58.50,-34.92,-58.28,-34.74')                  # oeste,sur,este,norte (Almirante Brown y alrededores)
+RISK_CELL_DEG = float(os.getenv('RISK_CELL_DEG', '0.005'))                        # Lado de cada celda (0.005° ≈ 500 m)
+RISK_REFRESH_INTERVAL = int(os.getenv('RISK_REFRESH_INTERVAL', '60'))             # Segundos entre recálculos
+RISK_REPORT_WINDOW_HOURS = float(os.getenv('RISK_REPORT_WINDOW_HOURS', '48'))     # Antigüedad máxima de los reportes que cuentan
+RISK_RAIN_MAX_AGE = int(os.getenv('RISK_RAIN_MAX_AGE', '10800'))                  # Segundos que vale una medición de lluvia
+RISK_RAIN_RADIUS_KM = float(os.getenv('RISK_RAIN_RADIUS_KM', '10'))               # Distancia máxima a la medición de lluvia más cercana
+RISK_RIVER_RADIUS_KM = float(os.getenv('RISK_RIVER_RADIUS_KM', '5'))              # Alcance de cada estación de nivel de río
+RISK_RIVER_RETENTION_HOURS = int(os.getenv('RISK_RIVER_RETENTION_HOURS', '72'))
+
+FEATURES = ('report_count', 'max_water_level', 'rain_mm_1h', 'river_delta_cm')
+
+# Regresión logística: probabilidad = sigmoide(INTERCEPT + Σ peso · variable)
+# (la cantidad de reportes entra como log1p para que 50 reportes no valgan 50 veces uno)
+MODEL_INTERCEPT = -3.0
+MODEL_WEIGHTS = np.array([1.2, 0.8, 0.08, 0.04])
+
+# (probabilidad mínima, nivel, acción recomendada)
+RISK_LEVELS = (
+    (0.65, "Alto", "Evitar transitar por calles anegadas. Preparar kit de emergencia familiar."),
+    (0.35, "Medio", "Mantenerse informado, limpiar desagües y asegurar objetos en patios."),
+    (0.0, "Bajo", "Condiciones normales, sin riesgo inminente en la zona."),
+)
+
+# Localidades para nombrar cada celda (la más cercana)
+LOCALITIES = {
+    "Adrogué": (-34.7937, -58.3917),
+    "Burzaco": (-34.8090, -58.4060),
+    "Longchamps": (-34.8569, -58.4093),
+    "José Mármol": (-34.7870, -58.3720),
+    "Rafael Calzada": (-34.7920, -58.3560),
+    "Claypole": (-34.8040, -58.3380),
+    "San José": (-34.8370, -58.3360),
+    "Ministro Rivadavia": (-34.8460, -58.3680),
+    "Glew": (-34.8880, -58.3840),
+}
+
+CELLS_SCORED = metrics.Counter('risk_cells_scored_total', 'Celdas vueltas a puntuar por el motor de riesgo.')
+
+
+def create_tables(cursor):
+    """Crea las tablas de resultados y de entradas externas del motor de riesgo."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS risk_scores (
+            cell_id INTEGER PRIMARY KEY,
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            probability REAL NOT NULL,
+            risk_level TEXT NOT NULL,
+            report_count REAL NOT NULL,
+            max_water_level REAL NOT NULL,
+            rain_mm_1h REAL NOT NULL,
+            river_delta_cm REAL NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_risk_scores_probability ON risk_scores (probability DESC)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS risk_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    # Última lluvia medida por celda de la grilla del clima
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rainfall_observations (
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            rain_mm_1h REAL NOT NULL,
+            observed_at REAL NOT NULL,
+            PRIMARY KEY (lat, lng)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS river_levels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            station TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            level_cm REAL NOT NULL,
+            observed_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_river_levels_station ON river_levels (station, observed_at)')
+
+
+# --- Entradas externas ---
+
+def record_rainfall(lat, lng, rain_mm_1h):
+    """Guarda la lluvia de la última hora de una celda del clima (la llama fetch_weather)."""
+    conn = db.get_connection()
+    try:
+        with metrics.sqlite_query('risk.record_rainfall'), conn:
+            conn.execute('INSERT OR REPLACE INTO rainfall_observations (lat, lng, rain_mm_1h, observed_at) VALUES (?, ?, ?, ?)',
+                         (lat, lng, float(rain_mm_1h), time.time()))
+    finally:
+        conn.close()
+
+
+def record_river_levels(conn, readings):
+    """Guarda lecturas de nivel de río: dicts con station, lat, lng, level_cm y opcionalmente observed_at (epoch)."""
+    now = time.time()
+    rows = []
+    for reading in readings:
+        rows.append((str(reading['station']), float(reading['lat']), float(reading['lng']),
+                     float(reading['level_cm']), float(reading.get('observed_at') or now)))
+    with metrics.sqlite_query('risk.record_river_levels'), conn:
+        conn.executemany('INSERT INTO river_levels (station, lat, lng, level_cm, observed_at) VALUES (?, ?, ?, ?, ?)', rows)
+    return len(rows)
+
+
+# --- Grilla y variables ---
+
+class Grid:
+    """Celdas de RISK_CELL_DEG grados sobre un bbox. cell_id = fila * columnas + columna."""
+
+    def __init__(self, bbox, step):
+        self.west, self.south, self.east, self.north = bbox
+        self.step = step
+        self.rows = max(1, int(math.ceil((self.north - self.south) / step)))
+        self.cols = max(1, int(math.ceil((self.east - self.west) / step)))
+        row, col = np.divmod(np.arange(self.rows * self.cols), self.cols)
+        self.lat = self.south + (row + 0.5) * step
+        self.lng = self.west + (col + 0.5) * step
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def cell_of(self, lat, lng):
+        """cell_id de cada punto, o -1 si cae fuera de la grilla."""
+        row = np.floor((np.asarray(lat, dtype=float) - self.south) / self.step).astype(np.int64)
+        col = np.floor((np.asarray(lng, dtype=float) - self.west) / self.step).astype(np.int64)
+        inside = (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.cols)
+        return np.where(inside, row * self.cols + col, -1)
+
+    def neighbourhood(self, values, reduce):
+        """Combina cada celda con sus 8 vecinas (reduce = np.add o np.maximum)."""
+        padded = np.pad(values.reshape(self.rows, self.cols), 1)
+        result = padded[1:-1, 1:-1].copy()
+        for dr in (0, 1, 2):
+            for dc in (0, 1, 2):
+                if dr != 1 or dc != 1:
+                    reduce(result, padded[dr:dr + self.rows, dc:dc + self.cols], out=result)
+        return result.ravel()
+
+
+def _nearest_within(grid, lat, lng, values, radius_km, falloff=False):
+    """
+    Valor del punto más cercano a cada celda si está a menos de radius_km (0 si no hay).
+    Con falloff, el valor decae linealmente con la distancia hasta anularse en el radio.
+
+    Cada punto solo recorre la ventana de celdas de su radio (no la grilla entera):
+    el costo depende de cuántas celdas cubre cada punto, no de celdas × puntos.
+    Las distancias usan una proyección equirectangular, suficiente a esta escala.
+    """
+    best = np.full((grid.rows, grid.cols), np.inf)  # Distancia² al punto más cercano visto
+    nearest = np.zeros((grid.rows, grid.cols))
+    km_lat = 110.57
+    km_lng = 111.32 * math.cos(math.radians((grid.south + grid.north) / 2))
+    row_centers = (grid.lat[::grid.cols] - grid.south) * km_lat
+    col_centers = (grid.lng[:grid.cols] - grid.west) * km_lng
+    reach_rows = int(math.ceil(radius_km / km_lat / grid.step))
+    reach_cols = int(math.ceil(radius_km / km_lng / grid.step))
+    for point_lat, point_lng, value in zip(np.asarray(lat, dtype=float).tolist(), np.asarray(lng, dtype=float).tolist(),
+                                           np.asarray(values, dtype=float).tolist()):
+        row = int((point_lat - grid.south) / grid.step)
+        col = int((point_lng - grid.west) / grid.step)
+        r0, r1 = max(row - reach_rows, 0), min(row + reach_rows + 1, grid.rows)
+        c0, c1 = max(col - reach_cols, 0), min(col + reach_cols + 1, grid.cols)
+        if r0 >= r1 or c0 >= c1:
+            continue
+        dy = row_centers[r0:r1] - (point_lat - grid.south) * km_lat
+        dx = col_centers[c0:c1] - (point_lng - grid.west) * km_lng
+        squared = dy[:, None] ** 2 + dx[None, :] ** 2
+        window = best[r0:r1, c0:c1]
+        closer = (squared < window) & (squared <= radius_km ** 2)
+        window[closer] = squared[closer]
+        nearest[r0:r1, c0:c1][closer] = value
+    distance = np.sqrt(best.ravel())
+    if falloff:
+        return nearest.ravel() * np.clip(1 - distance / radius_km, 0, 1)
+    return nearest.ravel()
+
+
+def compute_features(grid, reports, rain, rivers):
+    """
+    Matriz (celdas × FEATURES). Cada entrada es una tupla de arrays:
+    reports = (lat, lng, nivel 0-3), rain = (lat, lng, mm), rivers = (lat, lng, delta_cm).
+    """
+    features = np.empty((len(grid), len(FEATURES)))
+    cells = grid.cell_of(reports[0], reports[1])
+    inside = cells >= 0
+    cells = cells[inside]
+    counts = np.bincount(cells, minlength=len(grid)).astype(float)
+    levels = np.zeros(len(grid))
+    np.maximum.at(levels, cells, np.asarray(reports[2], dtype=float)[inside])
+    features[:, 0] = grid.neighbourhood(counts, np.add)
+    features[:, 1] = grid.neighbourhood(levels, np.maximum)
+    features[:, 2] = _nearest_within(grid, *rain, RISK_RAIN_RADIUS_KM)
+    features[:, 3] = _nearest_within(grid, *rivers, RISK_RIVER_RADIUS_KM, falloff=True)
+    return np.round(features, 3)  # Sin ruido de punto flotante: la comparación con la corrida anterior es exacta
+
+
+def score(features):
+    """Probabilidad de anegamiento de cada fila de la matriz de variables."""
+    x = features.copy()
+    x[:, 0] = np.log1p(x[:, 0])
+    return 1.0 / (1.0 + np.exp(-(MODEL_INTERCEPT + x @ MODEL_WEIGHTS)))
+
+
+def risk_level(probability):
+    """(nivel, acción recomendada) para una probabilidad."""
+    for threshold, level, action in RISK_LEVELS:
+        if probability >= threshold:
+            return level, action
+    return RISK_LEVELS[-1][1:]
+
+
+# --- Lectura de entradas ---
+
+def _load_reports(conn, since):
+    rows = conn.execute('SELECT lat, lng, water_level FROM flood_reports WHERE timestamp >= ?', (since,)).fetchall()
+    return (np.array([r[0] for r in rows], dtype=float), np.array([r[1] for r in rows], dtype=float),
+            np.array([WATER_LEVELS.get((r[2] or '').strip().lower(), 0) for r in rows], dtype=float))
+
+
+def _load_rain(conn, now):
+    rows = conn.execute('SELECT lat, lng, rain_mm_1h FROM rainfall_observations WHERE observed_at >= ?',
+                        (now - RISK_RAIN_MAX_AGE,)).fetchall()
+    return tuple(np.array(column, dtype=float) for column in zip(*rows)) if rows else (np.empty(0),) * 3
+
+
+def _load_rivers(conn, now):
+    """Por estación: su última posición y nivel menos el nivel más viejo de las últimas 24 h."""
+    rows = conn.execute('''
+        SELECT lat, lng, level_cm, first_level FROM (
+            SELECT station, lat, lng, level_cm,
+                   FIRST_VALUE(level_cm) OVER (PARTITION BY station ORDER BY observed_at) AS first_level,
+                   ROW_NUMBER() OVER (PARTITION BY station ORDER BY observed_at DESC) AS newest
+            FROM river_levels WHERE observed_at >= ?
+        ) WHERE newest = 1
+    ''', (now - 24 * 3600,)).fetchall()
+    if not rows:
+        return (np.empty(0),) * 3
+    lat, lng, level, first = (np.array(column, dtype=float) for column in zip(*rows))
+    return lat, lng, level - first
+
+
+def _signature(conn, since, now):
+    """Resumen barato de todas las entradas: si no cambió, el resultado tampoco."""
+    reports = conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM flood_reports WHERE timestamp >= ?', (since,)).fetchone()
+    version = conn.execute("SELECT version FROM table_versions WHERE name = 'flood_reports'").fetchone()
+    rain = conn.execute('SELECT COUNT(*), COALESCE(MAX(observed_at), 0), COALESCE(SUM(rain_mm_1h), 0) FROM rainfall_observations WHERE observed_at >= ?',
+                        (now - RISK_RAIN_MAX_AGE,)).fetchone()
+    rivers = conn.execute('SELECT COUNT(*), COALESCE(MAX(id), 0) FROM river_levels WHERE observed_at >= ?', (now - 24 * 3600,)).fetchone()
+    return json.dumps([RISK_BBOX, RISK_CELL_DEG, list(reports), version[0] if version else 0, list(rain), list(rivers)])
+
+
+# --- Recálculo incremental ---
+
+class RiskEngine:
+    def __init__(self, bbox=RISK_BBOX, step=RISK_CELL_DEG):
+        self.grid = Grid(flood_reports.parse_bbox(bbox), step)
+        self.features = None     # Variables de la última corrida conocida (las que están en risk_scores)
+        self.signature = None
+        self._lock = threading.Lock()
+
+    def _load_stored(self, conn):
+        """Variables guardadas en risk_scores (otro worker o una corrida anterior), o None si no sirven."""
+        rows = conn.execute(f"SELECT cell_id, {', '.join(FEATURES)} FROM risk_scores ORDER BY cell_id").fetchall()
+        if len(rows) != len(self.grid):
+            return None  # Tabla vacía o de otra grilla: se escribe completa
+        return np.array([tuple(r)[1:] for r in rows], dtype=float)
+
+    def update(self, conn, features, signature, computed_at):
+        """Puntúa y guarda solo las celdas cuyas variables cambiaron. Devuelve cuántas fueron."""
+        previous = self.features
+        if previous is None:
+            changed = np.arange(len(self.grid))
+        else:
+            changed = np.flatnonzero(np.any(features != previous, axis=1))
+        probabilities = score(features[changed])
+        rows = []
+        for cell, probability, values in zip(changed.tolist(), probabilities.tolist(), features[changed].tolist()):
+            rows.append((cell, round(float(self.grid.lat[cell]), 6), round(float(self.grid.lng[cell]), 6),
+                         round(probability, 4), risk_level(probability)[0], *values, computed_at))
+        with metrics.sqlite_query('risk.save_scores'), conn:
+            if previous is None:
+                conn.execute('DELETE FROM risk_scores')
+            conn.executemany(f'''
+                INSERT OR REPLACE INTO risk_scores (cell_id, lat, lng, probability, risk_level, {', '.join(FEATURES)}, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.execute("INSERT OR REPLACE INTO risk_meta (key, value) VALUES ('signature', ?)", (signature,))
+            conn.execute("INSERT OR REPLACE INTO risk_meta (key, value) VALUES ('computed_at', ?)", (computed_at,))
+        self.features = features
+        self.signature = signature
+        CELLS_SCORED.inc(amount=len(changed))
+        return len(changed)
+
+    def recompute(self, conn):
+        """Recalcula si alguna entrada cambió. Devuelve la cantidad de celdas actualizadas (0 si no hizo falta)."""
+        with self._lock:
+            now = time.time()
+            since = (datetime.datetime.now() - datetime.timedelta(hours=RISK_REPORT_WINDOW_HOURS)).isoformat()
+            signature = _signature(conn, since, now)
+            stored = conn.execute("SELECT value FROM risk_meta WHERE key = 'signature'").fetchone()
+            stored = stored[0] if stored else None
+            if stored == signature and self.signature == signature:
+                return 0
+            if stored != self.signature:
+                # Otro worker actualizó la tabla: se parte de lo que guardó
+                self.features = self._load_stored(conn) if stored else None
+            if stored == signature and self.features is not None:
+                self.signature = signature
+                return 0
+            with metrics.sqlite_query('risk.load_inputs'):
+                features = compute_features(self.grid, _load_reports(conn, since), _load_rain(conn, now), _load_rivers(conn, now))
+            changed = self.update(conn, features, signature, datetime.datetime.now().isoformat())
+            conn.execute('DELETE FROM river_levels WHERE observed_at < ?', (now - RISK_RIVER_RETENTION_HOURS * 3600,))
+            conn.commit()
+            log.info("Riesgo recalculado", extra={'cells': len(self.grid), 'changed': changed})
+            return changed
+
+
+engine = RiskEngine()
+
+
+def _run_periodically():
+    conn = db.connect()
+    while True:
+        try:
+            engine.recompute(conn)
+        except Exception as e:
+            log.warning("Error al recalcular el riesgo", extra={'error': str(e)})
+        time.sleep(RISK_REFRESH_INTERVAL)
+
+
+_worker = None
+_start_lock = threading.Lock()
+
+
+def ensure_started():
+    """Arranca (una sola vez por proceso) el hilo que recalcula el riesgo."""
+    global _worker
+    with _start_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_periodically, name='risk-engine', daemon=True)
+            _worker.start()
+
+
+# --- Consultas ---
+
+def _locality(lat, lng):
+    names = list(LOCALITIES)
+    coords = np.array(list(LOCALITIES.values()))
+    nearest = haversine_matrix(lat, lng, coords[:, 0], coords[:, 1]).argmin(axis=1)
+    return [names[i] for i in nearest]
+
+
+@metrics.sqlite_query('risk.predictions')
+def predictions(conn, bbox=None, center=None, radius_km=None, min_probability=0.0, limit=10):
+    """
+    Celdas con mayor probabilidad, opcionalmente dentro de un bbox o de un radio
+    alrededor de center=(lat, lng). Si todavía no hay resultados, calcula la primera vez.
+    """
+    if conn.execute('SELECT 1 FROM risk_scores LIMIT 1').fetchone() is None:
+        engine.recompute(conn)
+    where, params = ['probability >= ?'], [min_probability]
+    if center is not None:
+        # Prefiltro por bbox del círculo (usa grados aproximados); la distancia exacta se verifica abajo
+        dlat = radius_km / 111.0
+        dlng = radius_km / (111.0 * max(math.cos(math.radians(center[0])), 0.01))
+        bbox = (center[1] - dlng, center[0] - dlat, center[1] + dlng, center[0] + dlat)
+    if bbox is not None:
+        where.append('lng BETWEEN ? AND ? AND lat BETWEEN ? AND ?')
+        params += [bbox[0], bbox[2], bbox[1], bbox[3]]
+    rows = conn.execute(f'''
+        SELECT * FROM risk_scores WHERE {' AND '.join(where)} ORDER BY probability DESC, cell_id
+    ''' + ('' if center is not None else ' LIMIT ?'), params + ([] if center is not None else [limit])).fetchall()
+    if center is not None:
+        distances = haversine_matrix([center[0]], [center[1]], [r['lat'] for r in rows], [r['lng'] for r in rows])[0] if rows else []
+        rows = [r for r, d in zip(rows, distances) if d <= radius_km][:limit]
+    computed_at = conn.execute("SELECT value FROM risk_meta WHERE key = 'computed_at'").fetchone()
+    names = _locality([r['lat'] for r in rows], [r['lng'] for r in rows]) if rows else []
+    result = []
+    for row, name in zip(rows, names):
+        result.append({
+            "id": row['cell_id'],
+            "location_name": f"Almirante Brown ({name})",
+            "latitude": row['lat'],
+            "longitude": row['lng'],
+            "prediction_time": row['updated_at'],
+            "risk_level": row['risk_level'],
+            "probability": row['probability'],
+            "reports_recent": row['report_count'],
+            "max_water_level": LEVEL_NAMES[int(row['max_water_level'])],
+            "rainfall_mm_1h": row['rain_mm_1h'],
+            "river_level_change_cm_24h": row['river_delta_cm'],
+            "recommended_action": risk_level(row['probability'])[1],
+        })
+    return result, (computed_at[0] if computed_at else None)
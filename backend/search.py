@@ -0,0 +1,385 @@
+"""
+Búsqueda de texto completo sobre los reportes de inundación y las noticias
+guardadas, con índices FTS5 de SQLite.
+
+- Índices de contenido externo (`flood_reports_fts` sobre address/description y
+  `news_fts` sobre title/summary/source): el texto no se duplica, el índice
+  solo guarda los términos. Triggers en flood_reports y news_articles los
+  mantienen sincronizados en la misma transacción que cada alta, cambio o baja.
+  Los dos usan como content_rowid una columna INTEGER PRIMARY KEY (`id`): el
+  rowid implícito de una tabla sin ella puede renumerarse con VACUUM.
+- Tokenizador unicode61 con remove_diacritics: "Morón", "moron" y "MORÓN" son el
+  mismo término, igual que "ñ" y "n" (como relevance.fold). No hay stemmer para
+  castellano, así que cada palabra se busca también en singular/plural
+  ("calle" encuentra "calles", "inundaciones" encuentra "inundación").
+  Las frases entre comillas se buscan tal cual. Los términos se citan siempre:
+  la sintaxis de FTS5 que escriba el usuario no llega a la consulta.
+- Orden por BM25. bm25() de FTS5 recorre la lista completa de cada término para
+  contar en cuántos documentos aparece, y en un millón de reportes una palabra
+  común ("agua") está en cientos de miles. Para reportes, en cambio:
+    1. FTS5 recorre las coincidencias por id descendente y corta en las
+       SEARCH_RANK_WINDOW más recientes que cumplen los filtros (o, si la zona
+       o la ventana de tiempo dejan pocos reportes, se toman todos del R*Tree
+       o del índice por fecha);
+    2. BM25 se calcula con NumPy sobre esa ventana, con la frecuencia de cada
+       término en toda la tabla cacheada por SEARCH_DF_TTL segundos, y el
+       fragmento de contexto sale de las mismas regex sobre el texto ya leído.
+  Así el costo no depende de cuántos reportes contengan las palabras. Las
+  noticias son pocas y usan bm25() y snippet() de FTS5 directamente.
+
+Si la versión de SQLite no trae FTS5, no se crean los índices y la búsqueda
+responde que no está disponible.
+"""
+import html
+import logging
+import math
+import os
+import re
+import sqlite3
+
+import numpy as np
+
+import cache
+import flood_reports
+import metrics
+import news_store
+from relevance import fold
+
+log = logging.getLogger(__name__)
+
+SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', '20'))   # Resultados por tipo si no se pide `limit`
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+SEARCH_RANK_WINDOW = int(os.getenv('SEARCH_RANK_WINDOW', '1000'))     # Reportes recientes que compiten por relevancia
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', '8'))            # Palabras de la búsqueda que se tienen en cuenta
+SEARCH_SNIPPET_TOKENS = int(os.getenv('SEARCH_SNIPPET_TOKENS', '16'))  # Largo del fragmento de contexto
+SEARCH_DF_TTL = int(os.getenv('SEARCH_DF_TTL', '600'))                # Segundos que se reutiliza la frecuencia de un término
+
+TOKENIZER = "unicode61 remove_diacritics 2"
+REPORT_WEIGHTS = (2.0, 1.0)        # BM25 por columna: address, description
+NEWS_WEIGHTS = (3.0, 1.0, 0.5)     # title, summary, source
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Marcas del fragmento antes de escapar el HTML (no aparecen en el texto)
+_OPEN, _CLOSE = '\x02', '\x03'
+_QUERY_PARTS = re.compile(r'"([^"]*)"?|([^\s"]+)')
+_WORDS = re.compile(r'[a-z0-9]+')
+_NON_SPACE = re.compile(r'\S+')
+_TAGS = re.compile(r'<[^<>]*>')
+_PARTIAL_TAGS = re.compile(r'^[^<]*?>|<[^>]*$')
+
+# Documentos que contienen cada término, por índice y expresión
+document_frequency = cache.SingleFlightCache('search_df', ttl=SEARCH_DF_TTL, max_entries=4096)
+
+
+def create_tables(cursor):
+    """Crea los índices FTS5 y los triggers que los mantienen al día (idempotente)."""
+    existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    # Índices creados sobre el rowid implícito de news_articles (ver news_store.create_tables): se rehacen sobre `id`
+    if 'news_fts' in existing and "content_rowid='rowid'" in _table_sql(cursor, 'news_fts'):
+        for event in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS news_fts_{event}')
+        cursor.execute('DROP TABLE news_fts')
+        existing.discard('news_fts')
+    try:
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS flood_reports_fts USING fts5(
+                address, description, content='flood_reports', content_rowid='id', tokenize='{TOKENIZER}'
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(
+                title, summary, source, content='news_articles', content_rowid='id', tokenize='{TOKENIZER}'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        log.warning("SQLite sin soporte FTS5; /api/search no va a estar disponible", extra={'error': str(e)})
+        return
+
+    _create_triggers(cursor, 'flood_reports', 'flood_reports_fts', 'id', ('address', 'description'))
+    _create_triggers(cursor, 'news_articles', 'news_fts', 'id', ('title', 'summary', 'source'))
+    # Filas cargadas antes de que existiera el índice
+    for fts in ('flood_reports_fts', 'news_fts'):
+        if fts not in existing:
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def _table_sql(cursor, name):
+    row = cursor.execute("SELECT sql FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else ''
+
+
+def _create_triggers(cursor, table, fts, rowid, columns):
+    """Triggers de alta, baja y cambio de texto de un índice de contenido externo."""
+    names = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    # FTS5 borra un documento con el comando 'delete' y los valores que tenía al indexarlo
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.{rowid}, {old_values});"
+    insert = f"INSERT INTO {fts} (rowid, {names}) VALUES (new.{rowid}, {new_values});"
+    # El upsert del agregador reescribe todas las columnas en cada corrida: solo se reindexa si cambió el texto
+    changed = ' OR '.join(f'old.{c} IS NOT new.{c}' for c in columns)
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} WHEN {changed} BEGIN
+            {delete} {insert}
+        END
+    ''')
+
+
+def available(conn):
+    """True si la base tiene los índices FTS5."""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'flood_reports_fts'").fetchone()
+    return row is not None
+
+
+# --- Consulta ---
+
+def word_forms(word):
+    """La palabra y sus formas probables en singular/plural (reglas del castellano, sin diccionario)."""
+    if len(word) < 4 or word.isdigit():
+        return (word,)
+    if word.endswith('ces'):
+        forms = (word, word[:-3] + 'z')            # luces → luz
+    elif word.endswith('es'):
+        forms = (word, word[:-1], word[:-2])       # calles → calle, inundaciones → inundacion
+    elif word.endswith('s'):
+        forms = (word, word[:-1])                  # casas → casa
+    elif word.endswith('z'):
+        forms = (word, word[:-1] + 'ces')
+    elif word[-1] in 'aeiou':
+        forms = (word, word + 's')
+    else:
+        forms = (word, word + 'es')                # inundacion → inundaciones
+    return forms
+
+
+def parse_query(query):
+    """
+    Términos de la búsqueda: cada uno es una tupla de formas alternativas (una
+    frase es una sola forma con varias palabras). Todos los términos son obligatorios.
+    Lanza ValueError si no queda ninguno.
+    """
+    terms = []
+    for phrase, word in _QUERY_PARTS.findall(fold(query or '')):
+        words = _WORDS.findall(phrase or word)
+        if phrase and words:
+            terms.append((' '.join(words),))
+        else:
+            terms.extend(word_forms(w) for w in words)
+    if not terms:
+        raise ValueError("q no tiene palabras para buscar")
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def _term_match(term):
+    return '(' + ' OR '.join(f'"{form}"' for form in term) + ')'
+
+
+def match_expression(terms):
+    """Expresión MATCH de FTS5 de los términos (los valores ya son solo [a-z0-9] y espacios)."""
+    return ' AND '.join(_term_match(term) for term in terms)
+
+
+def _term_regex(term):
+    """
+    Regex equivalente al término sobre texto pasado por fold(). El borde de palabra
+    inicial va como lookbehind después del literal: así `re` busca primero el
+    literal (mucho más rápido que probar el borde en cada posición).
+    """
+    alternatives = []
+    for form in sorted(term, key=len, reverse=True):
+        first, *rest = form.split()
+        alternatives.append(first + f'(?<![a-z0-9]{first})' + ''.join(r'[^a-z0-9]+' + w for w in rest))
+    return re.compile('(?:' + '|'.join(alternatives) + ')(?![a-z0-9])')
+
+
+# --- Puntaje ---
+
+def _idf(conn, fts, term, total):
+    """IDF de BM25 con la cantidad de documentos del índice que tienen el término (cacheada)."""
+    expression = _term_match(term)
+    df = document_frequency.get_or_load((fts, expression), lambda: conn.execute(
+        f"SELECT count(*) FROM {fts} WHERE {fts} MATCH ?", (expression,)).fetchone()[0])
+    return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+
+def bm25(columns, weights, terms, idf):
+    """
+    Puntaje BM25 (mayor es mejor) de cada documento y máscara de los que contienen
+    todos los términos. `columns` es una lista de columnas, cada una con el texto de
+    cada documento. Los textos de una columna se unen y cada término se marca con
+    una sola sustitución; las frecuencias salen de contar marcas por documento con
+    NumPy. El largo de cada documento se mide en caracteres.
+    """
+    count = len(columns[0])
+    scores = np.zeros(count)
+    found = np.zeros((len(terms), count), dtype=bool)
+    for texts, weight in zip(columns, weights):
+        # Después de fold() el texto es ASCII: un byte por carácter
+        folded = fold('\x00'.join(text or '' for text in texts).replace('\x01', ' '))
+        data = np.frombuffer(folded.encode('ascii'), dtype=np.uint8)
+        lengths = np.diff(np.concatenate(([-1], np.flatnonzero(data == 0), [len(data)]))) - 1
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1.0))
+        for t, term in enumerate(terms):
+            marked = np.frombuffer(_term_regex(term).sub('\x01', folded).encode('ascii'), dtype=np.uint8)
+            # Documento de cada marca: cuántos separadores hay antes
+            documents = np.searchsorted(np.flatnonzero(marked == 0), np.flatnonzero(marked == 1))
+            tf = np.bincount(documents, minlength=count)
+            scores += idf[t] * weight * tf * (BM25_K1 + 1) / (tf + norm)
+            found[t] |= tf > 0
+    return scores, found.all(axis=0)
+
+
+# --- Fragmentos ---
+
+def highlight(text, regexes, tokens=SEARCH_SNIPPET_TOKENS):
+    """
+    Fragmento de `text` de hasta `tokens` palabras alrededor de la primera
+    coincidencia, escapado como HTML y con los términos entre <mark>. None si no
+    hay coincidencias o si fold() cambia el largo del texto (las posiciones ya no coinciden).
+    """
+    if not text:
+        return None
+    folded = fold(text)
+    if len(folded) != len(text):
+        return None
+    spans = sorted(m.span() for regex in regexes for m in regex.finditer(folded))
+    if not spans:
+        return None
+    words = [m.span() for m in _NON_SPACE.finditer(text)]
+    first = next(i for i, (_, end) in enumerate(words) if end > spans[0][0])
+    start_word = max(0, first - tokens // 3)
+    end_word = min(len(words), start_word + tokens)
+    start, end = words[start_word][0], words[end_word - 1][1]
+    parts = ['…' if start_word > 0 else '']
+    position = start
+    for span_start, span_end in spans:
+        if span_start < position or span_end > end:
+            continue
+        parts += [html.escape(text[position:span_start], quote=False),
+                  '<mark>', html.escape(text[span_start:span_end], quote=False), '</mark>']
+        position = span_end
+    parts += [html.escape(text[position:end], quote=False), '…' if end_word < len(words) else '']
+    return ''.join(parts)
+
+
+def render_snippet(text, strip_html=False):
+    """Fragmento de FTS5 listo para insertar como HTML: texto escapado y términos encontrados entre <mark>."""
+    if text is None:
+        return None
+    if strip_html:
+        text = _PARTIAL_TAGS.sub(' ', _TAGS.sub(' ', text))
+    text = ' '.join(html.escape(text, quote=False).split())
+    return text.replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def _snippets(conn, fts, match, ids, strip_html=False):
+    """Fragmentos de FTS5 de los ids dados (ya elegidos), en una sola consulta."""
+    if not ids:
+        return {}
+    placeholders = ', '.join('?' * len(ids))
+    rows = conn.execute(f'''
+        SELECT rowid, snippet({fts}, -1, '{_OPEN}', '{_CLOSE}', '…', {SEARCH_SNIPPET_TOKENS})
+        FROM {fts} WHERE {fts} MATCH ? AND rowid IN ({placeholders})
+    ''', [match, *ids]).fetchall()
+    return {rowid: render_snippet(text, strip_html) for rowid, text in rows}
+
+
+# --- Búsquedas ---
+
+def _filtered_candidates(conn, bbox, since, until):
+    """
+    Si la zona y la ventana de tiempo dejan a lo sumo SEARCH_RANK_WINDOW reportes,
+    los devuelve todos (id, address, description) desde el R*Tree o el índice por
+    fecha; las palabras se verifican al puntuar. Si no hay filtros o dejan más, None.
+    """
+    if not (bbox or since or until):
+        return None
+    from_clause, conditions, params = flood_reports.build_filters(conn, bbox, since, until)
+    rows = conn.execute(f'''
+        SELECT r.id, r.address, r.description FROM {from_clause}
+        WHERE {' AND '.join(conditions)} LIMIT ?
+    ''', [*params, SEARCH_RANK_WINDOW + 1]).fetchall()
+    return rows if len(rows) <= SEARCH_RANK_WINDOW else None
+
+
+@metrics.sqlite_query('search.reports')
+def search_reports(conn, terms, bbox=None, since=None, until=None, limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Reportes que contienen los términos, de más a menos relevante, con los filtros
+    de zona y tiempo de /api/flood-zones. Devuelve una lista de (fila, puntaje, fragmento).
+    """
+    match = match_expression(terms)
+    candidates = _filtered_candidates(conn, bbox, since, until)
+    selective = candidates is not None
+    if not selective:
+        # Las SEARCH_RANK_WINDOW coincidencias más recientes: FTS5 las recorre por id sin ordenar
+        _, conditions, params = flood_reports.build_filters(conn, bbox, since, until, use_rtree=False)
+        candidates = conn.execute(f'''
+            SELECT r.id, r.address, r.description
+            FROM flood_reports_fts JOIN flood_reports r ON r.id = flood_reports_fts.rowid
+            WHERE flood_reports_fts MATCH ?{''.join(f' AND {c}' for c in conditions)}
+            ORDER BY flood_reports_fts.rowid DESC LIMIT ?
+        ''', [match, *params, SEARCH_RANK_WINDOW]).fetchall()
+    if not candidates:
+        return []
+
+    ids = np.array([row[0] for row in candidates])
+    if len(terms) > 1:
+        total = flood_reports.get_high_water(conn)[0]  # Aproxima la cantidad de reportes sin contarlos
+        idf = [_idf(conn, 'flood_reports_fts', term, total) for term in terms]
+    else:
+        idf = [1.0]  # Con un solo término el IDF no cambia el orden
+    scores, found = bm25([[row[1] for row in candidates], [row[2] for row in candidates]], REPORT_WEIGHTS, terms, idf)
+    if selective:
+        ids, scores = ids[found], scores[found]
+    # Mayor puntaje primero; a igual puntaje, el más nuevo
+    order = np.lexsort((-ids, -scores))[:limit]
+    top = [int(ids[i]) for i in order]
+    if not top:
+        return []
+    by_id = {row['id']: row for row in conn.execute(
+        f"SELECT {flood_reports.REPORT_COLUMNS} FROM flood_reports r WHERE r.id IN ({', '.join('?' * len(top))})", top)}
+    # Fragmento de la descripción (o de la dirección si las palabras están solo ahí), con las mismas regex del puntaje
+    regexes = [_term_regex(term) for term in terms]
+    results = []
+    for report_id, i in zip(top, order):
+        row = by_id[report_id]
+        snippet = highlight(row['description'], regexes) or highlight(row['address'], regexes)
+        results.append((row, float(scores[i]), snippet))
+    return results
+
+
+@metrics.sqlite_query('search.news')
+def search_news(conn, terms, since=None, until=None, source=None, limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Noticias guardadas que contienen los términos, de más a menos relevante (bm25 de FTS5).
+    `since`/`until` son fechas ISO y se comparan con la fecha de publicación.
+    """
+    conditions, params = [], []
+    for value, operator in ((since, '>='), (until, '<')):
+        if value:
+            epoch = news_store.to_epoch(value)
+            if epoch is None:
+                raise ValueError(f"fecha inválida: {value}")
+            conditions.append(f"a.published_at {operator} ?")
+            params.append(epoch)
+    if source:
+        conditions.append("a.source = ?")
+        params.append(source)
+    match = match_expression(terms)
+    rows = conn.execute(f'''
+        SELECT a.id, a.title, a.source, a.date, a.link, a.image_url, a.published_at,
+               bm25(news_fts, {', '.join(map(str, NEWS_WEIGHTS))}) AS score
+        FROM news_fts JOIN news_articles a ON a.id = news_fts.rowid
+        WHERE news_fts MATCH ?{''.join(f' AND {c}' for c in conditions)}
+        ORDER BY score LIMIT ?
+    ''', [match, *params, limit]).fetchall()
+    snippets = _snippets(conn, 'news_fts', match, [r[0] for r in rows], strip_html=True)
+    return [
+        {'title': r[1], 'source': r[2], 'date': r[3], 'link': r[4], 'imageUrl': r[5], 'publishedAt': r[6],
+         'score': round(-r[7], 4), 'snippet': snippets.get(r[0])}
+        for r in rows
+    ]
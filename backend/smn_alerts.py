@@ -0,0 +1,347 @@
+"""
+Alertas a corto plazo del SMN (GeoRSS) filtradas por región.
+
+- El feed se descarga y parsea una sola vez cada SMN_CACHE_TTL segundos; todas
+  las consultas por región comparten ese resultado.
+- Las regiones son puntos con radio (en km) o polígonos. Se configuran en
+  DEFAULT_REGIONS o en un archivo JSON indicado en SMN_REGIONS_FILE.
+- La distancia alerta×región se calcula con haversine en una sola pasada de
+  NumPy; los polígonos se resuelven con ray casting vectorizado.
+- Un hilo vigía (ensure_watching) revisa el feed cada SMN_WATCH_INTERVAL
+  segundos y publica en events.py las alertas nuevas o modificadas.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import feedparser
+import numpy as np
+
+import cache
+import db
+import events
+import http_client
+import metrics
+from relevance import fold
+
+log = logging.getLogger(__name__)
+
+SMN_ALERT_RSS_URL = os.getenv('SMN_ALERT_RSS_URL', 'https://ssl.smn.gob.ar/feeds/avisocorto_GeoRSS.xml')
+SMN_TIMEOUT = float(os.getenv('SMN_TIMEOUT', '5'))
+SMN_CACHE_TTL = int(os.getenv('SMN_CACHE_TTL', '120'))             # Segundos que se reutiliza el feed parseado
+SMN_REGIONS_FILE = os.getenv('SMN_REGIONS_FILE')                   # JSON con regiones propias (reemplaza las de abajo)
+SMN_DEFAULT_REGION = os.getenv('SMN_DEFAULT_REGION', 'almirante_brown')
+SMN_DEFAULT_RADIUS_KM = float(os.getenv('SMN_DEFAULT_RADIUS_KM', '55'))
+SMN_WATCH_INTERVAL = int(os.getenv('SMN_WATCH_INTERVAL', str(SMN_CACHE_TTL)))  # Segundos entre revisiones del vigía
+
+EARTH_RADIUS_KM = 6371.0
+
+# Regiones por defecto. Un punto lleva "lat", "lon" y "radius_km"; un polígono lleva
+# "polygon": [[lat, lon], ...]. "name" se usa además para buscar la región en el
+# texto de las alertas que no traen coordenadas.
+DEFAULT_REGIONS = {
+    "almirante_brown": {"name": "Almirante Brown", "lat": -34.8090, "lon": -58.4060, "radius_km": 55},
+    "lomas_de_zamora": {"name": "Lomas de Zamora", "lat": -34.7609, "lon": -58.4063, "radius_km": 40},
+    "quilmes": {"name": "Quilmes", "lat": -34.7206, "lon": -58.2546, "radius_km": 40},
+    "lanus": {"name": "Lanús", "lat": -34.7061, "lon": -58.3918, "radius_km": 40},
+    "esteban_echeverria": {"name": "Esteban Echeverría", "lat": -34.8197, "lon": -58.4678, "radius_km": 40},
+    "florencio_varela": {"name": "Florencio Varela", "lat": -34.8070, "lon": -58.2787, "radius_km": 40},
+}
+
+_feed_cache = cache.SingleFlightCache('smn', ttl=SMN_CACHE_TTL, max_entries=1, stale_ttl=1800)
+
+
+class FeedError(Exception):
+    """El feed del SMN no se pudo descargar o parsear."""
+
+
+class Region:
+    def __init__(self, region_id, name, lat=None, lon=None, radius_km=None, polygon=None):
+        self.id = region_id
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=float) if polygon else None
+        if self.polygon is not None:
+            # El centroide de los vértices alcanza para ver si cae dentro del área de una alerta
+            lat, lon = self.polygon.mean(axis=0)
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.radius_km = float(radius_km) if radius_km is not None else SMN_DEFAULT_RADIUS_KM
+
+    def to_dict(self):
+        data = {"id": self.id, "name": self.name}
+        if self.polygon is not None:
+            data["polygon"] = self.polygon.tolist()
+        else:
+            data.update(lat=self.lat, lon=self.lon, radius_km=self.radius_km)
+        return data
+
+
+def load_regions(path=SMN_REGIONS_FILE):
+    """Lee las regiones del JSON configurado o usa DEFAULT_REGIONS."""
+    definitions = DEFAULT_REGIONS
+    if path:
+        with open(path, encoding='utf-8') as f:
+            definitions = json.load(f)
+    return {region_id: Region(region_id, **spec) for region_id, spec in definitions.items()}
+
+
+REGIONS = load_regions()
+
+
+# --- Geometría vectorizada ---
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """Distancias en km entre cada punto 1 (filas) y cada punto 2 (columnas). Entradas en grados."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    dlat = lat2[None, :] - lat1[:, None]
+    dlon = lon2[None, :] - lon1[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1)[:, None] * np.cos(lat2)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def points_in_polygon(lat, lon, polygon):
+    """Ray casting de todos los puntos contra todas las aristas a la vez. Devuelve un array de bool."""
+    lat = np.asarray(lat, dtype=float)[:, None]
+    lon = np.asarray(lon, dtype=float)[:, None]
+    lat1, lon1 = polygon[:, 0], polygon[:, 1]
+    lat2, lon2 = np.roll(lat1, -1), np.roll(lon1, -1)
+    crosses = (lat1 > lat) != (lat2 > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lon_at_lat = lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+    return np.count_nonzero(crosses & (lon < lon_at_lat), axis=1) % 2 == 1
+
+
+# --- Feed parseado ---
+
+def _parse_entry(entry):
+    alert_data = {
+        "title": entry.title if hasattr(entry, 'title') else "Sin título",
+        "link": entry.link if hasattr(entry, 'link') else "#",
+        "summary": entry.summary if hasattr(entry, 'summary') else "Sin descripción",
+        "published": entry.published_parsed if hasattr(entry, 'published_parsed') else None,
+        "location_name": "Desconocida", # Asumimos hasta que encontremos GeoRSS
+        "latitude": None,
+        "longitude": None,
+        "alert_level": "Sin especificar", # Podrías extraerlo del título/sumario si es consistente
+        "polygon": None # Área de la alerta, [[lat, lon], ...], si el feed la trae
+    }
+    polygon = None
+
+    # feedparser expone la geometría GeoRSS (georss:point/polygon, gml:pos) en `where`,
+    # con coordenadas en orden GeoJSON (lon, lat)
+    where = entry.get('where') or {}
+    try:
+        if where.get('type') == 'Point':
+            lon, lat = where['coordinates'][:2]
+            alert_data["latitude"], alert_data["longitude"] = float(lat), float(lon)
+            alert_data["location_name"] = "Coordenadas específicas"
+        elif where.get('type') == 'Polygon':
+            ring = [[float(lat), float(lon)] for lon, lat in where['coordinates'][0]]
+            if len(ring) >= 3:
+                polygon = alert_data["polygon"] = ring
+                alert_data["latitude"], alert_data["longitude"] = np.mean(ring, axis=0).tolist()
+    except (KeyError, IndexError, TypeError, ValueError):
+        pass # Si no se puede parsear, sigue sin coordenadas
+
+    # Versiones anteriores de feedparser dejaban el punto como texto en georss_point
+    if alert_data["latitude"] is None and hasattr(entry, 'georss_point'):
+        try:
+            lat_str, lon_str = entry.georss_point.split(' ')
+            alert_data["latitude"] = float(lat_str)
+            alert_data["longitude"] = float(lon_str)
+            alert_data["location_name"] = "Coordenadas específicas"
+        except (ValueError, AttributeError):
+            pass
+
+    # El feed avisocorto_GeoRSS.xml tiene la ubicación en 'georss_featuretypetag' o 'georss_where'
+    if hasattr(entry, 'gegeorss_featuretypetag') and entry.gegeorss_featuretypetag.startswith('P_'):
+        alert_data["location_name"] = entry.gegeorss_featuretypetag.replace('P_', '').replace('_', ' ').title()
+
+    return alert_data, polygon
+
+
+class ParsedFeed:
+    """
+    Alertas del feed más los arrays que usa el filtro: todos los puntos de todas las
+    alertas (el punto o los vértices del área) en un solo array, con el índice de la
+    alerta a la que pertenece cada uno.
+    """
+
+    def __init__(self, entries):
+        self.alerts = []
+        self.polygons = []       # Por alerta: array de vértices o None
+        self.folded_text = []    # Título + resumen normalizados, para las alertas sin coordenadas
+        lats, lons, owners = [], [], []
+        for entry in entries:
+            alert_data, polygon = _parse_entry(entry)
+            index = len(self.alerts)
+            self.alerts.append(alert_data)
+            self.polygons.append(np.asarray(polygon) if polygon else None)
+            self.folded_text.append(fold(f"{alert_data['title']} {alert_data['summary']}"))
+            points = polygon or ([[alert_data["latitude"], alert_data["longitude"]]] if alert_data["latitude"] is not None else [])
+            for lat, lon in points:
+                lats.append(lat)
+                lons.append(lon)
+                owners.append(index)
+        self.point_lat = np.array(lats, dtype=float)
+        self.point_lon = np.array(lons, dtype=float)
+        self.point_owner = np.array(owners, dtype=np.intp)
+        self.has_coords = np.zeros(len(self.alerts), dtype=bool)
+        self.has_coords[self.point_owner] = True
+
+    def match(self, regions):
+        """
+        Devuelve una matriz de bool alertas×regiones: True si la alerta afecta a la región.
+        """
+        n_alerts, n_regions = len(self.alerts), len(regions)
+        matches = np.zeros((n_alerts, n_regions), dtype=bool)
+        if n_alerts == 0 or n_regions == 0:
+            return matches
+
+        circles = [j for j, r in enumerate(regions) if r.polygon is None]
+        if circles and self.point_owner.size:
+            # Una sola pasada: distancia de cada punto de cada alerta a cada centro
+            distances = haversine_matrix(
+                self.point_lat, self.point_lon,
+                [regions[j].lat for j in circles], [regions[j].lon for j in circles],
+            )
+            inside = distances <= np.array([regions[j].radius_km for j in circles])[None, :]
+            hits = np.zeros((n_alerts, len(circles)), dtype=bool)
+            np.logical_or.at(hits, self.point_owner, inside)
+            matches[:, circles] |= hits
+
+        for j, region in enumerate(regions):
+            if region.polygon is not None and self.point_owner.size:
+                inside = points_in_polygon(self.point_lat, self.point_lon, region.polygon)
+                np.logical_or.at(matches[:, j], self.point_owner, inside)
+
+        # Alertas con área: también cuentan si la región (su centro) cae dentro del área
+        centers_lat = [r.lat for r in regions]
+        centers_lon = [r.lon for r in regions]
+        for i, polygon in enumerate(self.polygons):
+            if polygon is not None:
+                matches[i] |= points_in_polygon(centers_lat, centers_lon, polygon)
+
+        # Alertas sin coordenadas: se busca el nombre de la región en el texto
+        for i in np.flatnonzero(~self.has_coords):
+            for j, region in enumerate(regions):
+                if fold(region.name) in self.folded_text[i]:
+                    matches[i, j] = True
+        return matches
+
+
+def _download_and_parse():
+    with metrics.upstream_call('SMN'):
+        response = http_client.get(SMN_ALERT_RSS_URL, source='SMN', timeout=SMN_TIMEOUT)
+        response.raise_for_status()
+    with metrics.feed_parse('SMN'):
+        feed = feedparser.parse(response.content)
+    if feed.bozo and not feed.entries: # bozo=1 significa que hubo un error al parsear el feed
+        raise FeedError(str(feed.bozo_exception))
+    return ParsedFeed(feed.entries)
+
+
+def get_feed():
+    """Feed parseado, compartido por todas las consultas durante SMN_CACHE_TTL segundos."""
+    return _feed_cache.get_or_load(SMN_ALERT_RSS_URL, _download_and_parse)
+
+
+def alerts_for(regions):
+    """Alertas que afectan a alguna de las regiones, con la lista de regiones de cada una."""
+    feed = get_feed()
+    matches = feed.match(regions)
+    result = []
+    for i in np.flatnonzero(matches.any(axis=1)):
+        alert = dict(feed.alerts[i])
+        alert["regions"] = [regions[j].id for j in np.flatnonzero(matches[i])]
+        result.append(alert)
+    return result
+
+
+def cache_stats():
+    return _feed_cache.stats()
+
+
+# --- Vigía de cambios (alimenta el canal de eventos) ---
+
+def create_tables(cursor):
+    """Huella de cada alerta vista, para detectar las nuevas o modificadas entre workers."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS smn_alert_state (
+            alert_key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            seen_at REAL NOT NULL
+        )
+    ''')
+
+
+_INITIALIZED = ''  # Fila marcadora: el vigía ya corrió al menos una vez con esta base
+
+
+def _alert_key(alert):
+    return alert["link"] if alert["link"] != "#" else alert["title"]
+
+
+def _fingerprint(alert):
+    return hashlib.sha1(json.dumps(alert, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+@metrics.sqlite_query('smn.detect_changes')
+def detect_changes(conn, alerts):
+    """
+    Compara las alertas con el estado guardado, lo actualiza y agrega un evento por
+    cada alerta nueva o modificada, todo en una transacción: si varios workers ven
+    el mismo cambio, solo el primero lo publica. Devuelve las alertas publicadas.
+    """
+    now = time.time()
+    current = {_alert_key(a): (_fingerprint(a), a) for a in alerts}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        stored = dict(conn.execute('SELECT alert_key, fingerprint FROM smn_alert_state').fetchall())
+        first_run = _INITIALIZED not in stored
+        changed = [alert for key, (fp, alert) in current.items() if stored.get(key) != fp]
+        rows = [(key, fp, now) for key, (fp, _) in current.items()] + [(_INITIALIZED, '', now)]
+        conn.executemany('INSERT OR REPLACE INTO smn_alert_state (alert_key, fingerprint, seen_at) VALUES (?, ?, ?)', rows)
+        gone = [key for key in stored if key not in current and key != _INITIALIZED]
+        conn.executemany('DELETE FROM smn_alert_state WHERE alert_key = ?', [(key,) for key in gone])
+        if first_run:
+            changed = []  # Primera corrida: el feed actual es el punto de partida, no se avisa
+        for alert in changed:
+            events.insert(conn, 'smn_alert', alert)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return changed
+
+
+def _watch():
+    conn = db.connect()
+    regions = list(REGIONS.values())
+    while True:
+        try:
+            # Un solo worker descarga el feed por turno; los demás reciben los cambios por la tabla events
+            if db.claim_slot(conn, 'smn_watch', SMN_WATCH_INTERVAL):
+                changed = detect_changes(conn, alerts_for(regions))
+                if changed:
+                    events.notify()
+                    log.info("Alertas del SMN nuevas o modificadas", extra={'alerts': len(changed)})
+        except Exception as e:
+            log.warning("Error al revisar el feed del SMN", extra={'error': str(e)})
+        time.sleep(SMN_WATCH_INTERVAL - time.time() % SMN_WATCH_INTERVAL)
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def ensure_watching():
+    """Arranca (una sola vez por proceso) el hilo que detecta cambios en las alertas."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, name='smn-watch', daemon=True)
+            _watcher.start()
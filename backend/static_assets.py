@@ -0,0 +1,180 @@
+"""
+Archivos del frontend servidos desde memoria.
+
+Al iniciar se leen todos los archivos de `frontend/`, se calcula su hash (ETag)
+y se precomprimen con gzip (y brotli si el módulo está instalado). Cada petición
+solo elige la variante según Accept-Encoding y responde; un If-None-Match que
+coincide devuelve 304 sin tocar el disco.
+
+En modo desarrollo (STATIC_WATCH=1 o `python app.py`) un hilo revisa las fechas de
+modificación y recarga los archivos que cambian.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # Sin brotli se ofrece solo gzip
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+STATIC_MAX_AGE = int(os.getenv('STATIC_MAX_AGE', '300'))            # Caché de los archivos que no son HTML
+STATIC_WATCH_INTERVAL = float(os.getenv('STATIC_WATCH_INTERVAL', '1'))
+MIN_COMPRESS_BYTES = 512
+
+_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+
+class Variant:
+    """Un cuerpo ya codificado con sus cabeceras armadas."""
+
+    def __init__(self, body, etag, headers):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+
+
+class Asset:
+    def __init__(self, path, body, mtime):
+        self.mtime = mtime
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype == 'application/javascript':
+            mimetype += '; charset=utf-8'
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        cache_control = 'no-cache' if mimetype.startswith('text/html') else f'public, max-age={STATIC_MAX_AGE}'
+        last_modified = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(mtime))
+
+        def variant(data, suffix, encoding=None):
+            etag = f'"{digest}{suffix}"'
+            headers = [
+                ('Content-Type', mimetype),
+                ('ETag', etag),
+                ('Last-Modified', last_modified),
+                ('Cache-Control', cache_control),
+                ('Vary', 'Accept-Encoding'),
+            ]
+            if encoding:
+                headers.append(('Content-Encoding', encoding))
+            return Variant(data, etag, headers)
+
+        # Orden de preferencia: brotli, gzip, sin comprimir
+        self.variants = {}
+        if len(body) >= MIN_COMPRESS_BYTES and mimetype.startswith(_COMPRESSIBLE):
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = variant(compressed, '-br', 'br')
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = variant(compressed, '-gz', 'gzip')
+        self.variants['identity'] = variant(body, '')
+        # Cualquier variante representa el mismo contenido: todas sirven para el 304
+        self.etags = frozenset(v.etag for v in self.variants.values())
+
+
+def _accepted_encodings(header):
+    """Codificaciones aceptadas (q > 0) de un Accept-Encoding."""
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    def __init__(self, root, watch=False):
+        self.root = root
+        self.assets = {}   # ruta relativa ('index.html', 'css/app.css') -> Asset
+        self._encoding_cache = {}  # Accept-Encoding crudo -> codificaciones aceptadas
+        self._watching = False
+        self.reload()
+        if watch:
+            self.start_watching()
+
+    def start_watching(self):
+        """Inicia el hilo que recarga los archivos modificados (una sola vez)."""
+        if not self._watching:
+            self._watching = True
+            threading.Thread(target=self._watch, name='static-watch', daemon=True).start()
+
+    def _scan(self):
+        """Rutas relativas y mtime de todos los archivos (sin los ocultos)."""
+        found = {}
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(directory, filename)
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                found[relative] = os.path.getmtime(path)
+        return found
+
+    def reload(self):
+        """Lee de nuevo los archivos nuevos o modificados y olvida los borrados."""
+        found = self._scan()
+        assets = {}
+        for relative, mtime in found.items():
+            current = self.assets.get(relative)
+            if current is not None and current.mtime == mtime:
+                assets[relative] = current
+                continue
+            with open(os.path.join(self.root, relative), 'rb') as f:
+                assets[relative] = Asset(relative, f.read(), mtime)
+        changed = assets.keys() != self.assets.keys() or any(assets[k] is not self.assets.get(k) for k in assets)
+        self.assets = assets  # Reemplazo atómico: las peticiones en curso ven el dict anterior o el nuevo
+        return changed
+
+    def _watch(self):
+        while True:
+            time.sleep(STATIC_WATCH_INTERVAL)
+            try:
+                if self.reload():
+                    log.info("Frontend recargado", extra={'files': len(self.assets)})
+            except OSError as e:
+                log.warning("Error al recargar el frontend", extra={'error': str(e)})
+
+    def _encodings(self, header):
+        accepted = self._encoding_cache.get(header)
+        if accepted is None:
+            accepted = _accepted_encodings(header)
+            if len(self._encoding_cache) < 256:  # Los navegadores mandan pocas variantes distintas
+                self._encoding_cache[header] = accepted
+        return accepted
+
+    def response(self, path, request):
+        """Respuesta para `path`, o None si no existe."""
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+
+        accepted = self._encodings(request.headers.get('Accept-Encoding', ''))
+        variant = asset.variants['identity']
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in asset.variants:
+                variant = asset.variants[encoding]
+                break
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in tags or not tags.isdisjoint(asset.etags):
+                return Response(status=304, headers=variant.headers)
+
+        return Response(variant.body, headers=variant.headers)
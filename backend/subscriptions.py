@@ -0,0 +1,758 @@
+"""
+Suscripciones a avisos por zona: vecinos e instituciones (escuelas, hospitales)
+registran un punto con radio o un polígono y reciben los reportes de inundación
+y las alertas del SMN que caen adentro.
+
+- El cruce usa un índice en memoria por proceso (SubscriptionIndex): las
+  suscripciones en arrays de NumPy y una grilla de celdas de
+  SUBSCRIPTIONS_GRID_DEG que, para cada celda, lista las suscripciones que la
+  tocan. Un reporte se compara solo con las de su celda y la geometría exacta
+  (haversine, ray casting) se evalúa sobre todas ellas a la vez: con 100k
+  suscripciones se cruza en milisegundos. El índice se rearma desde la tabla
+  cuando cambia su versión en table_versions (altas y bajas).
+- Los eventos salen de la tabla `events` (la misma del canal SSE). Un hilo por
+  proceso lee los nuevos, los cruza con las suscripciones y encola una entrega
+  por suscripción en `subscription_deliveries`, en la misma transacción que
+  avanza el cursor guardado: con varios workers cada evento se procesa una vez.
+- Cada entrega se envía con el sender del canal de la suscripción (SENDERS):
+  'file' agrega una línea JSON a SUBSCRIPTIONS_OUTBOX y 'webhook' hace un POST
+  al destino (solo a direcciones públicas: el host se resuelve al crear la
+  suscripción, cada conexión comprueba la dirección a la que realmente se
+  conectó, y no se siguen redirecciones).
+  Se pueden agregar canales con register_sender. Las que fallan se
+  reintentan con espera exponencial hasta SUBSCRIPTIONS_MAX_ATTEMPTS veces.
+- Una alerta del SMN con área afecta a un círculo si el centro cae dentro del
+  área o el borde del área pasa a menos de un radio; a un polígono, si algún
+  vértice de uno cae dentro del otro. Las alertas sin coordenadas no se cruzan.
+
+Las suscripciones no se modifican: para cambiar la zona se borra y se crea otra.
+"""
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import secrets
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+
+import db
+import http_client
+import metrics
+import smn_alerts
+from smn_alerts import EARTH_RADIUS_KM, points_in_polygon
+
+log = logging.getLogger(__name__)
+
+SUBSCRIPTIONS_MAX_RADIUS_KM = float(os.getenv('SUBSCRIPTIONS_MAX_RADIUS_KM', '50'))   # Radio máximo de una suscripción
+SUBSCRIPTIONS_MAX_VERTICES = int(os.getenv('SUBSCRIPTIONS_MAX_VERTICES', '500'))      # Vértices máximos de un polígono
+SUBSCRIPTIONS_GRID_DEG = float(os.getenv('SUBSCRIPTIONS_GRID_DEG', '0.02'))          # Lado de las celdas del índice (0.02° ≈ 2 km)
+SUBSCRIPTIONS_MATCH_CHUNK = int(os.getenv('SUBSCRIPTIONS_MATCH_CHUNK', '256'))        # Reportes de una carga masiva cruzados juntos
+SUBSCRIPTIONS_DEFAULT_CHANNEL = os.getenv('SUBSCRIPTIONS_DEFAULT_CHANNEL', 'file')
+SUBSCRIPTIONS_OUTBOX = os.getenv('SUBSCRIPTIONS_OUTBOX', 'notifications.jsonl')       # Archivo del canal 'file'
+SUBSCRIPTIONS_WEBHOOK_TIMEOUT = float(os.getenv('SUBSCRIPTIONS_WEBHOOK_TIMEOUT', '5'))
+SUBSCRIPTIONS_WEBHOOK_TOKEN = os.getenv('SUBSCRIPTIONS_WEBHOOK_TOKEN')                # Si está definido, crear un webhook exige "Authorization: Bearer <token>"
+SUBSCRIPTIONS_POLL_INTERVAL = float(os.getenv('SUBSCRIPTIONS_POLL_INTERVAL', '1'))    # Segundos entre lecturas de eventos y entregas
+SUBSCRIPTIONS_EVENT_BATCH = int(os.getenv('SUBSCRIPTIONS_EVENT_BATCH', '100'))        # Eventos cruzados por transacción
+SUBSCRIPTIONS_SEND_BATCH = int(os.getenv('SUBSCRIPTIONS_SEND_BATCH', '200'))          # Entregas tomadas por pasada
+SUBSCRIPTIONS_SEND_WORKERS = int(os.getenv('SUBSCRIPTIONS_SEND_WORKERS', '8'))        # Envíos en paralelo por proceso
+SUBSCRIPTIONS_MAX_ATTEMPTS = int(os.getenv('SUBSCRIPTIONS_MAX_ATTEMPTS', '6'))
+SUBSCRIPTIONS_RETRY_BASE = float(os.getenv('SUBSCRIPTIONS_RETRY_BASE', '30'))         # Espera antes del primer reintento (se duplica)
+SUBSCRIPTIONS_LEASE = float(os.getenv('SUBSCRIPTIONS_LEASE', '120'))                  # Segundos reservada una entrega tomada por un worker
+SUBSCRIPTIONS_RETENTION_DAYS = float(os.getenv('SUBSCRIPTIONS_RETENTION_DAYS', '7'))  # Entregas terminadas que se conservan
+
+EVENT_TYPES = ('flood_report', 'smn_alert')
+EVENT_BITS = {'flood_report': 1, 'smn_alert': 2}  # Tipos de evento de cada suscripción, como máscara de bits en el índice
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DELIVERIES = metrics.Counter('subscription_deliveries_total', 'Entregas de avisos por canal y resultado.', ('channel', 'status'))
+MATCH_SECONDS = metrics.Histogram('subscription_match_seconds', 'Tiempo de cruce de un evento con las suscripciones.',
+                                  ('type',), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+
+
+class InvalidSubscription(ValueError):
+    """La suscripción pedida no es válida; el mensaje se devuelve al cliente."""
+
+
+# --- Canales de entrega ---
+
+class FileSender:
+    """Canal 'file': agrega cada aviso como una línea JSON a un archivo (pruebas, o para que lo despache otro proceso)."""
+
+    def __init__(self, path=SUBSCRIPTIONS_OUTBOX):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, subscription, message):
+        line = json.dumps(message, ensure_ascii=False, default=str) + '\n'
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+class WebhookSender:
+    """
+    Canal 'webhook': POST del aviso en JSON al `target` de la suscripción. Una
+    respuesta que no sea 2xx (también una redirección) es un fallo.
+    """
+
+    def __init__(self):
+        # La dirección se comprueba en el socket ya conectado: un DNS que cambie después de validar no sirve
+        self.session = http_client.public_only_session()
+
+    def send(self, subscription, message):
+        # Sin reintentos inmediatos: la cola ya reintenta, y X-Delivery-Id permite descartar duplicados.
+        # Un solo breaker para todos los webhooks: cada host elegido por un usuario no crea su propia fuente
+        response = http_client.post(subscription['target'], source='webhook', session=self.session,
+                                    json=message, timeout=SUBSCRIPTIONS_WEBHOOK_TIMEOUT, retries=0,
+                                    allow_redirects=False, headers={'X-Delivery-Id': str(message['delivery_id'])})
+        response.raise_for_status()
+        if response.status_code >= 300:
+            raise requests.exceptions.HTTPError(f"{response.status_code} (redirección no seguida)", response=response)
+
+    @staticmethod
+    def validate(target):
+        """Exige una URL http(s) cuyo host resuelva solo a direcciones públicas (is_global)."""
+        if not isinstance(target, str):
+            raise InvalidSubscription("el canal 'webhook' requiere 'target' con una URL")
+        parts = urlsplit(target)
+        try:
+            port = parts.port or (443 if parts.scheme == 'https' else 80)
+        except ValueError:
+            port = None
+        if parts.scheme not in ('http', 'https') or not parts.hostname or port is None:
+            raise InvalidSubscription("'target' debe ser una URL http o https")
+        # getaddrinfo interpreta también las formas que ip_address no acepta (0x7f000001, 2130706433, 127.1)
+        try:
+            addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+        except (socket.gaierror, UnicodeError):
+            raise InvalidSubscription(f"no se pudo resolver el host de 'target': {parts.hostname}")
+        if not all(http_client.is_public_address(value) for value in addresses):
+            raise InvalidSubscription("'target' no puede apuntar a una dirección local o privada")
+
+
+def webhook_authorized(header):
+    """True si no hay SUBSCRIPTIONS_WEBHOOK_TOKEN configurado o si el header Authorization coincide."""
+    if not SUBSCRIPTIONS_WEBHOOK_TOKEN:
+        return True
+    return hmac.compare_digest(header or '', f'Bearer {SUBSCRIPTIONS_WEBHOOK_TOKEN}')
+
+
+SENDERS = {'file': FileSender(), 'webhook': WebhookSender()}
+
+
+def register_sender(channel, sender):
+    """
+    Agrega (o reemplaza) el sender de un canal. `sender.send(subscription, message)`
+    debe lanzar una excepción si no pudo entregar; si además tiene
+    `validate(target)`, se usa para validar el destino al crear la suscripción.
+    """
+    SENDERS[channel] = sender
+
+
+# --- Tablas ---
+
+def create_tables(cursor):
+    """
+    Crea las suscripciones (con su bbox en columnas), la copia de los eventos con
+    entregas pendientes, la cola de entregas, el estado del cruce y los triggers
+    que versionan la tabla en table_versions (idempotente). El índice espacial no es una tabla: es la grilla
+    en memoria de SubscriptionIndex.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            lat REAL NOT NULL, -- Centro del círculo o centroide del polígono
+            lng REAL NOT NULL,
+            radius_km REAL, -- NULL en los polígonos
+            polygon TEXT, -- JSON [[lat, lng], ...]
+            min_lat REAL NOT NULL,
+            max_lat REAL NOT NULL,
+            min_lng REAL NOT NULL,
+            max_lng REAL NOT NULL,
+            event_types TEXT NOT NULL, -- Separados por coma
+            channel TEXT NOT NULL,
+            target TEXT,
+            token_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    # Copia del evento mientras tenga entregas: la tabla events se poda sin esperar a la cola
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscription_events (
+            event_id INTEGER PRIMARY KEY,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL, -- JSON
+            created_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscription_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscription_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL,
+            report_ids TEXT, -- JSON: reportes de una carga masiva que caen en la zona
+            status TEXT NOT NULL DEFAULT 'pending', -- pending, sent, failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL,
+            UNIQUE (subscription_id, event_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_subscription_deliveries_due ON subscription_deliveries (status, next_attempt_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscription_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+
+    # Versión de la tabla (table_versions, ver flood_reports.create_change_tracking): el índice
+    # en memoria de cada proceso se rearma solo cuando cambia
+    cursor.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('subscriptions', 0)")
+    for event in ('INSERT', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS subscriptions_version_{event.lower()} AFTER {event} ON subscriptions BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = 'subscriptions';
+            END
+        ''')
+
+
+# --- Alta, consulta y baja ---
+
+def _coordinate(value, name, limit):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise InvalidSubscription(f"'{name}' debe ser un número")
+    try:
+        value = float(value)
+    except ValueError:
+        raise InvalidSubscription(f"'{name}' debe ser un número") from None
+    if not -limit <= value <= limit:
+        raise InvalidSubscription(f"'{name}' fuera de rango")
+    return value
+
+
+def _geometry(spec):
+    """(lat, lng, radius_km, polígono o None, bbox) a partir del pedido."""
+    if spec.get('polygon') is not None:
+        polygon = spec['polygon']
+        if not isinstance(polygon, list) or not 3 <= len(polygon) <= SUBSCRIPTIONS_MAX_VERTICES:
+            raise InvalidSubscription(f"'polygon' debe ser una lista de 3 a {SUBSCRIPTIONS_MAX_VERTICES} puntos [lat, lng]")
+        if not all(isinstance(p, list) and len(p) == 2 for p in polygon):
+            raise InvalidSubscription("cada punto de 'polygon' debe ser [lat, lng]")
+        vertices = np.array([(_coordinate(lat, 'polygon', 90), _coordinate(lng, 'polygon', 180)) for lat, lng in polygon])
+        span_km = (vertices.max(axis=0) - vertices.min(axis=0)) * [KM_PER_DEGREE, KM_PER_DEGREE * math.cos(math.radians(vertices[0, 0]))]
+        if span_km.max() > 2 * SUBSCRIPTIONS_MAX_RADIUS_KM:
+            raise InvalidSubscription(f"el polígono no puede medir más de {2 * SUBSCRIPTIONS_MAX_RADIUS_KM:g} km de lado")
+        lat, lng = vertices.mean(axis=0)
+        bbox = (vertices[:, 0].min(), vertices[:, 0].max(), vertices[:, 1].min(), vertices[:, 1].max())
+        return float(lat), float(lng), None, vertices.tolist(), tuple(float(v) for v in bbox)
+
+    lat = _coordinate(spec.get('lat'), 'lat', 90)
+    lng = _coordinate(spec.get('lng'), 'lng', 180)
+    radius_km = _coordinate(spec.get('radius_km', 1), 'radius_km', SUBSCRIPTIONS_MAX_RADIUS_KM)
+    if radius_km <= 0:
+        raise InvalidSubscription("'radius_km' debe ser mayor que cero")
+    # Extensión exacta del círculo en longitud (más ancha que en el centro lejos del ecuador)
+    dlat = radius_km / KM_PER_DEGREE
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / max(math.cos(math.radians(lat)), 1e-9)
+    dlng = math.degrees(math.asin(ratio)) if ratio < 1 else 180.0
+    return lat, lng, radius_km, None, (lat - dlat, lat + dlat, lng - dlng, lng + dlng)
+
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def to_dict(row):
+    data = {"id": row['id'], "name": row['name']}
+    if row['polygon']:
+        data["polygon"] = json.loads(row['polygon'])
+    else:
+        data.update(lat=row['lat'], lng=row['lng'], radius_km=row['radius_km'])
+    data.update(events=row['event_types'].split(','), channel=row['channel'], target=row['target'],
+                created_at=row['created_at'])
+    return data
+
+
+def create(conn, spec):
+    """
+    Valida y guarda una suscripción. Devuelve (suscripción, token); el token se
+    muestra una sola vez y se pide para consultarla o borrarla.
+    """
+    if not isinstance(spec, dict):
+        raise InvalidSubscription("se espera un objeto JSON")
+    name = spec.get('name')
+    if not isinstance(name, str) or not name.strip() or len(name) > 200:
+        raise InvalidSubscription("'name' es obligatorio (hasta 200 caracteres)")
+    event_types = spec.get('events', list(EVENT_TYPES))
+    if (not isinstance(event_types, list) or not event_types
+            or not all(isinstance(t, str) and t in EVENT_TYPES for t in event_types)):
+        raise InvalidSubscription("'events' debe ser una lista con " + ' y/o '.join(EVENT_TYPES))
+    channel = spec.get('channel', SUBSCRIPTIONS_DEFAULT_CHANNEL)
+    if channel not in SENDERS:
+        raise InvalidSubscription("'channel' debe ser uno de: " + ', '.join(sorted(SENDERS)))
+    target = spec.get('target')
+    validate = getattr(SENDERS[channel], 'validate', None)
+    if validate:
+        validate(target)
+    lat, lng, radius_km, polygon, bbox = _geometry(spec)
+
+    token = secrets.token_urlsafe(24)
+    with metrics.sqlite_query('subscriptions.insert'), conn:
+        subscription_id = conn.execute('''
+            INSERT INTO subscriptions (name, lat, lng, radius_km, polygon, min_lat, max_lat, min_lng, max_lng,
+                                       event_types, channel, target, token_hash, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (name.strip(), lat, lng, radius_km, json.dumps(polygon) if polygon else None, *bbox,
+              ','.join(dict.fromkeys(event_types)), channel, target, _hash_token(token),
+              datetime.datetime.now().isoformat())).lastrowid
+    return get(conn, subscription_id, token), token
+
+
+def _authorized_row(conn, subscription_id, token):
+    row = conn.execute('SELECT * FROM subscriptions WHERE id = ?', (subscription_id,)).fetchone()
+    if row is None or not token or not hmac.compare_digest(row['token_hash'], _hash_token(token)):
+        return None
+    return row
+
+
+def get(conn, subscription_id, token):
+    """La suscripción con el estado de sus entregas, o None si no existe o el token no corresponde."""
+    row = _authorized_row(conn, subscription_id, token)
+    if row is None:
+        return None
+    data = to_dict(row)
+    counts = conn.execute('''
+        SELECT status, COUNT(*) FROM subscription_deliveries WHERE subscription_id = ? GROUP BY status
+    ''', (subscription_id,)).fetchall()
+    data["deliveries"] = {status: count for status, count in counts}
+    return data
+
+
+def delete(conn, subscription_id, token):
+    """Borra la suscripción y sus entregas pendientes. False si no existe o el token no corresponde."""
+    with conn:
+        if _authorized_row(conn, subscription_id, token) is None:
+            return False
+        conn.execute('DELETE FROM subscriptions WHERE id = ?', (subscription_id,))
+        conn.execute('DELETE FROM subscription_deliveries WHERE subscription_id = ?', (subscription_id,))
+    return True
+
+
+def stats(conn):
+    """Cantidad de suscripciones, entregas por estado y eventos que faltan cruzar."""
+    deliveries = conn.execute('SELECT status, COUNT(*) FROM subscription_deliveries GROUP BY status').fetchall()
+    cursor = conn.execute("SELECT value FROM subscription_state WHERE name = 'last_event_id'").fetchone()
+    max_event = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+    return {
+        "subscriptions": conn.execute('SELECT COUNT(*) FROM subscriptions').fetchone()[0],
+        "deliveries": {status: count for status, count in deliveries},
+        "events_behind": max_event - cursor[0] if cursor else None,
+        "channels": sorted(SENDERS),
+    }
+
+
+# --- Cruce de eventos con suscripciones ---
+
+_GRID_KEY_STRIDE = 1 << 32  # clave de celda = fila * _GRID_KEY_STRIDE + columna
+
+
+def _ranges(starts, counts):
+    """Concatena arange(start, start + count) de cada par, sin bucle de Python."""
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+
+def _distance_km(lat1, lng1, lat2, lng2):
+    """Haversine elemento a elemento entre arrays del mismo largo (grados)."""
+    lat1, lng1, lat2, lng2 = (np.radians(a) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _distance_to_boundary_km(lat, lng, polygon):
+    """Distancia de cada punto al borde del polígono, en km (proyección local: alcanza para radios de decenas de km)."""
+    lat = np.asarray(lat, dtype=float)[:, None]
+    lng = np.asarray(lng, dtype=float)[:, None]
+    scale = np.cos(np.radians(lat)) * KM_PER_DEGREE
+    x1, y1 = (polygon[:, 1] - lng) * scale, (polygon[:, 0] - lat) * KM_PER_DEGREE
+    x2, y2 = np.roll(x1, -1, axis=1), np.roll(y1, -1, axis=1)
+    dx, dy = x2 - x1, y2 - y1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(np.nan_to_num(-(x1 * dx + y1 * dy) / (dx * dx + dy * dy)), 0, 1)
+    return np.hypot(x1 + t * dx, y1 + t * dy).min(axis=1)
+
+
+class SubscriptionIndex:
+    """
+    Las suscripciones de la base en arrays de NumPy, más una grilla de celdas de
+    SUBSCRIPTIONS_GRID_DEG grados: cada celda lista las suscripciones cuyo
+    rectángulo la toca (claves de celda ordenadas y, por celda, un tramo de
+    `cell_members`). Un punto solo se compara con las de su celda.
+    """
+
+    def __init__(self, rows, version=None, grid_deg=SUBSCRIPTIONS_GRID_DEG):
+        self.version = version
+        self.grid_deg = grid_deg
+        columns = list(zip(*rows)) or [()] * 10
+        ids, lat, lng, radius, polygons, min_lat, max_lat, min_lng, max_lng, event_types = columns
+        self.ids = np.array(ids, dtype=np.int64)
+        self.lat, self.lng, self.radius = (np.array(c, dtype=float) for c in (lat, lng, radius))
+        self.min_lat, self.max_lat, self.min_lng, self.max_lng = (
+            np.array(c, dtype=float) for c in (min_lat, max_lat, min_lng, max_lng))
+        masks = {types: sum(EVENT_BITS[t] for t in types.split(',')) for types in set(event_types)}
+        self.events = np.array([masks[types] for types in event_types], dtype=np.int8)
+
+        # Polígonos: vértices de todos en arrays planos; el polígono k ocupa [vertex_start[k], +vertex_count[k])
+        self.polygon_of = np.full(len(self.ids), -1, dtype=np.int64)
+        vertices = []
+        for i, polygon in enumerate(polygons):
+            if polygon:
+                self.polygon_of[i] = len(vertices)
+                vertices.append(np.asarray(json.loads(polygon), dtype=float))
+        self.vertex_count = np.array([len(v) for v in vertices], dtype=np.int64)
+        self.vertex_start = np.cumsum(self.vertex_count) - self.vertex_count
+        flat = np.concatenate(vertices) if vertices else np.zeros((0, 2))
+        self.vertex_lat, self.vertex_lng = flat[:, 0], flat[:, 1]
+        # Siguiente vértice de cada uno (cierra cada polígono por separado): las aristas para el ray casting
+        following = np.arange(len(flat)) + 1
+        following[self.vertex_start + self.vertex_count - 1] = self.vertex_start
+        self.next_lat, self.next_lng = self.vertex_lat[following], self.vertex_lng[following]
+
+        # Grilla: una entrada por (celda, suscripción) para cada celda que toca el rectángulo
+        row0, row1 = np.floor(self.min_lat / grid_deg).astype(np.int64), np.floor(self.max_lat / grid_deg).astype(np.int64)
+        col0, col1 = np.floor(self.min_lng / grid_deg).astype(np.int64), np.floor(self.max_lng / grid_deg).astype(np.int64)
+        width = col1 - col0 + 1
+        counts = (row1 - row0 + 1) * width
+        owner = np.repeat(np.arange(len(self.ids)), counts)
+        offset = _ranges(np.zeros(len(self.ids), dtype=np.int64), counts)
+        keys = (row0[owner] + offset // width[owner]) * _GRID_KEY_STRIDE + col0[owner] + offset % width[owner]
+        order = np.argsort(keys, kind='stable')
+        self.cell_members = owner[order].astype(np.int32)
+        self.cell_keys, self.cell_starts = np.unique(keys[order], return_index=True)
+        self.cell_ends = np.append(self.cell_starts[1:], len(order))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _inside_polygons(self, lat, lng, polygons):
+        """Ray casting de pares (punto i, polígono polygons[i]) con las aristas de todos a la vez."""
+        counts = self.vertex_count[polygons]
+        edges = _ranges(self.vertex_start[polygons], counts)
+        pair = np.repeat(np.arange(len(polygons)), counts)
+        y, x = lat[pair], lng[pair]
+        lat1, lng1, lat2, lng2 = self.vertex_lat[edges], self.vertex_lng[edges], self.next_lat[edges], self.next_lng[edges]
+        crosses = (lat1 > y) != (lat2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            lng_at_lat = lng1 + (y - lat1) * (lng2 - lng1) / (lat2 - lat1)
+        hits = np.bincount(pair, weights=crosses & (x < lng_at_lat), minlength=len(polygons))
+        return hits.astype(np.int64) % 2 == 1
+
+    def match_points(self, lat, lng, event_type):
+        """
+        Pares (índice de punto, índice de suscripción) de los puntos que caen dentro
+        de suscripciones a `event_type`. Los índices de suscripción son posiciones en `ids`.
+        """
+        lat, lng = np.asarray(lat, dtype=float), np.asarray(lng, dtype=float)
+        keys = np.floor(lat / self.grid_deg).astype(np.int64) * _GRID_KEY_STRIDE + np.floor(lng / self.grid_deg).astype(np.int64)
+        cell = np.minimum(np.searchsorted(self.cell_keys, keys), max(len(self.cell_keys) - 1, 0))
+        found = np.flatnonzero(self.cell_keys[cell] == keys) if len(self.cell_keys) else np.zeros(0, dtype=np.int64)
+        starts = self.cell_starts[cell[found]]
+        counts = self.cell_ends[cell[found]] - starts
+        point = np.repeat(found, counts)
+        sub = self.cell_members[_ranges(starts, counts)]
+
+        # La celda es más grande que cada rectángulo: primero el rectángulo, después la geometría exacta
+        y, x = lat[point], lng[point]
+        keep = ((self.events[sub] & EVENT_BITS[event_type]) > 0) & (self.min_lat[sub] <= y) & (y <= self.max_lat[sub]) \
+            & (self.min_lng[sub] <= x) & (x <= self.max_lng[sub])
+        point, sub, y, x = point[keep], sub[keep], y[keep], x[keep]
+        inside = np.zeros(len(sub), dtype=bool)
+        circle = self.radius[sub] >= 0
+        inside[circle] = _distance_km(y[circle], x[circle], self.lat[sub[circle]], self.lng[sub[circle]]) <= self.radius[sub[circle]]
+        if not circle.all():
+            polygon = ~circle
+            inside[polygon] = self._inside_polygons(y[polygon], x[polygon], self.polygon_of[sub[polygon]])
+        return point[inside], sub[inside]
+
+    def match_area(self, area, event_type):
+        """
+        Índices de las suscripciones a `event_type` que se superponen con el polígono
+        `area` (array de [lat, lng]).
+        """
+        # Un área grande toca casi todas las celdas: el rectángulo se compara con todas las suscripciones a la vez
+        candidates = np.flatnonzero(((self.events & EVENT_BITS[event_type]) > 0)
+                                    & (self.max_lat >= area[:, 0].min()) & (self.min_lat <= area[:, 0].max())
+                                    & (self.max_lng >= area[:, 1].min()) & (self.min_lng <= area[:, 1].max()))
+        circles = candidates[self.radius[candidates] >= 0]
+        polygons = candidates[self.radius[candidates] < 0]
+
+        # Círculo: el centro dentro del área o el borde del área a menos de un radio
+        lat, lng = self.lat[circles], self.lng[circles]
+        circle_hit = points_in_polygon(lat, lng, area) | (_distance_to_boundary_km(lat, lng, area) <= self.radius[circles])
+
+        # Polígono: algún vértice dentro del área o algún vértice del área dentro del polígono
+        k = self.polygon_of[polygons]
+        vertices = _ranges(self.vertex_start[k], self.vertex_count[k])
+        owner = np.repeat(np.arange(len(polygons)), self.vertex_count[k])
+        inside = points_in_polygon(self.vertex_lat[vertices], self.vertex_lng[vertices], area) if len(vertices) else np.zeros(0, dtype=bool)
+        polygon_hit = np.bincount(owner, weights=inside, minlength=len(polygons)) > 0
+        rest = np.flatnonzero(~polygon_hit)
+        if rest.size:
+            pairs = self._inside_polygons(np.repeat(area[:, 0], rest.size), np.repeat(area[:, 1], rest.size),
+                                          np.tile(k[rest], len(area)))
+            polygon_hit[rest] = pairs.reshape(len(area), rest.size).any(axis=0)
+        return np.concatenate([circles[circle_hit], polygons[polygon_hit]])
+
+
+_INDEX_COLUMNS = '''
+    SELECT id, lat, lng, COALESCE(radius_km, -1), polygon, min_lat, max_lat, min_lng, max_lng, event_types
+    FROM subscriptions
+'''
+
+_index = None
+
+
+@metrics.sqlite_query('subscriptions.load_index')
+def load_index(conn):
+    """Índice de las suscripciones actuales; se rearma solo si cambió la versión de la tabla."""
+    global _index
+    version = conn.execute("SELECT version FROM table_versions WHERE name = 'subscriptions'").fetchone()[0]
+    if _index is None or _index.version != version:
+        _index = SubscriptionIndex(conn.execute(_INDEX_COLUMNS).fetchall(), version)
+    return _index
+
+
+def match_event(conn, index, event_type, data):
+    """
+    {id de suscripción: ids de reportes o None} para un evento de la tabla events.
+    Una carga masiva se cruza por bloques de reportes y cada suscripción recibe un
+    solo aviso con los reportes que le corresponden.
+    """
+    started = time.perf_counter()
+    if event_type == 'flood_report':
+        _, subs = index.match_points([float(data['lat'])], [float(data['lng'])], 'flood_report')
+        matches = dict.fromkeys(index.ids[subs].tolist())
+    elif event_type == 'flood_reports_bulk':
+        reports = np.array(conn.execute('SELECT id, lat, lng FROM flood_reports WHERE id BETWEEN ? AND ?',
+                                        (data['first_id'], data['last_id'])).fetchall(), dtype=float).reshape(-1, 3)
+        pairs = []
+        for chunk in range(0, len(reports), SUBSCRIPTIONS_MATCH_CHUNK):
+            block = reports[chunk:chunk + SUBSCRIPTIONS_MATCH_CHUNK]
+            points, subs = index.match_points(block[:, 1], block[:, 2], 'flood_report')
+            pairs.append((index.ids[subs], block[points, 0].astype(np.int64)))
+        sub_ids = np.concatenate([p[0] for p in pairs]) if pairs else np.zeros(0, dtype=np.int64)
+        report_ids = np.concatenate([p[1] for p in pairs]) if pairs else np.zeros(0, dtype=np.int64)
+        order = np.argsort(sub_ids, kind='stable')
+        sub_ids = sub_ids[order]
+        bounds = [0, *(np.flatnonzero(np.diff(sub_ids)) + 1).tolist(), len(sub_ids)] if len(sub_ids) else [0]
+        report_ids = report_ids[order].tolist()
+        matches = {int(sub_ids[start]): report_ids[start:end] for start, end in zip(bounds, bounds[1:])}
+    elif event_type == 'smn_alert' and data.get('polygon'):
+        subs = index.match_area(np.asarray(data['polygon'], dtype=float), 'smn_alert')
+        matches = dict.fromkeys(index.ids[subs].tolist())
+    elif event_type == 'smn_alert' and data.get('latitude') is not None:
+        _, subs = index.match_points([float(data['latitude'])], [float(data['longitude'])], 'smn_alert')
+        matches = dict.fromkeys(index.ids[subs].tolist())
+    else:
+        return {}
+    MATCH_SECONDS.observe(time.perf_counter() - started, event_type)
+    return matches
+
+
+def _event_cursor(conn):
+    row = conn.execute("SELECT value FROM subscription_state WHERE name = 'last_event_id'").fetchone()
+    return row[0] if row else None
+
+
+@metrics.sqlite_query('subscriptions.match')
+def process_events(conn, batch=SUBSCRIPTIONS_EVENT_BATCH):
+    """
+    Cruza los eventos posteriores al cursor con las suscripciones, encola las
+    entregas y avanza el cursor, todo en una transacción (si dos workers corren a
+    la vez, el segundo espera y sigue desde donde quedó el primero). La primera
+    vez el cursor arranca en el último evento: no se avisa lo ya publicado.
+    Devuelve (eventos procesados, entregas encoladas).
+    """
+    now = time.time()
+    queued = 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        last_id = _event_cursor(conn)
+        if last_id is None:
+            rows = []
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        else:
+            rows = conn.execute('SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?',
+                                (last_id, batch)).fetchall()
+        index = load_index(conn) if rows else None
+        for event_id, event_type, data in rows:
+            last_id = event_id
+            try:
+                matches = match_event(conn, index, event_type, json.loads(data))
+            except (KeyError, TypeError, ValueError) as e:  # Un evento mal formado no detiene la cola
+                log.warning("Evento que no se puede cruzar con las suscripciones",
+                            extra={'event_id': event_id, 'error': str(e)})
+                continue
+            if not matches:
+                continue
+            conn.execute('INSERT OR IGNORE INTO subscription_events (event_id, type, data, created_at) VALUES (?, ?, ?, ?)',
+                         (event_id, event_type, data, now))
+            conn.executemany('''
+                INSERT OR IGNORE INTO subscription_deliveries (subscription_id, event_id, report_ids, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(subscription_id, event_id, json.dumps(report_ids) if report_ids else None, now, now)
+                  for subscription_id, report_ids in matches.items()])
+            queued += len(matches)
+        conn.execute("INSERT OR REPLACE INTO subscription_state (name, value) VALUES ('last_event_id', ?)", (last_id,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return len(rows), queued
+
+
+# --- Envío ---
+
+def _claim(conn, now, limit):
+    """Toma entregas vencidas y las reserva por SUBSCRIPTIONS_LEASE segundos (si el worker muere, vuelven a la cola)."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute('''
+            SELECT d.id, d.event_id, d.report_ids, d.attempts, s.id AS subscription_id, s.name, s.channel, s.target,
+                   e.type, e.data
+            FROM subscription_deliveries d
+            JOIN subscriptions s ON s.id = d.subscription_id
+            JOIN subscription_events e ON e.event_id = d.event_id
+            WHERE d.status = 'pending' AND d.next_attempt_at <= ?
+            ORDER BY d.next_attempt_at
+            LIMIT ?
+        ''', (now, limit)).fetchall()
+        conn.executemany('UPDATE subscription_deliveries SET next_attempt_at = ? WHERE id = ?',
+                         [(now + SUBSCRIPTIONS_LEASE, row['id']) for row in rows])
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return rows
+
+
+def _send(row):
+    """Envía una entrega. Devuelve None o el error."""
+    message = {
+        "delivery_id": row['id'],
+        "subscription": {"id": row['subscription_id'], "name": row['name']},
+        "event": {"id": row['event_id'], "type": row['type'], "data": json.loads(row['data'])},
+    }
+    if row['report_ids']:
+        message["report_ids"] = json.loads(row['report_ids'])
+    sender = SENDERS.get(row['channel'])
+    try:
+        if sender is None:
+            raise LookupError(f"canal sin sender en este proceso: {row['channel']}")
+        sender.send({"id": row['subscription_id'], "name": row['name'], "target": row['target']}, message)
+    except Exception as e:
+        return e
+    return None
+
+
+_executor = ThreadPoolExecutor(max_workers=SUBSCRIPTIONS_SEND_WORKERS, thread_name_prefix='subscription-send')
+
+
+def dispatch(conn, limit=SUBSCRIPTIONS_SEND_BATCH):
+    """Envía las entregas vencidas y registra el resultado. Devuelve cuántas se tomaron."""
+    now = time.time()
+    due = conn.execute("SELECT 1 FROM subscription_deliveries WHERE status = 'pending' AND next_attempt_at <= ? LIMIT 1",
+                       (now,)).fetchone()
+    if due is None:
+        return 0
+    rows = _claim(conn, now, limit)
+    results = list(_executor.map(_send, rows))
+    now = time.time()
+    updates = []
+    for row, error in zip(rows, results):
+        attempts = row['attempts'] + 1
+        if error is None:
+            status, next_attempt_at, last_error = 'sent', now, None
+        else:
+            last_error = f"{type(error).__name__}: {error}"[:500]
+            status = 'failed' if attempts >= SUBSCRIPTIONS_MAX_ATTEMPTS else 'pending'
+            next_attempt_at = now + SUBSCRIPTIONS_RETRY_BASE * 2 ** (attempts - 1)
+            log.warning("No se pudo entregar un aviso",
+                        extra={'delivery_id': row['id'], 'channel': row['channel'], 'attempts': attempts, 'error': last_error})
+        DELIVERIES.inc(row['channel'], status)
+        updates.append((status, attempts, next_attempt_at, last_error, now if error is None else None, row['id']))
+    with metrics.sqlite_query('subscriptions.deliveries'), conn:
+        conn.executemany('''
+            UPDATE subscription_deliveries
+            SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, sent_at = ?
+            WHERE id = ?
+        ''', updates)
+    return len(rows)
+
+
+def prune(conn):
+    """Borra las entregas terminadas hace más de SUBSCRIPTIONS_RETENTION_DAYS y los eventos que ya no usa ninguna."""
+    cutoff = time.time() - SUBSCRIPTIONS_RETENTION_DAYS * 86400
+    with conn:
+        conn.execute("DELETE FROM subscription_deliveries WHERE status != 'pending' AND created_at < ?", (cutoff,))
+        conn.execute('''
+            DELETE FROM subscription_events
+            WHERE NOT EXISTS (SELECT 1 FROM subscription_deliveries d WHERE d.event_id = subscription_events.event_id)
+        ''')
+
+
+# --- Hilo de fondo ---
+
+def _run():
+    conn = db.connect()
+    passes = 0
+    while True:
+        processed = 0
+        try:
+            cursor = _event_cursor(conn)
+            max_event = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+            if cursor is None or max_event > cursor:
+                processed, queued = process_events(conn)
+                if queued:
+                    log.info("Avisos encolados", extra={'events': processed, 'deliveries': queued})
+            dispatch(conn)
+            passes += 1
+            if passes % 3600 == 0:
+                prune(conn)
+        except Exception as e:
+            log.warning("Error en el cruce o envío de avisos", extra={'error': str(e)})
+        if processed < SUBSCRIPTIONS_EVENT_BATCH:
+            time.sleep(SUBSCRIPTIONS_POLL_INTERVAL)
+
+
+_worker = None
+_start_lock = threading.Lock()
+
+
+def ensure_started():
+    """
+    Arranca (una sola vez por proceso) el hilo que cruza eventos y envía avisos,
+    y el vigía del SMN que publica las alertas nuevas.
+    """
+    global _worker
+    if _worker is not None:
+        return
+    with _start_lock:
+        if _worker is None:
+            smn_alerts.ensure_watching()
+            _worker = threading.Thread(target=_run, name='subscriptions', daemon=True)
+            _worker.start()
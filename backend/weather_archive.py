@@ -0,0 +1,240 @@
+"""
+Archivo histórico de observaciones del clima, guardado por columnas.
+
+Un hilo de fondo consulta OpenWeatherMap cada WEATHER_SAMPLE_INTERVAL segundos
+para cada estación (por defecto, las regiones configuradas del SMN) y guarda
+temperatura, humedad, presión, viento y lluvia de la última hora.
+
+- No hay una fila por lectura: cada (estación, métrica, día) es un bloque con
+  dos arreglos tipados en BLOBs, los segundos desde el inicio del bloque (int32)
+  y los valores (float32). Un año de datos cada 5 minutos son 365 filas de unos
+  2,3 KB por métrica, en vez de 105.000 filas con la fecha en texto.
+- Agregar una lectura reescribe solo el bloque del día (lectura, merge
+  ordenado y escritura en una transacción).
+- Las consultas por rango leen los bloques necesarios con np.frombuffer y
+  reducen en NumPy a min/max/promedio por intervalo (np.*.reduceat), así que
+  graficar un año entero cuesta unos pocos milisegundos.
+- Con varios workers, el turno de cada muestreo se reserva con db.claim_slot:
+  solo un proceso consulta la API por turno.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+import db
+import metrics
+import smn_alerts
+
+log = logging.getLogger(__name__)
+
+WEATHER_SAMPLE_INTERVAL = int(os.getenv('WEATHER_SAMPLE_INTERVAL', '300'))   # Segundos entre muestreos (0 lo desactiva)
+WEATHER_BLOCK_SECONDS = int(os.getenv('WEATHER_BLOCK_SECONDS', '86400'))     # Tramo de tiempo de cada bloque
+WEATHER_HISTORY_POINTS = int(os.getenv('WEATHER_HISTORY_POINTS', '500'))     # Intervalos por defecto de una consulta
+WEATHER_HISTORY_MAX_POINTS = int(os.getenv('WEATHER_HISTORY_MAX_POINTS', '5000'))
+
+# Métrica -> (unidad, cómo leerla de la respuesta de OpenWeatherMap)
+METRICS = {
+    'temperature': ('°C', lambda data: data['main'].get('temp')),
+    'humidity': ('%', lambda data: data['main'].get('humidity')),
+    'pressure': ('hPa', lambda data: data['main'].get('pressure')),
+    'wind_speed': ('m/s', lambda data: data.get('wind', {}).get('speed')),
+    'rain_1h': ('mm', lambda data: data.get('rain', {}).get('1h', 0.0)),  # OpenWeatherMap omite "rain" si no llueve
+}
+
+TIME_DTYPE = np.dtype('<i4')
+VALUE_DTYPE = np.dtype('<f4')
+
+SAMPLES = metrics.Counter('weather_archive_samples_total', 'Consultas del muestreo del clima por resultado.', ('result',))
+
+# Estaciones: las regiones del SMN (las configuradas en SMN_REGIONS_FILE o las de por defecto)
+STATIONS = {region.id: region for region in smn_alerts.REGIONS.values()}
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weather_blocks (
+            station TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            block_start INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            times BLOB NOT NULL,
+            "values" BLOB NOT NULL,
+            PRIMARY KEY (station, metric, block_start)
+        )
+    ''')
+
+
+# --- Escritura ---
+
+def append(conn, station, metric, times, values):
+    """
+    Agrega lecturas (epoch en segundos y valores) a los bloques de una estación y
+    métrica. Una lectura con la misma hora que una ya guardada se descarta.
+    Devuelve cuántas lecturas nuevas se guardaron. No hace commit.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=VALUE_DTYPE)
+    keep = ~np.isnan(values)
+    times, values = times[keep], values[keep]
+    if not len(times):
+        return 0
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+    starts = times - times % WEATHER_BLOCK_SECONDS
+    bounds = np.flatnonzero(np.diff(starts)) + 1
+    added = 0
+    for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(times)]):
+        block_start = int(starts[lo])
+        offsets, block_values = times[lo:hi] - block_start, values[lo:hi]
+        row = conn.execute('SELECT count, times, "values" FROM weather_blocks WHERE station = ? AND metric = ? AND block_start = ?',
+                           (station, metric, block_start)).fetchone()
+        previous = 0
+        if row is not None:
+            previous = row[0]
+            # Lo ya guardado va primero: np.unique se queda con la primera aparición de cada hora
+            offsets = np.concatenate([np.frombuffer(row[1], dtype=TIME_DTYPE), offsets])
+            block_values = np.concatenate([np.frombuffer(row[2], dtype=VALUE_DTYPE), block_values])
+        offsets, first = np.unique(offsets, return_index=True)
+        block_values = block_values[first]
+        if len(offsets) == previous:
+            continue
+        conn.execute('INSERT OR REPLACE INTO weather_blocks (station, metric, block_start, count, times, "values") '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     (station, metric, block_start, len(offsets),
+                      offsets.astype(TIME_DTYPE).tobytes(), block_values.astype(VALUE_DTYPE).tobytes()))
+        added += len(offsets) - previous
+    return added
+
+
+def record(conn, station, data):
+    """Guarda una respuesta de OpenWeatherMap (la hora es la de la observación, "dt")."""
+    observed_at = int(data.get('dt') or time.time())
+    with metrics.sqlite_query('weather_archive.record'), conn:
+        for metric, (_, extract) in METRICS.items():
+            value = extract(data)
+            if value is not None:
+                append(conn, station, metric, [observed_at], [value])
+
+
+# --- Muestreo en segundo plano ---
+
+def sample(conn, fetch):
+    """Consulta cada estación con fetch(lat, lon) y guarda las lecturas. Devuelve cuántas se guardaron."""
+    stored = 0
+    for station in STATIONS.values():
+        try:
+            record(conn, station.id, fetch(station.lat, station.lon))
+            SAMPLES.inc('ok')
+            stored += 1
+        except Exception as e:  # Una estación que falla no frena a las demás
+            SAMPLES.inc('error')
+            log.warning("No se pudo muestrear el clima", extra={'station': station.id, 'error': str(e)})
+    return stored
+
+
+def _run(fetch):
+    conn = db.connect()
+    while True:
+        try:
+            if db.claim_slot(conn, 'weather_archive', WEATHER_SAMPLE_INTERVAL):
+                stored = sample(conn, fetch)
+                log.info("Clima muestreado", extra={'stations': stored})
+        except Exception as e:
+            log.warning("Error en el muestreo del clima", extra={'error': str(e)})
+        # Se duerme hasta el comienzo del próximo turno
+        time.sleep(WEATHER_SAMPLE_INTERVAL - time.time() % WEATHER_SAMPLE_INTERVAL)
+
+
+_worker = None
+_start_lock = threading.Lock()
+
+
+def ensure_started(fetch):
+    """
+    Arranca (una sola vez por proceso) el hilo que muestrea las estaciones.
+    fetch(lat, lon) devuelve la respuesta de OpenWeatherMap. Sin OPENWEATHER_API_KEY
+    o con WEATHER_SAMPLE_INTERVAL=0 no se muestrea.
+    """
+    global _worker
+    if _worker is not None:
+        return
+    with _start_lock:
+        if _worker is not None:
+            return
+        if WEATHER_SAMPLE_INTERVAL <= 0 or not os.getenv('OPENWEATHER_API_KEY'):
+            _worker = False
+            log.info("Muestreo del clima desactivado (falta OPENWEATHER_API_KEY o WEATHER_SAMPLE_INTERVAL=0)")
+            return
+        _worker = threading.Thread(target=_run, args=(fetch,), name='weather-archive', daemon=True)
+        _worker.start()
+
+
+# --- Consultas ---
+
+def load(conn, station, metric, start, end):
+    """Lecturas en [start, end) como (epoch int64, valores float64), ordenadas por hora."""
+    with metrics.sqlite_query('weather_archive.load'):
+        rows = conn.execute('SELECT block_start, times, "values" FROM weather_blocks '
+                            'WHERE station = ? AND metric = ? AND block_start > ? AND block_start < ? ORDER BY block_start',
+                            (station, metric, int(start) - WEATHER_BLOCK_SECONDS, int(end))).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    times = np.concatenate([np.frombuffer(offsets, dtype=TIME_DTYPE).astype(np.int64) + block_start
+                            for block_start, offsets, _ in rows])
+    values = np.concatenate([np.frombuffer(blob, dtype=VALUE_DTYPE) for _, _, blob in rows]).astype(float)
+    lo, hi = np.searchsorted(times, [start, end])
+    return times[lo:hi], values[lo:hi]
+
+
+def downsample(times, values, start, bucket_seconds):
+    """
+    Min, max, promedio y cantidad por intervalo de bucket_seconds desde start.
+    Solo aparecen los intervalos con datos. Las horas tienen que venir ordenadas.
+    """
+    if not len(times):
+        return {"t": [], "min": [], "max": [], "mean": [], "count": []}
+    buckets = (times - start) // bucket_seconds
+    firsts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[firsts, len(values)])
+    return {
+        "t": (start + buckets[firsts] * bucket_seconds).tolist(),
+        "min": np.round(np.minimum.reduceat(values, firsts), 2).tolist(),
+        "max": np.round(np.maximum.reduceat(values, firsts), 2).tolist(),
+        "mean": np.round(np.add.reduceat(values, firsts) / counts, 2).tolist(),
+        "count": counts.tolist(),
+    }
+
+
+def history(conn, station, metric, start, end, points=WEATHER_HISTORY_POINTS, bucket_seconds=None):
+    """
+    Serie de una estación y métrica entre start y end (epoch), reducida a unos
+    `points` intervalos (o a intervalos de bucket_seconds si se indica).
+    Lanza ValueError con una métrica desconocida o un rango vacío.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric debe ser una de: {', '.join(METRICS)}")
+    if end <= start:
+        raise ValueError("until debe ser posterior a since")
+    if bucket_seconds is None:
+        bucket_seconds = -(-int(end - start) // max(1, points))  # División redondeando hacia arriba
+    bucket_seconds = max(1, int(bucket_seconds))
+    times, values = load(conn, station, metric, start, end)
+    series = downsample(times, values, int(start), bucket_seconds)
+    return {"station": station, "metric": metric, "unit": METRICS[metric][0],
+            "since": int(start), "until": int(end), "bucket_seconds": bucket_seconds, **series}
+
+
+def stations(conn):
+    """Estaciones configuradas con el rango de fechas y la cantidad de lecturas guardadas."""
+    stored = {row[0]: row[1:] for row in conn.execute(
+        "SELECT station, MIN(block_start), MAX(block_start), SUM(count) FROM weather_blocks "
+        "WHERE metric = 'temperature' GROUP BY station")}
+    result = []
+    for station in STATIONS.values():
+        first_block, last_block, count = stored.get(station.id, (None, None, 0))
+        result.append({"id": station.id, "name": station.name, "lat": station.lat, "lon": station.lon,
+                       "first_day": first_block, "last_day": last_block, "observations": count})
+    return result